@@ -0,0 +1,26 @@
+-- 001_cards_org_id.sql — Ключ организации в Cards для upsert вместо insert
+--
+-- Повторный парсинг той же карточки раньше добавлял новую строку. Теперь строки пишутся
+-- через upsert(on_conflict=org_id), для этого нужен столбец org_id с уникальным индексом.
+-- Перед созданием индекса у каждой организации остаётся только последняя строка.
+
+ALTER TABLE "Cards" ADD COLUMN IF NOT EXISTS org_id text;
+
+-- id организации из ссылки /maps/org/<slug>/<id>/ или параметра ?oid=<id>
+-- (как src/yandex_urls.extract_org_id)
+UPDATE "Cards"
+SET org_id = coalesce(
+    substring(url from '/org/(?:[^/?#]+/)?([0-9]{5,})'),
+    substring(url from '[?&]oid=([0-9]+)(?:[&#]|$)')
+)
+WHERE org_id IS NULL AND url IS NOT NULL;
+
+DELETE FROM "Cards" AS older
+USING "Cards" AS newer
+WHERE older.org_id = newer.org_id
+  AND older.id < newer.id;
+
+-- Без WHERE: ON CONFLICT (org_id) работает только с полным уникальным индексом.
+-- Строки без org_id (NULL) индекс не ограничивает, поэтому upsert_cards такие
+-- строки не пишет — дубликатов по ним не появится
+CREATE UNIQUE INDEX IF NOT EXISTS cards_org_id_key ON "Cards" (org_id);
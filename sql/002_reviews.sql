@@ -0,0 +1,46 @@
+-- 002_reviews.sql — Отдельная таблица отзывов вместо массива items в Cards.reviews
+--
+-- Каждый отзыв — строка с ключом (org_id, review_key); review_key — sha1 от автора и
+-- первых 80 символов текста, как src/review_delta.review_key. Повторный парсинг
+-- дописывает только новые отзывы (upsert с ignore_duplicates), а в Cards.reviews
+-- остаются рейтинг и количество. Выполнять после 001_cards_org_id.sql.
+
+CREATE EXTENSION IF NOT EXISTS pgcrypto;
+
+CREATE TABLE IF NOT EXISTS "Reviews" (
+    id bigserial PRIMARY KEY,
+    org_id text NOT NULL,
+    review_key text NOT NULL,
+    author text,
+    date text,
+    score smallint,
+    text text,
+    org_reply text,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    UNIQUE (org_id, review_key)
+);
+
+-- Последние отзывы организации (водяной знак парсера: ORDER BY id DESC LIMIT 50)
+CREATE INDEX IF NOT EXISTS reviews_org_id_id_idx ON "Reviews" (org_id, id DESC);
+
+-- Перенос уже сохранённых отзывов: от старых к новым, чтобы у свежих id был больше
+INSERT INTO "Reviews" (org_id, review_key, author, date, score, text, org_reply)
+SELECT c.org_id,
+       encode(digest(
+           lower(btrim(regexp_replace(coalesce(item->>'author', ''), '\s+', ' ', 'g'))) || '|' ||
+           left(lower(btrim(regexp_replace(coalesce(item->>'text', ''), '\s+', ' ', 'g'))), 80),
+           'sha1'), 'hex'),
+       item->>'author',
+       item->>'date',
+       CASE WHEN item->>'score' ~ '^[0-9]+(\.[0-9]+)?$' THEN floor((item->>'score')::numeric)::smallint ELSE 0 END,
+       item->>'text',
+       item->>'org_reply'
+FROM "Cards" AS c
+CROSS JOIN LATERAL jsonb_array_elements(c.reviews->'items') WITH ORDINALITY AS r(item, position)
+WHERE c.org_id IS NOT NULL
+  AND jsonb_typeof(c.reviews->'items') = 'array'
+  AND (coalesce(item->>'author', '') <> '' OR coalesce(item->>'text', '') <> '')
+ORDER BY c.id, r.position DESC
+ON CONFLICT (org_id, review_key) DO NOTHING;
+
+UPDATE "Cards" SET reviews = reviews - 'items' WHERE reviews ? 'items';
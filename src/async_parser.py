@@ -0,0 +1,415 @@
+"""
+async_parser.py — Асинхронный парсинг карточек Яндекс.Карт через playwright.async_api
+
+Один браузер обслуживает несколько карточек одновременно: parse_many открывает до
+concurrency страниц параллельно (семафор), пока остальные ждут. Результат каждой
+карточки — словарь того же вида, что возвращает parser.parse_yandex_card: селекторы,
+спецификации извлечения и разбор перехваченных ответов общие (card_specs), здесь
+только ожидаемые вызовы Playwright.
+"""
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+from src.browser_pool import CHROMIUM_ARGS, STEALTH_SCRIPT, prepare_browser_env, stealth_context_options
+from src.user_agents import profile_init_script
+from src.card_specs import (
+    OVERVIEW_SPEC, PRODUCTS_SPEC, REVIEWS_HEADER_SPEC, REVIEW_ITEMS_SPEC, NEWS_SPEC, PHOTOS_SPEC, PHOTOS_COUNT_SPEC,
+    FEATURES_SPEC, COMPETITORS_SPEC, PHONE_BUTTON_SELECTORS, TAB_SELECTORS, TAB_READY_SELECTORS, PAGE_READY_SELECTOR,
+    CAPTCHA_FORM_SELECTOR, CAPTCHA_TITLE, CONTACTS_SELECTOR, PHONE_READY_SELECTOR, REVIEWS_RANKING_SELECTOR,
+    REVIEWS_NEWEST_OPTION, EXPAND_REPLIES_JS, REPLY_BUTTON_SELECTOR, REPLY_SELECTOR, build_overview, build_products,
+    build_reviews_header, build_review_items, apply_captured_reviews, build_news, build_photos, build_features,
+    build_competitors, empty_reviews, empty_features, fill_card,
+)
+from src.dom_extract import aextract, amark_first_visible
+from src.network_capture import NetworkCapture, news_from_payloads, photos_from_payloads
+from src.request_blocking import RequestBlocker, blocking_enabled_by_default, merge_stats
+from src.yandex_urls import tab_url
+from src.proxy_pool import ProxyPool, parse_proxy
+from src.rate_limiter import classify_result
+from src.metrics import span, count
+from src.scroll_controller import ReviewsScrollController
+from src.review_delta import ReviewWatermark, apply_watermark
+from src.readiness import get_pacing, async_wait_for_ready, async_wait_for_dom_quiet, async_scroll_until_stable
+import asyncio
+
+PARALLEL_TABS = ('reviews', 'news', 'photos', 'features')
+
+
+async def launch_async_browser(p):
+    """Запускает Chromium, при неудаче — Firefox, затем WebKit. Возвращает (browser, browser_name)"""
+    try:
+        browser = await p.chromium.launch(
+            headless=True,
+            args=CHROMIUM_ARGS,
+            ignore_default_args=['--enable-automation'],
+            chromium_sandbox=False
+        )
+        print("Используем Chromium")
+        return browser, "Chromium"
+    except Exception as e:
+        print(f"Chromium недоступен: {e}")
+        try:
+            browser = await p.firefox.launch(
+                headless=True,
+                args=['--no-sandbox', '--disable-dev-shm-usage', '--disable-gpu'],
+                firefox_user_prefs={
+                    'dom.webdriver.enabled': False,
+                    'useAutomationExtension': False
+                }
+            )
+            print("Используем Firefox")
+            return browser, "Firefox"
+        except Exception as e2:
+            print(f"Firefox недоступен: {e2}")
+            try:
+                browser = await p.webkit.launch(headless=True, args=['--no-sandbox'])
+                print("Используем WebKit")
+                return browser, "WebKit"
+            except Exception as e3:
+                raise Exception(f"Все браузеры недоступны: Chromium={e}, Firefox={e2}, WebKit={e3}")
+
+
+async def async_parse_yandex_card(url: str, browser=None, browser_name: str = "", capture_network: bool = True, block_resources: bool | None = None, parallel_tabs: bool = False, max_reviews: int | None = None, watermark: ReviewWatermark | None = None, proxy: dict | str | None = None) -> dict:
+    """
+    Асинхронно парсит публичную страницу Яндекс.Карт.
+    Если browser не передан, запускается отдельный браузер только для этой карточки.
+    parallel_tabs открывает отзывы, новости, фото и особенности соседними страницами
+    и разбирает их одновременно с обзором: время карточки — максимум, а не сумма вкладок.
+    proxy — прокси контекста этой карточки.
+    """
+    print(f"Начинаем парсинг: {url}")
+
+    if not url or not url.startswith(('http://', 'https://')):
+        raise ValueError(f"Некорректная ссылка: {url}")
+
+    if browser is None:
+        if block_resources is None:
+            block_resources = blocking_enabled_by_default()
+        results = await parse_many([url], concurrency=1, return_exceptions=False, capture_network=capture_network, block_resources=block_resources, parallel_tabs=parallel_tabs, max_reviews=max_reviews, watermarks={url: watermark} if watermark else None, proxies=ProxyPool([proxy]) if proxy else None)
+        return results[0]
+
+    context_options, profile = stealth_context_options(browser)
+    if proxy:
+        context_options['proxy'] = parse_proxy(proxy) if isinstance(proxy, str) else proxy
+    context = await browser.new_context(**context_options)
+    await context.add_init_script(STEALTH_SCRIPT)
+    await context.add_init_script(profile_init_script(profile))
+    if block_resources is None:
+        block_resources = blocking_enabled_by_default()
+    blockers = []
+
+    async def new_page():
+        page = await context.new_page()
+        capture = NetworkCapture().attach(page) if capture_network else None
+        if block_resources:
+            blockers.append(await RequestBlocker().ainstall(page))
+        return page, capture
+
+    try:
+        with span('card', engine='async'):
+            data = await _parse_card_page(new_page, url, browser_name, parallel_tabs, {'max_reviews': max_reviews, 'watermark': watermark})
+        if blockers and not data.get('error'):
+            data['parse_stats'] = {'requests': merge_stats(blockers)}
+            count('blocked_requests', data['parse_stats']['requests']['blocked_total'])
+        count('cards', outcome='captcha' if data.get('error') == 'captcha_detected' else 'ok')
+        return data
+    except PlaywrightTimeoutError as e:
+        count('cards', outcome='timeout')
+        raise Exception(f"Тайм-аут при загрузке страницы: {e}")
+    except Exception as e:
+        count('cards', outcome='error')
+        raise Exception(f"Ошибка при парсинге: {e}")
+    finally:
+        try:
+            await context.close()
+        except Exception:
+            pass
+
+
+async def parse_many(urls, concurrency: int = 4, return_exceptions: bool = True, capture_network: bool = True, block_resources: bool = True, parallel_tabs: bool = False, max_reviews: int | None = None, watermarks: dict | None = None, proxies: ProxyPool | None = None) -> list:
+    """
+    Парсит список карточек в одном браузере, не более concurrency страниц одновременно.
+    Результаты возвращаются в порядке urls; при return_exceptions=True ошибка карточки
+    превращается в {"error": ..., "url": ...} и не прерывает остальные.
+    В пакетном режиме картинки, шрифты, тайлы и аналитика по умолчанию блокируются.
+    capture_network=False отключает перехват ответов API: данные берутся только из DOM.
+    watermarks — словарь url -> ReviewWatermark для инкрементального сбора отзывов.
+    proxies — пул прокси: каждая карточка получает свой контекст с прокси, выбранным по здоровью.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    prepare_browser_env()
+
+    async with async_playwright() as p:
+        browser, browser_name = await launch_async_browser(p)
+
+        async def run_one(url):
+            async with semaphore:
+                proxy = proxies.choose() if proxies else None
+                started = asyncio.get_running_loop().time()
+                try:
+                    data = await async_parse_yandex_card(url, browser=browser, browser_name=browser_name, capture_network=capture_network, block_resources=block_resources, parallel_tabs=parallel_tabs, max_reviews=max_reviews, watermark=(watermarks or {}).get(url), proxy=proxy)
+                    if proxy:
+                        proxies.report(proxy, classify_result({'data': data}), asyncio.get_running_loop().time() - started)
+                    return data
+                except Exception as e:
+                    if proxy:
+                        proxies.report(proxy, classify_result({'error': str(e)}))
+                    if not return_exceptions:
+                        raise
+                    print(f"Ошибка при парсинге {url}: {e}")
+                    return {"error": str(e), "url": url}
+
+        try:
+            return await asyncio.gather(*(run_one(url) for url in urls))
+        finally:
+            await browser.close()
+
+
+async def _is_captcha(page) -> bool:
+    return bool(await page.query_selector(CAPTCHA_FORM_SELECTOR) or "captcha" in page.url.lower() or CAPTCHA_TITLE in await page.title())
+
+
+async def _parse_tab(tab: str, page, capture, reviews_options: dict | None = None):
+    with span('tab', tab=tab):
+        if tab == 'reviews':
+            return await parse_reviews(page, capture, **(reviews_options or {}))
+        if tab == 'news':
+            return await parse_news(page, capture)
+        if tab == 'photos':
+            return await parse_photos(page, capture)
+        return await parse_features(page)
+
+
+async def _parse_tab_page(new_page, url: str, tab: str, reviews_options: dict | None = None):
+    """Открывает вкладку по «глубокой» ссылке в соседней странице и разбирает её. None — не удалось"""
+    target = tab_url(url, tab)
+    if not target:
+        return None
+    try:
+        page, capture = await new_page()
+        with span('goto', tab=tab):
+            await page.goto(target, wait_until='domcontentloaded', timeout=60000)
+            await async_wait_for_ready(page, selector=PAGE_READY_SELECTOR, timeout=15000)
+        if await _is_captcha(page):
+            print(f"Captcha на вкладке {tab}, парсим её на основной странице")
+            return None
+        return await _parse_tab(tab, page, capture, reviews_options)
+    except Exception as e:
+        print(f"Не удалось разобрать вкладку {tab}: {e}")
+        return None
+
+
+async def _parse_card_page(new_page, url: str, browser_name: str, parallel_tabs: bool = False, reviews_options: dict | None = None) -> dict:
+    page, capture = await new_page()
+    await page.set_extra_http_headers({
+        'Cache-Control': 'no-cache',
+        'Pragma': 'no-cache'
+    })
+
+    print("Переходим на страницу...")
+    with span('goto'):
+        await page.goto(url, wait_until='domcontentloaded', timeout=60000)
+        await async_wait_for_ready(page, selector=PAGE_READY_SELECTOR, timeout=15000)
+    pacing = get_pacing()
+    await pacing.apause()
+
+    if await _is_captcha(page):
+        count('captcha')
+        print(f"⚠️  Обнаружена captcha: {url}")
+        return {"error": "captcha_detected", "url": url}
+
+    async def overview():
+        with span('tab', tab='overview'):
+            return await _parse_overview_tab(page, pacing)
+
+    if parallel_tabs:
+        data, *tab_results = await asyncio.gather(overview(), *(_parse_tab_page(new_page, url, tab, reviews_options) for tab in PARALLEL_TABS))
+        results = {tab: result for tab, result in zip(PARALLEL_TABS, tab_results) if result is not None}
+    else:
+        data = await overview()
+        results = {}
+    data['url'] = url
+
+    data['photos_count'] = await get_photos_count(page)
+    for tab in PARALLEL_TABS:
+        if tab not in results:
+            results[tab] = await _parse_tab(tab, page, capture, reviews_options)
+    with span('tab', tab='competitors'):
+        data['competitors'] = await parse_competitors(page)
+    fill_card(data, results)
+
+    print(f"Парсинг завершен ({browser_name}). Найдено: название='{data['title']}', адрес='{data['address']}'")
+    return data
+
+
+async def _parse_overview_tab(page, pacing):
+    try:
+        await page.wait_for_selector("body", timeout=10000)
+        overview_tab = await page.query_selector(TAB_SELECTORS['overview'])
+        if overview_tab:
+            await overview_tab.click()
+            await async_wait_for_dom_quiet(page, quiet_ms=400, timeout=5000)
+    except Exception as e:
+        print(f"Вкладка 'Обзор' не найдена: {e}")
+
+    for _ in range(2):
+        await page.mouse.wheel(0, 1000)
+        await async_wait_for_dom_quiet(page, quiet_ms=400, timeout=4000)
+    await pacing.apause()
+
+    return await parse_overview_data(page)
+
+
+async def parse_overview_data(page):
+    """Асинхронная версия parser.parse_overview_data"""
+    try:
+        await async_wait_for_ready(page, selector=CONTACTS_SELECTOR, timeout=5000, quiet_ms=300)
+        if await amark_first_visible(page, PHONE_BUTTON_SELECTORS, marker='data-parser-phone-btn'):
+            await page.click("[data-parser-phone-btn]")
+            await async_wait_for_ready(page, selector=PHONE_READY_SELECTOR, timeout=4000, quiet_ms=300)
+    except Exception:
+        pass
+
+    try:
+        with span('extract', spec='overview'):
+            data = build_overview(await aextract(page, OVERVIEW_SPEC))
+    except Exception as e:
+        print(f"Ошибка при извлечении обзора: {e}")
+        data = build_overview({})
+
+    products_tab = await page.query_selector(TAB_SELECTORS['products'])
+    if products_tab:
+        await products_tab.click()
+        await async_wait_for_ready(page, selector=TAB_READY_SELECTORS['products'], timeout=5000)
+    try:
+        with span('extract', spec='products'):
+            data.update(build_products(await aextract(page, PRODUCTS_SPEC)))
+    except Exception:
+        data['products'] = []
+        data['product_categories'] = []
+
+    return data
+
+
+async def _sort_reviews_by_newest(page, capture: NetworkCapture | None = None):
+    """То же, что parser._sort_reviews_by_newest, для async API"""
+    try:
+        ranking = await page.query_selector(REVIEWS_RANKING_SELECTOR)
+        if not ranking:
+            print("Сортировка отзывов не найдена, водяной знак может сработать неточно")
+            return False
+        await ranking.click()
+        option = await page.wait_for_selector(REVIEWS_NEWEST_OPTION, timeout=3000)
+        if capture:
+            capture.reset('reviews')
+        await option.click()
+        await async_wait_for_ready(page, selector=TAB_READY_SELECTORS['reviews'], timeout=8000)
+        return True
+    except Exception as e:
+        print(f"Не удалось отсортировать отзывы по новизне: {e}")
+        return False
+
+
+async def _open_tab(page, tab: str, timeout: int = 5000) -> bool:
+    """Кликает по вкладке и ждёт её содержимого. False — вкладки на странице нет"""
+    tab_el = await page.query_selector(TAB_SELECTORS[tab])
+    if not tab_el:
+        return False
+    await tab_el.click()
+    await async_wait_for_ready(page, selector=TAB_READY_SELECTORS[tab], timeout=timeout)
+    return True
+
+
+async def parse_reviews(page, capture: NetworkCapture | None = None, max_reviews: int | None = None, watermark: ReviewWatermark | None = None):
+    """Асинхронная версия parser.parse_reviews"""
+    try:
+        if not await _open_tab(page, 'reviews', timeout=8000):
+            print("Вкладка 'Отзывы' не найдена!")
+
+        try:
+            reviews_data = build_reviews_header(await aextract(page, REVIEWS_HEADER_SPEC))
+        except Exception as e:
+            print(f"Ошибка при подсчете отзывов: {e}")
+            reviews_data = empty_reviews()
+
+        if watermark and not await _sort_reviews_by_newest(page, capture):
+            watermark = None
+
+        try:
+            controller = ReviewsScrollController(target=reviews_data['reviews_count'], max_reviews=max_reviews, pacing=get_pacing(), watermark=watermark, capture=capture)
+            await controller.arun(page)
+        except Exception as e:
+            print(f"Ошибка при прокрутке отзывов: {e}")
+
+        if capture and apply_captured_reviews(reviews_data, await capture.acollect('reviews'), max_reviews):
+            return apply_watermark(reviews_data, watermark)
+
+        try:
+            if await page.evaluate(EXPAND_REPLIES_JS, REPLY_BUTTON_SELECTOR):
+                await async_wait_for_ready(page, selector=REPLY_SELECTOR, timeout=1500, quiet_ms=100)
+            with span('extract', spec='reviews'):
+                reviews_data['items'] = build_review_items(await aextract(page, REVIEW_ITEMS_SPEC), max_reviews)
+        except Exception as e:
+            print(f"Ошибка при разборе отзывов: {e}")
+
+        return apply_watermark(reviews_data, watermark)
+    except Exception:
+        return empty_reviews()
+
+
+async def parse_news(page, capture: NetworkCapture | None = None):
+    """Асинхронная версия parser.parse_news"""
+    try:
+        if not await _open_tab(page, 'news'):
+            return []
+        await async_scroll_until_stable(page, TAB_READY_SELECTORS['news'], max_scrolls=20, pacing=get_pacing())
+
+        if capture:
+            news = news_from_payloads(await capture.acollect('news'))
+            if news:
+                return news
+        return build_news(await aextract(page, NEWS_SPEC))
+    except Exception as e:
+        print(f"Ошибка при парсинге новостей: {e}")
+        return []
+
+
+async def get_photos_count(page):
+    """Асинхронная версия parser.get_photos_count"""
+    try:
+        return (await aextract(page, PHOTOS_COUNT_SPEC))['photos_count']
+    except Exception:
+        return "0"
+
+
+async def parse_photos(page, capture: NetworkCapture | None = None):
+    """Асинхронная версия parser.parse_photos"""
+    try:
+        if await _open_tab(page, 'photos'):
+            await async_scroll_until_stable(page, TAB_READY_SELECTORS['photos'], max_scrolls=20, pacing=get_pacing())
+
+        if capture:
+            photos = photos_from_payloads(await capture.acollect('photos'))
+            if photos:
+                return photos
+        return build_photos(await aextract(page, PHOTOS_SPEC))
+    except Exception:
+        return []
+
+
+async def parse_features(page):
+    """Асинхронная версия parser.parse_features"""
+    try:
+        await _open_tab(page, 'features')
+        with span('extract', spec='features'):
+            return build_features(await aextract(page, FEATURES_SPEC))
+    except Exception as e:
+        print(f"Ошибка при парсинге особенностей: {e}")
+        return empty_features()
+
+
+async def parse_competitors(page):
+    """Асинхронная версия parser.parse_competitors"""
+    try:
+        return build_competitors(await aextract(page, COMPETITORS_SPEC))
+    except Exception as e:
+        print(f"Ошибка при поиске конкурентов: {e}")
+        return []
@@ -0,0 +1,345 @@
+"""
+batch.py — Пакетный парсинг списка карточек пулом процессов
+
+Ссылки читаются из файла (или stdin), нормализуются и дедуплицируются по id
+организации, затем раздаются воркерам. Каждый воркер — отдельный процесс со своим
+браузером (пул из browser_pool поднимается лениво при первой карточке), потому что
+sync API Playwright привязан к потоку. Результаты возвращаются в основной процесс по
+мере готовности: там они сохраняются и превращаются в отчёты, а в консоль
+печатается прогресс, скорость и оценка оставшегося времени. Ошибка одной карточки
+не останавливает остальные. Состояние пакета хранится в очереди job_queue.JobQueue:
+упавшие карточки повторяются, а после падения процесса пакет продолжается командой resume.
+Частоту выдачи задач регулирует rate_limiter.RateLimiter: при капчах и тайм-аутах
+скорость снижается, а выход в сеть с серией капч ставится на паузу. Если задан пул
+прокси (proxy_pool), каждая задача получает прокси по его здоровью, и у каждого прокси
+свой лимит частоты.
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import sys
+import time
+
+from src.job_queue import JobQueue
+from src.metrics import get_registry
+from src.proxy_pool import ProxyPool, get_default_proxy_pool
+from src.rate_limiter import DIRECT, RateLimiter, classify_result, egress_key
+from src.yandex_urls import extract_org_id, normalize_card_url
+
+# Сколько аварий пула (OOM, падение браузера) должна застать задача, чтобы ей засчитали попытку
+CRASH_SUSPECT_LIMIT = 2
+
+# Минимальная пауза, когда ни один прокси не может взять задачу (чтобы цикл не крутился вхолостую)
+EGRESS_MIN_WAIT = 0.5
+
+
+def read_urls(source) -> list:
+    """
+    Читает ссылки из файла (путь или '-' для stdin), по одной на строку.
+    Пустые строки и строки с # пропускаются, ссылки нормализуются,
+    дубликаты (та же организация) отбрасываются с сохранением порядка.
+    """
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    return dedup_urls(lines)
+
+
+def dedup_urls(lines) -> list:
+    urls = []
+    seen = set()
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if not line.startswith(('http://', 'https://')):
+            print(f"Пропускаем некорректную ссылку: {line}")
+            continue
+        url = normalize_card_url(line)
+        key = extract_org_id(url) or url
+        if key in seen:
+            continue
+        seen.add(key)
+        urls.append(url)
+    return urls
+
+
+class BatchProgress:
+    """Счётчики пакета: готово/ошибки, скорость (карточек в минуту) и ETA"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    def update(self, ok: bool):
+        self.done += 1
+        if not ok:
+            self.failed += 1
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        """Карточек в минуту"""
+        return self.done / self.elapsed * 60 if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float:
+        """Оценка оставшегося времени, секунды"""
+        if not self.done:
+            return 0.0
+        return (self.total - self.done) * self.elapsed / self.done
+
+    def line(self) -> str:
+        return (f"[{self.done}/{self.total}] ошибок: {self.failed}, "
+                f"{self.rate:.1f} карт./мин, осталось ~{_format_duration(self.eta)}")
+
+    def summary(self) -> dict:
+        return {
+            'total': self.total,
+            'done': self.done,
+            'failed': self.failed,
+            'elapsed_sec': round(self.elapsed, 1),
+            'cards_per_min': round(self.rate, 2),
+        }
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600} ч {seconds % 3600 // 60} мин"
+    if seconds >= 60:
+        return f"{seconds // 60} мин {seconds % 60} с"
+    return f"{seconds} с"
+
+
+def parse_card_job(url: str, proxy: dict | None = None) -> dict:
+    """
+    Задача воркера: парсит одну карточку браузером своего процесса (через proxy, если задан).
+    Возвращает {"url", "data", "error", "elapsed"}; исключения не выбрасывает.
+    """
+    from src.parser import parse_yandex_card
+    from src.review_delta import ReviewWatermark, merge_reviews
+    from src.save_to_supabase import fetch_known_reviews
+
+    # Реестр воркера копит замеры одной карточки и отдаёт их основному процессу
+    registry = get_registry()
+    registry.reset()
+    started = time.monotonic()
+    try:
+        known_reviews = fetch_known_reviews(url)
+        watermark = ReviewWatermark.from_reviews(known_reviews) if known_reviews else None
+        data = parse_yandex_card(url, block_resources=True, watermark=watermark, proxy=proxy)
+        if watermark and data.get('reviews', {}).get('incremental'):
+            # Отчёт и кэш получают полный список, в Reviews уйдут только новые (new_count)
+            data['reviews'] = merge_reviews(known_reviews, data['reviews'])
+        error = data.get('error')
+    except Exception as e:
+        data, error = None, str(e)
+    return {'url': url, 'data': data, 'error': error, 'elapsed': time.monotonic() - started, 'metrics': registry.snapshot()}
+
+
+def export_pending(queue: JobQueue, on_result=None) -> int:
+    """Выгружает готовые, но не сохранённые результаты (остались после падения процесса)"""
+    pending = {}
+    for url, data in queue.unexported():
+        written = None
+        if on_result:
+            try:
+                written = on_result({'url': url, 'data': data, 'error': None, 'elapsed': 0.0})
+            except Exception as e:
+                print(f"Ошибка при обработке результата {url}: {e}")
+                continue
+        _track_export(queue, pending, url, written)
+    return _settle_exports(queue, pending, wait_all=True)
+
+
+def _track_export(queue: JobQueue, pending: dict, url: str, written) -> int:
+    """
+    Отмечает карточку выгруженной. Если on_result вернул Future (отложенная запись
+    card_writer), отметка ждёт его завершения в pending.
+    """
+    if isinstance(written, Future):
+        pending[url] = written
+        return 0
+    queue.mark_exported(url)
+    return 1
+
+
+def _settle_exports(queue: JobQueue, pending: dict, wait_all: bool = False) -> int:
+    """Отмечает выгруженными карточки, чья запись завершилась; wait_all ждёт все. Возвращает число отмеченных"""
+    if wait_all and pending:
+        wait(list(pending.values()))
+    exported = 0
+    for url, written in list(pending.items()):
+        if not written.done():
+            continue
+        del pending[url]
+        error = written.exception()
+        if error is None:
+            queue.mark_exported(url)
+            exported += 1
+        else:
+            print(f"Карточка не записана в базу, её выгрузит resume: {url} ({error})")
+    return exported
+
+
+def run_batch(urls, workers: int = 2, on_result=None, job=parse_card_job, queue: JobQueue | None = None, limiter: RateLimiter | None = None, proxies: ProxyPool | None = None, feed=None) -> dict:
+    """
+    Раздаёт задачи очереди процессам-воркерам и вызывает on_result(result) в основном
+    процессе для каждой карточки по мере готовности. urls добавляются в очередь как новый
+    прогон; с пустым urls продолжается то, что уже в очереди (resume).
+    Без queue используется очередь в памяти. Задача выдаётся только когда её разрешает
+    limiter (по умолчанию — новый RateLimiter). Прокси выбираются из proxies
+    (по умолчанию — пул из переменных окружения; пустой пул — прямое соединение).
+    feed(limit) вызывается, когда в очереди нет готовых задач, и может вернуть до limit
+    новых ссылок — так пакет дополняется по ходу работы (обход графа конкурентов).
+    Возвращает сводку BatchProgress.summary().
+    """
+    queue = queue or JobQueue(':memory:')
+    limiter = limiter or RateLimiter()
+    proxies = proxies if proxies is not None else get_default_proxy_pool()
+    if proxies:
+        print(f"Прокси в пуле: {len(proxies)}")
+    if urls:
+        queue.add(urls)
+    if feed and not queue.remaining():
+        queue.add(feed(max(1, workers) * 2) or [], reset=False)
+    progress = BatchProgress(queue.remaining())
+    if not progress.total:
+        return progress.summary()
+    # С feed пакет растёт по ходу работы, поэтому воркеров не урезаем по стартовому размеру
+    workers = max(1, workers if feed else min(workers, progress.total))
+    print(f"Пакетный режим: {progress.total} карточек, воркеров: {workers}")
+
+    # spawn: дочерний процесс не наследует состояние Playwright родителя
+    mp_context = multiprocessing.get_context('spawn')
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+    worker_id = f"pid-{os.getpid()}"
+    in_flight = {}
+    # Карточки, отданные on_result на отложенную запись: url -> Future
+    pending_exports = {}
+    # Сколько аварий пула застала каждая задача
+    crash_counts = {}
+    try:
+        while True:
+            # Держим в работе не больше двух задач на воркер, остальное остаётся в очереди
+            pause = 0.0
+            while len(in_flight) < workers * 2:
+                proxy, egress, pause = _pick_egress(proxies, limiter)
+                if pause > 0:
+                    break
+                url = queue.lease(worker_id)
+                if not url and feed:
+                    added = queue.add(feed(workers * 2 - len(in_flight)) or [], reset=False)
+                    progress.total += added
+                    url = queue.lease(worker_id) if added else None
+                if not url:
+                    break
+                limiter.try_acquire(egress)
+                in_flight[executor.submit(job, url, proxy)] = (url, proxy, egress)
+            retry_in = queue.next_available_in()
+            if not in_flight:
+                if retry_in is None:
+                    break
+                delay = max(pause, retry_in)
+                print(f"Ждём {delay:.0f} с ({'ограничение частоты' if pause >= retry_in else 'повторные попытки'})")
+                time.sleep(delay + 0.1)
+                continue
+
+            # Ждём готовую карточку, но просыпаемся, когда ограничитель разрешит выдать следующую
+            timeout = pause if pause > 0 else (retry_in or None)
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            crashed = []
+            for future in done:
+                url, proxy, egress = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    crashed.append(url)
+                    continue
+                except Exception as e:
+                    result = {'url': url, 'data': None, 'error': f"Воркер завершился с ошибкой: {e}", 'elapsed': 0.0}
+                get_registry().merge(result.pop('metrics', None))
+                outcome = classify_result(result)
+                limiter.report(egress, outcome)
+                if proxy:
+                    proxies.report(proxy, outcome, result.get('elapsed') or None)
+                _finish(queue, progress, result, on_result, pending_exports)
+            _settle_exports(queue, pending_exports)
+
+            if crashed:
+                # Пул не переживает гибель процесса (OOM) и не сообщает, какая задача его уронила:
+                # все задачи в работе возвращаются в очередь без потери попытки. Попытку получает
+                # задача, которая была в работе одна или застала CRASH_SUSPECT_LIMIT аварий.
+                affected = crashed + [url for url, _, _ in in_flight.values()]
+                for url in affected:
+                    crash_counts[url] = crash_counts.get(url, 0) + 1
+                    if len(affected) == 1 or crash_counts[url] >= CRASH_SUSPECT_LIMIT:
+                        result = {'url': url, 'data': None, 'error': "Воркер завершился аварийно", 'elapsed': 0.0}
+                        _finish(queue, progress, result, on_result, pending_exports)
+                    else:
+                        queue.release(url)
+                        print(f"Пул воркеров перезапущен, задача возвращена в очередь: {url}")
+                in_flight = {}
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+    finally:
+        for url, _, _ in in_flight.values():
+            queue.release(url)
+        executor.shutdown(wait=True, cancel_futures=True)
+        _settle_exports(queue, pending_exports, wait_all=True)
+
+    summary = progress.summary()
+    summary['egress'] = limiter.stats()
+    if proxies:
+        summary['proxies'] = proxies.stats()
+    summary['stages'] = get_registry().summary()
+    print(f"Пакет завершён: {summary['done'] - summary['failed']} успешно, {summary['failed']} с ошибками "
+          f"за {_format_duration(summary['elapsed_sec'])} ({summary['cards_per_min']} карт./мин)")
+    for stage, item in list(summary['stages'].items())[:8]:
+        print(f"  {stage}: {item['total_sec']} с всего, {item['avg_sec']} с в среднем ({item['count']} раз)")
+    return summary
+
+
+def _pick_egress(proxies: ProxyPool, limiter: RateLimiter):
+    """Выбирает (proxy, egress, pause): прокси, не ограниченный лимитером, или время до ближайшего"""
+    if not proxies:
+        return None, DIRECT, limiter.delay(DIRECT)
+    proxy = proxies.choose(available=lambda key: limiter.delay(key) <= 0)
+    if proxy is None:
+        # Все прокси в карантине или на паузе: ждём ближайший, но не меньше EGRESS_MIN_WAIT
+        return None, None, max(EGRESS_MIN_WAIT, proxies.wait_time(limiter.delay))
+    return proxy, egress_key(proxy), 0.0
+
+
+def _finish(queue: JobQueue, progress: BatchProgress, result: dict, on_result, pending: dict):
+    """Записывает результат задачи в очередь, обновляет прогресс и выгружает карточку"""
+    url = result['url']
+    error = result.get('error')
+    if error:
+        if queue.fail(url, error):
+            print(f"{progress.line()} — {url} (ошибка: {error}, будет повтор)")
+            return
+        progress.update(False)
+        print(f"{progress.line()} — {url} (ошибка: {error}, попытки исчерпаны)")
+    else:
+        queue.complete(url, result.get('data'))
+        progress.update(True)
+        print(f"{progress.line()} — {url} (готово, {result.get('elapsed', 0):.1f} с)")
+    written = None
+    if on_result:
+        try:
+            written = on_result(result)
+        except Exception as e:
+            print(f"Ошибка при обработке результата {url}: {e}")
+            return
+    if not error:
+        _track_export(queue, pending, url, written)
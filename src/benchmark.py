@@ -0,0 +1,455 @@
+"""
+benchmark.py — Офлайн-бенчмарк функций парсинга на сохранённых HTML-фрагментах карточки
+
+Страницы не грузятся из сети: page.route отдаёт с диска фрагменты из attached_assets/
+(похожие места, рубрикатор, товары и услуги), обёрнутые в минимальный HTML, а
+недостающие секции (шапка обзора, отзывы, особенности) собираются из шаблонов.
+Все прочие запросы обрываются, поэтому замеры не зависят от сети и Яндекса.
+
+Для parse_overview_data, parse_reviews, parse_features и parse_competitors
+замеряются время вызова, количество вызовов Playwright (page.*, ElementHandle.*),
+пик памяти Python (tracemalloc) и куча JS страницы. Результат можно сохранить
+в JSON и сравнить с прошлым прогоном:
+
+    python -m src.benchmark --runs 5 --json bench.json
+    python -m src.benchmark --baseline bench.json --max-regression 0.2
+
+Записанные в проде карточки (parse_yandex_card(url, record_har=...)) добавляются
+флагом --har: карточка целиком разбирается из записи, замеряются время и этапы.
+"""
+from collections import Counter
+from contextlib import contextmanager
+import argparse
+import glob
+import html
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import zipfile
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'attached_assets')
+
+FIXTURE_BASE = 'https://yandex.ru/maps/org/benchmark/'
+
+# Фрагменты из attached_assets: имя → начало имени файла
+FRAGMENT_PATTERNS = {
+    'products': 'Pasted--div-class-business-full-items-grouped-view',
+    'rubricator': 'Pasted--div-class-business-related-items-rubricator',
+    'similar': 'Pasted--div-class-card-similar-carousel',
+}
+
+FIXTURE_REVIEWS = 50
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="ru"><head><meta charset="utf-8"><title>{title}</title></head>
+<body>{body}</body></html>"""
+
+OVERVIEW_HTML = """
+<h1 class="card-title-view__title">Барбершоп Бенчмарк</h1>
+<div class="business-card-title-view__categories"><span>Барбершоп</span><span>Парикмахерская</span></div>
+<span class="business-rating-badge-view__rating-text">4,9</span>
+<div class="business-header-rating-view__text _clickable">312 оценок</div>
+<div class="business-contacts-view">
+  <div class="business-contacts-view__address">Москва, Тестовая улица, 1</div>
+  <div class="business-phones-view"><span class="business-phones-view__text">+7 (495) 000-00-00</span></div>
+  <a class="business-urls-view__link" href="https://example.com">example.com</a>
+</div>
+<div class="masstransit-stops-view _type_metro">
+  <div class="masstransit-stops-view__stop-name">Тестовая</div>
+  <div class="masstransit-stops-view__stop-distance-text">350 м</div>
+</div>
+<div class="business-working-intervals-view">
+  {hours}
+</div>
+<div class="card-about-view__description-text">Стрижки и бритьё для бенчмарка.</div>
+"""
+
+HOURS_ROW = """<div class="business-working-intervals-view__item"><div class="business-working-intervals-view__day">{day}</div><div class="business-working-intervals-view__interval">10:00–22:00</div></div>"""
+
+REVIEW_BLOCK = """
+<div class="business-review-view">
+  <div class="business-review-view__author"><span class="business-review-view__author-name">Автор {n}</span></div>
+  <span class="business-review-view__date">{day} сентября</span>
+  <div class="business-rating-view__stars">{stars}</div>
+  <div class="business-review-view__body">Отзыв номер {n}: всё понравилось, мастер аккуратный, приду ещё.</div>
+</div>"""
+
+FEATURE_VALUED = """<div class="business-features-view__valued"><span class="business-features-view__valued-title">{title}:</span><span class="business-features-view__valued-value">{value}</span></div>"""
+
+FEATURE_BOOL = """<div class="business-features-view__bool-item"><div class="business-features-view__bool-icon{defined}"></div><div class="business-features-view__bool-text">{text}</div></div>"""
+
+
+def _read_fragment(name: str, assets_dir: str) -> str:
+    paths = sorted(glob.glob(os.path.join(assets_dir, FRAGMENT_PATTERNS[name] + '*')))
+    if not paths:
+        print(f"Фикстура {name} не найдена в {assets_dir}")
+        return ''
+    with open(paths[0], encoding='utf-8') as f:
+        return f.read()
+
+
+def _overview_body(assets_dir: str) -> str:
+    days = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье']
+    hours = ''.join(HOURS_ROW.format(day=day) for day in days)
+    return (OVERVIEW_HTML.format(hours=hours)
+            + _read_fragment('rubricator', assets_dir)
+            + _read_fragment('products', assets_dir))
+
+
+def _reviews_body(count: int = FIXTURE_REVIEWS) -> str:
+    # Заголовок с числом отзывов, равным числу блоков: прокрутка останавливается сразу
+    blocks = ''.join(
+        REVIEW_BLOCK.format(n=n, day=n % 28 + 1, stars='<span class="business-rating-view__star _fill"></span>' * (5 - n % 3))
+        for n in range(1, count + 1)
+    )
+    return (f'<div class="business-reviews-card-view__header"><h2 class="card-section-header__title _wide">{count} отзывов</h2></div>'
+            f'<div class="business-reviews-card-view__reviews-container">{blocks}</div>')
+
+
+def _features_body() -> str:
+    valued = [('Цена стрижки', 'от 1500 ₽'), ('Способы оплаты', 'наличные, карта'), ('Цена бритья', 'от 900 ₽')]
+    flags = [('Wi-Fi', True), ('Парковка', True), ('Запись онлайн', True), ('Детская комната', False)]
+    return ('<div class="business-features-view">'
+            + ''.join(FEATURE_VALUED.format(title=html.escape(t), value=html.escape(v)) for t, v in valued)
+            + ''.join(FEATURE_BOOL.format(text=html.escape(t), defined=' _defined' if d else '') for t, d in flags)
+            + '</div><div class="orgpage-categories-info-view"><span class="button__text">Барбершоп</span>'
+              '<span class="button__text">Парикмахерская</span></div>')
+
+
+def build_fixtures(assets_dir: str = ASSETS_DIR) -> dict:
+    """Страницы для бенчмарка: имя → HTML"""
+    bodies = {
+        'overview': _overview_body(assets_dir),
+        'reviews': _reviews_body(),
+        'features': _features_body(),
+        'competitors': _read_fragment('similar', assets_dir),
+    }
+    return {name: PAGE_TEMPLATE.format(title=name, body=body) for name, body in bodies.items()}
+
+
+def fixture_url(name: str) -> str:
+    return f"{FIXTURE_BASE}{name}/"
+
+
+def _route_fixtures(fixtures: dict):
+    """Обработчик page.route: фикстуры отдаются с диска, остальное обрывается"""
+    def handler(route):
+        url = route.request.url
+        if url.startswith(FIXTURE_BASE):
+            name = url[len(FIXTURE_BASE):].split('/')[0]
+            if name in fixtures:
+                route.fulfill(status=200, content_type='text/html; charset=utf-8', body=fixtures[name])
+                return
+        route.abort()
+    return handler
+
+
+def _is_playwright_object(value) -> bool:
+    return type(value).__module__.startswith('playwright.')
+
+
+def _wrap(value, calls: Counter):
+    if isinstance(value, list):
+        return [_wrap(item, calls) for item in value]
+    if _is_playwright_object(value):
+        return _CallCounter(value, calls)
+    return value
+
+
+def _unwrap(value):
+    return value._target if isinstance(value, _CallCounter) else value
+
+
+class _CallCounter:
+    """Обёртка над объектом Playwright: считает вызовы методов и оборачивает возвращаемые объекты"""
+
+    def __init__(self, target, calls: Counter):
+        self._target = target
+        self._calls = calls
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if not callable(value):
+            return _wrap(value, self._calls)
+        key = f"{type(self._target).__name__}.{name}"
+
+        def call(*args, **kwargs):
+            self._calls[key] += 1
+            args = [_unwrap(arg) for arg in args]
+            kwargs = {k: _unwrap(v) for k, v in kwargs.items()}
+            return _wrap(value(*args, **kwargs), self._calls)
+        return call
+
+    def __bool__(self):
+        return True
+
+
+def _parse_reviews(page):
+    from src.parser import parse_reviews
+    return parse_reviews(page)
+
+
+def _default_targets() -> dict:
+    from src.parser import parse_overview_data, parse_features, parse_competitors
+    return {
+        'parse_overview_data': ('overview', parse_overview_data),
+        'parse_reviews': ('reviews', _parse_reviews),
+        'parse_features': ('features', parse_features),
+        'parse_competitors': ('competitors', parse_competitors),
+    }
+
+
+def _result_size(result) -> dict:
+    """Сколько элементов вернула функция — чтобы ускорение не оказалось пустым результатом"""
+    if isinstance(result, list):
+        return {'items': len(result)}
+    if isinstance(result, dict):
+        return {k: len(v) for k, v in result.items() if isinstance(v, (list, dict))}
+    return {}
+
+
+def _js_heap_mb(page) -> float | None:
+    try:
+        used = page.evaluate("() => performance.memory ? performance.memory.usedJSHeapSize : null")
+        return round(used / 1024 / 1024, 2) if used else None
+    except Exception:
+        return None
+
+
+def _max_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return round(rss / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+@contextmanager
+def _quiet(enabled: bool):
+    """Глушит print парсера, чтобы вывод бенчмарка оставался читаемым"""
+    if not enabled:
+        yield
+        return
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def run_benchmark(runs: int = 3, targets: dict | None = None, fixtures: dict | None = None, pool=None, quiet: bool = True) -> dict:
+    """
+    Прогоняет каждую функцию runs раз на свежей загрузке её фикстуры.
+    Возвращает {"functions": {имя: замеры}, "environment": {...}}.
+    """
+    from src.browser_pool import BrowserPool
+
+    # Случайные паузы шумят в замерах и к скорости парсинга отношения не имеют
+    os.environ.setdefault('PARSER_JITTER_MIN', '0')
+    os.environ.setdefault('PARSER_JITTER_MAX', '0')
+    targets = targets or _default_targets()
+    fixtures = fixtures or build_fixtures()
+    own_pool = pool is None
+    pool = pool or BrowserPool(browsers=1, contexts_per_browser=1, recycle_after_pages=10 ** 6)
+    report = {'functions': {}}
+    try:
+        with pool.lease() as context:
+            page = context.new_page()
+            page.route('**/*', _route_fixtures(fixtures))
+            for name, (fixture, func) in targets.items():
+                durations = []
+                calls = Counter()
+                py_peak = 0
+                js_heap = None
+                size = {}
+                for _ in range(max(1, runs)):
+                    page.goto(fixture_url(fixture), wait_until='domcontentloaded')
+                    run_calls = Counter()
+                    tracemalloc.start()
+                    started = time.perf_counter()
+                    try:
+                        with _quiet(quiet):
+                            result = func(_CallCounter(page, run_calls))
+                    finally:
+                        durations.append(time.perf_counter() - started)
+                        py_peak = max(py_peak, tracemalloc.get_traced_memory()[1])
+                        tracemalloc.stop()
+                    calls.update(run_calls)
+                    size = _result_size(result)
+                    js_heap = _js_heap_mb(page)
+                report['functions'][name] = _summarize(durations, calls, py_peak, js_heap, size)
+            report['environment'] = {
+                'browser': pool.browser_name,
+                'runs': max(1, runs),
+                'python': sys.version.split()[0],
+                'max_rss_mb': _max_rss_mb(),
+            }
+            page.close()
+    finally:
+        if own_pool:
+            pool.close()
+    return report
+
+
+def har_card_url(path: str) -> str | None:
+    """Ссылка на карточку из HAR: первый HTML-документ /maps/org/ (или первый запрос записи)"""
+    try:
+        if path.endswith('.zip'):
+            with zipfile.ZipFile(path) as archive:
+                har = json.loads(archive.read('har.har'))
+        else:
+            with open(path, encoding='utf-8') as f:
+                har = json.load(f)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        print(f"Не удалось прочитать HAR {path}: {e}")
+        return None
+    entries = har.get('log', {}).get('entries', [])
+    for entry in entries:
+        url = entry.get('request', {}).get('url', '')
+        mime = entry.get('response', {}).get('content', {}).get('mimeType', '')
+        if '/maps/org/' in url and mime.startswith('text/html'):
+            return url
+    return entries[0]['request']['url'] if entries else None
+
+
+def run_har_benchmark(paths, runs: int = 3, pool=None, quiet: bool = True) -> dict:
+    """Разбирает записанные карточки целиком через parse_yandex_card(replay_har=...)"""
+    from src.browser_pool import BrowserPool
+    from src.metrics import get_registry
+    from src.parser import parse_yandex_card
+
+    own_pool = pool is None
+    pool = pool or BrowserPool(browsers=1, contexts_per_browser=1)
+    registry = get_registry()
+    report = {}
+    try:
+        for path in paths:
+            url = har_card_url(path)
+            if not url:
+                continue
+            registry.reset()
+            durations = []
+            size = {}
+            tracemalloc.start()
+            for _ in range(max(1, runs)):
+                started = time.perf_counter()
+                try:
+                    with _quiet(quiet):
+                        data = parse_yandex_card(url, pool=pool, replay_har=path)
+                except Exception as e:
+                    print(f"Запись {path} не разобралась: {e}")
+                    break
+                finally:
+                    durations.append(time.perf_counter() - started)
+                size = {
+                    'reviews': len((data.get('reviews') or {}).get('items', [])),
+                    'products': len(data.get('products') or []),
+                    'competitors': len(data.get('competitors') or []),
+                }
+            py_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            item = _summarize(durations, Counter(), py_peak, None, size)
+            item['url'] = url
+            item['stages'] = registry.summary()
+            report[f"har:{os.path.basename(path)}"] = item
+    finally:
+        if own_pool:
+            pool.close()
+    return report
+
+
+def _summarize(durations: list, calls: Counter, py_peak: int, js_heap, size: dict) -> dict:
+    runs = len(durations)
+    ordered = sorted(durations)
+    return {
+        'runs': runs,
+        'mean_ms': round(statistics.mean(durations) * 1000, 1),
+        'median_ms': round(statistics.median(durations) * 1000, 1),
+        'min_ms': round(ordered[0] * 1000, 1),
+        'p95_ms': round(ordered[min(runs - 1, int(runs * 0.95))] * 1000, 1),
+        'max_ms': round(ordered[-1] * 1000, 1),
+        'playwright_calls': round(sum(calls.values()) / runs, 1),
+        'calls_by_method': {k: round(v / runs, 1) for k, v in calls.most_common()},
+        'py_peak_kb': round(py_peak / 1024, 1),
+        'js_heap_mb': js_heap,
+        'result': size,
+    }
+
+
+def compare(report: dict, baseline: dict, max_regression: float = 0.2) -> list:
+    """Функции, у которых медиана или число вызовов Playwright выросли больше чем на max_regression"""
+    regressions = []
+    for name, current in report.get('functions', {}).items():
+        previous = baseline.get('functions', {}).get(name)
+        if not previous:
+            continue
+        for metric in ('median_ms', 'playwright_calls'):
+            before, after = previous.get(metric), current.get(metric)
+            if before and after is not None and after > before * (1 + max_regression):
+                regressions.append(f"{name}: {metric} {before} → {after} (+{(after / before - 1):.0%})")
+    return regressions
+
+
+def print_report(report: dict, baseline: dict | None = None):
+    env = report.get('environment', {})
+    print(f"Бенчмарк парсера: браузер {env.get('browser')}, прогонов {env.get('runs')}, RSS {env.get('max_rss_mb')} МБ")
+    print(f"{'функция':<22}{'медиана, мс':>12}{'p95, мс':>10}{'вызовов PW':>12}{'Python, КБ':>12}{'JS, МБ':>9}  результат")
+    for name, m in report.get('functions', {}).items():
+        delta = ''
+        previous = (baseline or {}).get('functions', {}).get(name)
+        if previous and previous.get('median_ms'):
+            delta = f" ({m['median_ms'] / previous['median_ms'] - 1:+.0%})"
+        result = ', '.join(f"{k}={v}" for k, v in m['result'].items())
+        print(f"{name:<22}{m['median_ms']:>12}{m['p95_ms']:>10}{m['playwright_calls']:>12}{m['py_peak_kb']:>12}{str(m['js_heap_mb']):>9}  {result}{delta}")
+        top = ', '.join(f"{k}×{v}" for k, v in list(m['calls_by_method'].items())[:5])
+        print(f"{'':<22}{top}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Офлайн-бенчмарк функций парсинга на сохранённых фрагментах карточки')
+    parser.add_argument('--runs', type=int, default=3, help='прогонов каждой функции')
+    parser.add_argument('--assets', default=ASSETS_DIR, help='каталог с HTML-фрагментами')
+    parser.add_argument('--json', metavar='FILE', help='сохранить результат в JSON')
+    parser.add_argument('--baseline', metavar='FILE', help='сравнить с прошлым JSON и вернуть код 1 при регрессии')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='допустимый рост медианы и числа вызовов (доля)')
+    parser.add_argument('--har', nargs='+', default=[], metavar='FILE', help='HAR-записи карточек для разбора целиком')
+    parser.add_argument('--verbose', action='store_true', help='не глушить вывод парсера')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        try:
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Не удалось прочитать {args.baseline}: {e}")
+
+    report = run_benchmark(runs=args.runs, fixtures=build_fixtures(args.assets), quiet=not args.verbose)
+    if args.har:
+        report['functions'].update(run_har_benchmark(args.har, runs=args.runs, quiet=not args.verbose))
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результат сохранён: {args.json}")
+    if baseline:
+        regressions = compare(report, baseline, args.max_regression)
+        for line in regressions:
+            print(f"Регрессия: {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
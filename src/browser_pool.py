@@ -0,0 +1,395 @@
+"""
+browser_pool.py — Пул долгоживущих браузеров Playwright для парсинга карточек
+
+Запуск Chromium занимает основную часть времени парсинга одной карточки, поэтому
+браузеры запускаются один раз на процесс и переиспользуются: N браузеров × M контекстов.
+Контекст пересоздаётся после K открытых страниц, браузер — после проверки здоровья
+или превышения лимита страниц. Контекст с прокси переиспользуется только для того же прокси.
+
+Объекты sync-API Playwright привязаны к потоку, в котором созданы, поэтому пул
+рассчитан на использование из одного потока (в каждом процессе-воркере — свой пул).
+"""
+from playwright.sync_api import sync_playwright
+from src.user_agents import get_user_agent_provider, profile_context_options, profile_init_script
+from src.metrics import span
+from src.rate_limiter import egress_key
+from contextlib import contextmanager
+import atexit
+import os
+import threading
+
+CHROMIUM_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--disable-web-security',
+    '--disable-features=VizDisplayCompositor',
+    '--disable-background-timer-throttling',
+    '--disable-backgrounding-occluded-windows',
+    '--disable-renderer-backgrounding',
+    '--disable-extensions',
+    '--disable-plugins',
+    '--disable-sync',
+    '--disable-translate',
+    '--disable-notifications',
+    '--disable-permissions-api',
+    '--disable-default-apps',
+    '--no-first-run',
+    '--no-default-browser-check',
+    '--disable-background-networking',
+    # --single-process убран: с ним Chromium падает при нескольких контекстах в одном браузере
+    '--disable-zygote'
+]
+
+# User-Agent, окно, экран и Client Hints берутся из профиля (user_agents.py)
+CONTEXT_OPTIONS = {
+    'locale': 'ru-RU',
+    'timezone_id': 'Europe/Moscow',
+    'viewport': {'width': 1920, 'height': 1080},
+    'screen': {'width': 1920, 'height': 1080},
+    'device_scale_factor': 1,
+    'is_mobile': False,
+    'has_touch': False,
+    'color_scheme': 'light',
+    'reduced_motion': 'no-preference',
+    'forced_colors': 'none',
+    'extra_http_headers': {
+        'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+        'Sec-Fetch-Site': 'none',
+        'Sec-Fetch-Mode': 'navigate',
+        'Sec-Fetch-User': '?1',
+        'Sec-Fetch-Dest': 'document'
+    }
+}
+
+# JavaScript для скрытия автоматизации
+STEALTH_SCRIPT = """
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined,
+    });
+
+    delete navigator.__proto__.webdriver;
+
+    Object.defineProperty(navigator, 'plugins', {
+        get: () => [1, 2, 3, 4, 5],
+    });
+
+    Object.defineProperty(navigator, 'languages', {
+        get: () => ['ru-RU', 'ru', 'en'],
+    });
+
+    window.chrome = {
+        runtime: {}
+    };
+
+    Object.defineProperty(navigator, 'permissions', {
+        get: () => ({
+            query: () => Promise.resolve({ state: 'granted' }),
+        }),
+    });
+"""
+
+
+def prepare_browser_env():
+    """Правильные переменные окружения для Replit"""
+    os.environ['PLAYWRIGHT_BROWSERS_PATH'] = '/home/runner/.cache/ms-playwright'
+    os.environ['PLAYWRIGHT_SKIP_BROWSER_DOWNLOAD'] = '0'
+
+
+def launch_browser(p):
+    """Запускает Chromium, при неудаче — Firefox, затем WebKit. Возвращает (browser, browser_name)"""
+    # Попытка запуска Chromium
+    try:
+        browser = p.chromium.launch(
+            headless=True,
+            args=CHROMIUM_ARGS,
+            ignore_default_args=['--enable-automation'],
+            chromium_sandbox=False
+        )
+        print("Используем Chromium")
+        return browser, "Chromium"
+    except Exception as e:
+        print(f"Chromium недоступен: {e}")
+
+        # Если Chromium не работает, пробуем Firefox
+        try:
+            browser = p.firefox.launch(
+                headless=True,
+                args=[
+                    '--no-sandbox',
+                    '--disable-dev-shm-usage',
+                    '--disable-gpu'
+                ],
+                firefox_user_prefs={
+                    'dom.webdriver.enabled': False,
+                    'useAutomationExtension': False
+                }
+            )
+            print("Используем Firefox")
+            return browser, "Firefox"
+        except Exception as e2:
+            print(f"Firefox недоступен: {e2}")
+
+            # В крайнем случае пробуем WebKit
+            try:
+                browser = p.webkit.launch(
+                    headless=True,
+                    args=['--no-sandbox']
+                )
+                print("Используем WebKit")
+                return browser, "WebKit"
+            except Exception as e3:
+                raise Exception(f"Все браузеры недоступны: Chromium={e}, Firefox={e2}, WebKit={e3}")
+
+
+def _browser_engine(browser) -> str:
+    try:
+        return browser.browser_type.name
+    except Exception:
+        return 'chromium'
+
+
+def stealth_context_options(browser, profile=None, **overrides):
+    """Параметры контекста и профиль UA под движок браузера. Возвращает (options, profile)"""
+    profile = profile or get_user_agent_provider().random_profile(_browser_engine(browser))
+    options = dict(CONTEXT_OPTIONS)
+    options.update(profile_context_options(profile, CONTEXT_OPTIONS['extra_http_headers']))
+    options.update(overrides)
+    return options, profile
+
+
+def new_stealth_context(browser, profile=None, **overrides):
+    """Создаёт контекст с антидетектом и согласованным профилем User-Agent"""
+    options, profile = stealth_context_options(browser, profile, **overrides)
+    context = browser.new_context(**options)
+    context.add_init_script(STEALTH_SCRIPT)
+    context.add_init_script(profile_init_script(profile))
+    return context
+
+
+class _BrowserSlot:
+    """Запущенный браузер и счётчик открытых в нём страниц"""
+
+    def __init__(self, browser, name):
+        self.browser = browser
+        self.name = name
+        self.pages_opened = 0
+
+    def is_healthy(self):
+        try:
+            return self.browser.is_connected()
+        except Exception:
+            return False
+
+    def close(self):
+        try:
+            self.browser.close()
+        except Exception:
+            pass
+
+
+class _ContextSlot:
+    """Контекст браузера, выдаваемый в аренду"""
+
+    def __init__(self, browser_slot, context, proxy_key=None):
+        self.browser_slot = browser_slot
+        self.context = context
+        self.proxy_key = proxy_key
+        self.pages_opened = 0
+        self.leased = False
+        self.retired = False
+        context.on("page", self._on_page)
+
+    def _on_page(self, page):
+        self.pages_opened += 1
+        self.browser_slot.pages_opened += 1
+
+    def close(self):
+        try:
+            self.context.close()
+        except Exception:
+            pass
+
+
+class BrowserPool:
+    """
+    Пул из browsers браузеров по contexts_per_browser контекстов в каждом.
+    Контекст пересоздаётся после recycle_after_pages страниц, браузер — после
+    browser_recycle_after_pages страниц или если он перестал отвечать.
+    """
+
+    def __init__(self, browsers=1, contexts_per_browser=2, recycle_after_pages=20, browser_recycle_after_pages=200):
+        self.browsers = max(1, browsers)
+        self.contexts_per_browser = max(1, contexts_per_browser)
+        self.recycle_after_pages = max(1, recycle_after_pages)
+        self.browser_recycle_after_pages = max(self.recycle_after_pages, browser_recycle_after_pages)
+        self._playwright = None
+        self._browser_slots = []
+        self._context_slots = []
+        self._owner_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def browser_name(self):
+        return self._browser_slots[0].name if self._browser_slots else ""
+
+    def start(self):
+        if self._playwright is not None and self._owner_pid == os.getpid():
+            return
+        prepare_browser_env()
+        self._playwright = sync_playwright().start()
+        self._owner_pid = os.getpid()
+        self._browser_slots = []
+        self._context_slots = []
+
+    def _launch_slot(self):
+        with span('browser_launch'):
+            browser, name = launch_browser(self._playwright)
+        slot = _BrowserSlot(browser, name)
+        self._browser_slots.append(slot)
+        return slot
+
+    def _drop_browser(self, browser_slot):
+        for ctx_slot in [s for s in self._context_slots if s.browser_slot is browser_slot]:
+            ctx_slot.close()
+            self._context_slots.remove(ctx_slot)
+        browser_slot.close()
+        if browser_slot in self._browser_slots:
+            self._browser_slots.remove(browser_slot)
+
+    def _drop_context(self, ctx_slot):
+        ctx_slot.close()
+        if ctx_slot in self._context_slots:
+            self._context_slots.remove(ctx_slot)
+
+    def _health_check(self):
+        """Убирает упавшие браузеры и отработавшие своё контексты/браузеры"""
+        for browser_slot in list(self._browser_slots):
+            busy = any(s.leased for s in self._context_slots if s.browser_slot is browser_slot)
+            if not browser_slot.is_healthy():
+                print(f"Браузер {browser_slot.name} перестал отвечать, перезапускаем")
+                self._drop_browser(browser_slot)
+            elif browser_slot.pages_opened >= self.browser_recycle_after_pages and not busy:
+                print(f"Браузер {browser_slot.name} открыл {browser_slot.pages_opened} страниц, перезапускаем")
+                self._drop_browser(browser_slot)
+        for ctx_slot in list(self._context_slots):
+            if not ctx_slot.leased and ctx_slot.pages_opened >= self.recycle_after_pages:
+                self._drop_context(ctx_slot)
+
+    def _acquire(self, context_options):
+        context_options = dict(context_options or {})
+        proxy = context_options.get('proxy')
+        # Контекст хранит учётные данные прокси: переиспользуем его только с теми же сервером и логином
+        proxy_key = (egress_key(proxy), proxy.get('password')) if isinstance(proxy, dict) else None
+        with self._lock:
+            self.start()
+            self._health_check()
+
+            if not set(context_options) - {'proxy'}:
+                idle = [s for s in self._context_slots if not s.leased and s.proxy_key == proxy_key]
+                if idle:
+                    slot = min(idle, key=lambda s: s.pages_opened)
+                    slot.leased = True
+                    return slot
+
+            # Свободного контекста нет — создаём в наименее загруженном браузере
+            if len(self._browser_slots) < self.browsers:
+                browser_slot = self._launch_slot()
+            else:
+                browser_slot = min(
+                    self._browser_slots,
+                    key=lambda b: sum(1 for s in self._context_slots if s.browser_slot is b)
+                )
+                in_browser = [s for s in self._context_slots if s.browser_slot is browser_slot]
+                if len(in_browser) >= self.contexts_per_browser:
+                    idle = [s for s in in_browser if not s.leased]
+                    if not idle:
+                        raise RuntimeError("Все контексты пула заняты")
+                    self._drop_context(idle[0])
+
+            with span('context_create'):
+                context = new_stealth_context(browser_slot.browser, **context_options)
+            slot = _ContextSlot(browser_slot, context, proxy_key)
+            slot.leased = True
+            self._context_slots.append(slot)
+            return slot
+
+    def _release(self, slot, failed):
+        with self._lock:
+            slot.leased = False
+            # После ошибки контекст может быть в неизвестном состоянии — пересоздаём
+            if failed or slot.retired or slot.pages_opened >= self.recycle_after_pages:
+                self._drop_context(slot)
+
+    @contextmanager
+    def lease(self, **context_options):
+        """
+        Выдаёт контекст браузера в аренду. proxy ({"server", "username", "password"})
+        выдаёт контекст этого прокси; остальные параметры new_context создают
+        отдельный контекст, который не переиспользуется.
+        """
+        slot = self._acquire(context_options)
+        failed = False
+        try:
+            yield slot.context
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            if set(context_options) - {'proxy'}:
+                failed = True
+            self._release(slot, failed)
+
+    def retire(self, context):
+        """Помечает контекст на пересоздание после возврата (например, после капчи)"""
+        for slot in self._context_slots:
+            if slot.context is context:
+                slot.retired = True
+
+    def close(self):
+        with self._lock:
+            if self._owner_pid != os.getpid():
+                # Пул унаследован через fork — ресурсы принадлежат родителю
+                self._playwright = None
+                return
+            for ctx_slot in self._context_slots:
+                ctx_slot.close()
+            for browser_slot in self._browser_slots:
+                browser_slot.close()
+            self._context_slots = []
+            self._browser_slots = []
+            if self._playwright is not None:
+                try:
+                    self._playwright.stop()
+                except Exception:
+                    pass
+            self._playwright = None
+
+
+_default_pool = None
+
+
+def get_default_pool() -> BrowserPool:
+    """Пул процесса по умолчанию, настраивается переменными окружения BROWSER_POOL_*"""
+    global _default_pool
+    if _default_pool is None or _default_pool._owner_pid not in (None, os.getpid()):
+        _default_pool = BrowserPool(
+            browsers=int(os.getenv('BROWSER_POOL_BROWSERS', '1')),
+            contexts_per_browser=int(os.getenv('BROWSER_POOL_CONTEXTS', '2')),
+            recycle_after_pages=int(os.getenv('BROWSER_POOL_RECYCLE_PAGES', '20')),
+            browser_recycle_after_pages=int(os.getenv('BROWSER_POOL_BROWSER_RECYCLE_PAGES', '200')),
+        )
+    return _default_pool
+
+
+def close_default_pool():
+    global _default_pool
+    if _default_pool is not None:
+        _default_pool.close()
+        _default_pool = None
+
+
+atexit.register(close_default_pool)
@@ -0,0 +1,478 @@
+"""
+card_specs.py — Спецификации полей карточки Яндекс.Карт для dom_extract и сборка результата
+
+Спецификации описывают селекторы и фолбэки всех вкладок карточки, а функции build_*
+превращают сырой результат извлечения в словарь прежнего формата. От API Playwright
+здесь ничего не зависит: parser (sync), async_parser и html_extract только открывают
+вкладки и применяют одни и те же спецификации.
+"""
+import os
+
+from src.network_capture import reviews_from_payloads
+from src.review_delta import AUTHOR_SELECTORS, BLOCK_SELECTOR, TEXT_SELECTOR
+
+PHONE_BUTTON_SELECTORS = [
+    "button:has-text('Показать телефон')",
+    "div.business-contacts-view__phone button",
+    "span:has-text('Показать телефон')",
+    "button[class*='phone']",
+    "[aria-label*='телефон'] button",
+    "div.business-phones-view button"
+]
+
+PHONE_SELECTORS = [
+    "span.business-phones-view__text",
+    "div.business-contacts-view__phone-number span",
+    "div.business-contacts-view__phone span",
+    "span[class*='phone-text']",
+    "span[class*='phone']",
+    "a[href^='tel:']",
+    "div[class*='phone'] span",
+    "[data-bem*='phone'] span",
+    "div.business-contacts-view span[title*='+7']",
+    "span[title^='+7']",
+    "div.business-phones-view span",
+    "span:has-text('+7')",
+    "div:has-text('Показать телефон')"
+]
+
+BUSINESS_CATEGORY_SELECTORS = [
+    "div.business-card-title-view__categories span",
+    "div.business-summary-view__categories span",
+    "span.business-card-title-view__category",
+    "div.card-title-view__categories span",
+    "[class*='business-card'] [class*='categories'] span",
+    "div[class*='category'] span"
+]
+
+RATING_SELECTORS = [
+    "span.business-rating-badge-view__rating-text",
+    "div.business-header-rating-view__rating span",
+    "span[class*='rating-text']",
+    "span.business-summary-rating-badge-view__rating-text"
+]
+
+STOP_FIELDS = {
+    'name': {'selectors': ["div.masstransit-stops-view__stop-name"]},
+    'distance': {'selectors': ["div.masstransit-stops-view__stop-distance-text"]},
+}
+
+OVERVIEW_SPEC = {
+    'title': {'selectors': ["h1.card-title-view__title, h1"]},
+    'address': {'selectors': ["div.business-contacts-view__address", "[class*='business-contacts-view'] [class*='address']"]},
+    'phone': {
+        'selectors': PHONE_SELECTORS,
+        'attr': ['text', 'title'],
+        'match': r'[\d+\-\(\)\s]{7,}',
+        'replace': [r'[^\d+\-\(\)\s]', ''],
+        'min_length': 7,
+    },
+    'nearest_metro': {'selectors': ["div.masstransit-stops-view._type_metro"], 'fields': STOP_FIELDS},
+    'nearest_stop': {'selectors': ["div.masstransit-stops-view._type_masstransit"], 'fields': STOP_FIELDS},
+    'site': {'selectors': ["a.business-urls-view__link"], 'attr': 'href'},
+    'description': {'selectors': ["div.card-about-view__description-text, div[class*='description']"]},
+    'rubric': {'selectors': BUSINESS_CATEGORY_SELECTORS, 'all': True},
+    'rating': {'selectors': RATING_SELECTORS},
+    'ratings_count': {
+        'selectors': ["div.business-header-rating-view__text._clickable, span:has-text('оценок'), span:has-text('оценка')"],
+        'match': r'(\d+)',
+        'group': 1,
+    },
+    'reviews_count': {'selectors': ["div.tabs-select-view__title._name_reviews div.tabs-select-view__counter"]},
+    'reviews_count_header': {'selectors': ["h2.card-section-header__title._wide"], 'match': r'(\d+)', 'group': 1},
+    'hours_rows': {
+        'selectors': ["div.business-working-intervals-view div.business-working-intervals-view__item"],
+        'all': True,
+        'fields': {
+            'day': {'selectors': ["div.business-working-intervals-view__day"]},
+            'interval': {'selectors': ["div.business-working-intervals-view__interval"]},
+        },
+    },
+    'social_links': {
+        'selectors': ["a[href*='vk.com'], a[href*='instagram.com'], a[href*='facebook.com'], a[href*='twitter.com'], a[href*='ok.ru'], a[href*='t.me']"],
+        'attr': 'href',
+        'all': True,
+    },
+}
+
+PRODUCTS_SPEC = {
+    'categories': {
+        'selectors': ['div.business-full-items-grouped-view__category'],
+        'all': True,
+        'fields': {
+            'category': {'selectors': ['div.business-full-items-grouped-view__title']},
+            'items': {
+                'selectors': ['div.business-full-items-grouped-view__item'],
+                'all': True,
+                'fields': {
+                    # Сначала фото-товары, затем текстовые услуги (related-item-list-view)
+                    'name': {'selectors': ['div.related-item-photo-view__title', 'div.related-item-list-view__title']},
+                    'description': {'selectors': ['div.related-item-photo-view__description', 'div.related-item-list-view__subtitle']},
+                    'price': {'selectors': ['span.related-product-view__price', 'div.related-item-list-view__price']},
+                    'duration': {'selectors': ['span.related-product-view__volume']},
+                    'photo': {'selectors': ['img.image__img'], 'attr': 'src'},
+                },
+            },
+        },
+    },
+}
+
+# Вкладки карточки: кнопка вкладки и селектор, появление которого значит «вкладка загрузилась»
+TAB_SELECTORS = {
+    'overview': "div.tabs-select-view__title._name_overview, div[role='tab']:has-text('Обзор'), button:has-text('Обзор')",
+    'products': "div[role='tab']:has-text('Товары и услуги'), button:has-text('Товары и услуги'), div.tabs-select-view__title._name_prices",
+    'reviews': "div.tabs-select-view__title._name_reviews, div[role='tab']:has-text('Отзывы'), button:has-text('Отзывы')",
+    'news': "div.tabs-select-view__title._name_posts, div[role='tab']:has-text('Новости'), button:has-text('Новости')",
+    'photos': "div.tabs-select-view__title._name_gallery, div[role='tab']:has-text('Фото'), button:has-text('Фото')",
+    'features': "div.tabs-select-view__title._name_features, div[role='tab']:has-text('Особенности'), button:has-text('Особенности')",
+}
+TAB_READY_SELECTORS = {
+    'products': "div.business-full-items-grouped-view__category",
+    'reviews': "div.business-review-view",
+    'news': "div.business-posts-list-post-view",
+    'photos': "img.image__img, img[src*='avatars.mds.yandex.net']",
+    'features': "[class*='business-features-view']",
+}
+
+# Загрузка карточки: заголовок или форма капчи
+PAGE_READY_SELECTOR = "h1, form[action*='captcha']"
+CAPTCHA_FORM_SELECTOR = "form[action*='captcha']"
+CAPTCHA_TITLE = "Подтвердите, что запросы отправляли вы"
+
+CONTACTS_SELECTOR = "div.business-contacts-view, div.business-phones-view"
+PHONE_READY_SELECTOR = "span.business-phones-view__text, a[href^='tel:']"
+
+# Сортировка отзывов «По новизне»
+REVIEWS_RANKING_SELECTOR = "div.rating-ranking-view, div[class*='ranking-view']"
+REVIEWS_NEWEST_OPTION = "div.rating-ranking-view__popup-line:has-text('По новизне'), div[role='option']:has-text('По новизне')"
+
+# Кнопки «Посмотреть ответ организации»: раскрываются все разом перед извлечением отзывов
+REPLY_BUTTON_SELECTOR = "div.business-review-view__comment-expand[aria-label='Посмотреть ответ организации']"
+REPLY_SELECTOR = "div.business-review-comment-content__bubble"
+EXPAND_REPLIES_JS = """
+(selector) => {
+    const buttons = Array.from(document.querySelectorAll(selector)).filter(el => el.getClientRects().length > 0);
+    buttons.forEach(el => el.click());
+    return buttons.length;
+}
+"""
+
+REVIEWS_HEADER_SPEC = {
+    'rating': {'selectors': ["span.business-rating-badge-view__rating-text"]},
+    # «1 234 отзыва» → 1234
+    'reviews_count': {
+        'selectors': [
+            "h2.card-section-header__title._wide",
+            "div.business-reviews-card-view__header h2",
+            "h2:has-text('отзыв')",
+            "span.business-rating-badge-view__reviews-count",
+            "div.business-header-rating-view__text._clickable",
+            "div[class*='reviews-count']",
+            "span:has-text('отзыв')",
+            "[class*='rating-badge'] [class*='count']",
+        ],
+        'match': r'\d[\d\s]*',
+        'group': 0,
+        'replace': [r'\D', ''],
+    },
+}
+
+REVIEW_ITEMS_SPEC = {
+    'reviews': {
+        'selectors': [BLOCK_SELECTOR],
+        'all': True,
+        'fields': {
+            'author': {'selectors': AUTHOR_SELECTORS},
+            'date': {'selectors': ["div.business-review-view__date, span.business-review-view__date, span[class*='date']"]},
+            # Оценка: число закрашенных звёзд, иначе meta ratingValue, иначе число в тексте
+            'stars': {
+                'selectors': [
+                    "span.business-rating-view__star._fill",
+                    "span[class*='star-fill']",
+                    "span[class*='rating-star'][class*='fill']",
+                    "div.business-rating-view__stars span._fill",
+                    "span.business-review-view__rating-star._fill",
+                    "div[class*='stars'] span[class*='fill']",
+                    "span[class*='star'][class*='active']",
+                ],
+                'attr': 'class',
+                'all': True,
+            },
+            'rating_meta': {'selectors': ["meta[itemprop='ratingValue']"], 'attr': 'content'},
+            'rating_text': {
+                'selectors': [
+                    "span[class*='rating-text']",
+                    "div[class*='score']",
+                    "div.business-review-view__rating",
+                    "span[class*='review-rating']",
+                ],
+                'match': r'(\d+(?:\.\d+)?)',
+                'group': 1,
+            },
+            'text': {'selectors': [TEXT_SELECTOR]},
+            'org_reply': {'selectors': [REPLY_SELECTOR]},
+        },
+    },
+}
+
+NEWS_SPEC = {
+    'posts': {
+        'selectors': ['div.business-posts-list-post-view'],
+        'all': True,
+        'fields': {
+            'date': {'selectors': ['div.business-posts-list-post-view__date']},
+            'text': {'selectors': ['div.business-posts-list-post-view__text']},
+            'photos': {'selectors': ['img.image__img'], 'attr': 'src', 'all': True},
+        },
+    },
+}
+
+PHOTOS_SPEC = {
+    'photos': {'selectors': [TAB_READY_SELECTORS['photos']], 'attr': 'src', 'all': True},
+}
+
+PHOTOS_COUNT_SPEC = {
+    'photos_count': {'selectors': ["div.tabs-select-view__title._name_gallery div.tabs-select-view__counter"], 'default': '0'},
+}
+
+FEATURES_SPEC = {
+    'bool_items': {
+        'selectors': ["div.business-features-view__bool-item"],
+        'all': True,
+        'fields': {
+            'text': {'selectors': ["div.business-features-view__bool-text"]},
+            'icon_class': {'selectors': ["div.business-features-view__bool-icon"], 'attr': 'class'},
+        },
+    },
+    # Подписи особенностей без обёртки bool-item
+    'bool_texts': {'selectors': ["div.business-features-view__bool-text"], 'all': True},
+    'valued': {
+        'selectors': ["div.business-features-view__valued"],
+        'all': True,
+        'fields': {
+            'title': {'selectors': ["span.business-features-view__valued-title"]},
+            'value': {'selectors': ["span.business-features-view__valued-value"]},
+        },
+    },
+    'categories_block': {
+        'selectors': ["div.orgpage-categories-info-view"],
+        'fields': {'items': {'selectors': ["span.button__text"], 'all': True}},
+    },
+}
+
+COMPETITORS_SPEC = {
+    # «Похожие места рядом»: первый найденный вариант карусели
+    'section': {
+        'selectors': [
+            "div.card-similar-carousel",
+            "div.card-similar-carousel-wide",
+            "div[class*='carousel']",
+            "div[role='presentation'][class*='carousel']",
+        ],
+        'fields': {
+            'links': {
+                'selectors': ["a.link-wrapper"],
+                'all': True,
+                'fields': {
+                    'url': {'self': True, 'attr': 'href'},
+                    'title': {'selectors': ["div.orgpage-similar-item__title"]},
+                    'category': {'selectors': ["div.orgpage-similar-item__rubrics"]},
+                    'rating': {'selectors': ["span.business-rating-badge-view__rating-text, div.business-rating-badge-view__rating-text"]},
+                },
+            },
+        },
+    },
+}
+
+# Поля обзора, которые попадают в data['overview'] для отчёта
+OVERVIEW_KEYS = [
+    'title', 'address', 'phone', 'site', 'description',
+    'rubric', 'categories', 'hours', 'hours_full', 'rating', 'ratings_count', 'reviews_count', 'social_links'
+]
+
+
+def competitors_limit() -> int:
+    """Сколько мест из «Похожие места рядом» возвращать (PARSER_COMPETITORS_LIMIT, по умолчанию 5)"""
+    try:
+        return max(1, int(os.getenv('PARSER_COMPETITORS_LIMIT', '5')))
+    except ValueError:
+        return 5
+
+
+def _stop(value):
+    value = value or {}
+    return {'name': value.get('name', ''), 'distance': value.get('distance', '')}
+
+
+def build_overview(raw: dict) -> dict:
+    """Собирает словарь вкладки «Обзор» в формате parse_overview_data из результата OVERVIEW_SPEC"""
+    data = {
+        'title': raw.get('title', ''),
+        'address': raw.get('address', ''),
+        'phone': raw.get('phone', ''),
+        'nearest_metro': _stop(raw.get('nearest_metro')),
+        'nearest_stop': _stop(raw.get('nearest_stop')),
+        'site': raw.get('site', ''),
+        'description': raw.get('description', ''),
+        'rubric': raw.get('rubric') or [],
+        'categories': [],
+        'rating': (raw.get('rating') or '').replace(',', '.').strip(),
+        'ratings_count': raw.get('ratings_count', ''),
+        'reviews_count': raw.get('reviews_count') or raw.get('reviews_count_header') or '',
+        'social_links': raw.get('social_links') or [],
+    }
+
+    hours_full = []
+    for row in raw.get('hours_rows') or []:
+        day, interval = row.get('day', ''), row.get('interval', '')
+        if day and interval:
+            hours_full.append(f"{day}: {interval}")
+    data['hours_full'] = hours_full
+    # Краткая форма: если все дни одинаковые, выводим "Пн-Вс: 10:00–00:00"
+    if hours_full and len(set([h.split(': ')[1] for h in hours_full])) == 1:
+        data['hours'] = f"Пн-Вс: {hours_full[0].split(': ')[1]}"
+    else:
+        data['hours'] = '; '.join(hours_full)
+    return data
+
+
+def build_products(raw: dict) -> dict:
+    """Собирает products и product_categories из результата PRODUCTS_SPEC"""
+    products = []
+    product_categories = []
+    for cat in raw.get('categories') or []:
+        category = cat.get('category', '')
+        if category:
+            product_categories.append(category)
+        items = [{
+            'name': item.get('name', ''),
+            'description': item.get('description', ''),
+            'price': item.get('price', ''),
+            'duration': item.get('duration', ''),
+            'photo': item.get('photo', ''),
+        } for item in cat.get('items') or []]
+        products.append({'category': category, 'items': items})
+    return {'products': products, 'product_categories': product_categories}
+
+
+def empty_reviews() -> dict:
+    return {"items": [], "rating": "", "reviews_count": ""}
+
+
+def build_reviews_header(raw: dict) -> dict:
+    """Рейтинг и количество отзывов из результата REVIEWS_HEADER_SPEC"""
+    reviews_data = empty_reviews()
+    reviews_data['rating'] = (raw.get('rating') or '').replace(',', '.').strip()
+    reviews_data['reviews_count'] = raw.get('reviews_count') or ''
+    return reviews_data
+
+
+def _review_score(raw: dict) -> int:
+    if raw.get('stars'):
+        return len(raw['stars'])
+    for value in (raw.get('rating_meta'), raw.get('rating_text')):
+        try:
+            score = int(float(value))
+        except (TypeError, ValueError):
+            continue
+        if score:
+            return score
+    return 0
+
+
+def build_review_items(raw: dict, max_reviews: int | None = None) -> list:
+    """Отзывы из DOM (результат REVIEW_ITEMS_SPEC) в формате parse_reviews"""
+    blocks = raw.get('reviews') or []
+    if max_reviews:
+        blocks = blocks[:max_reviews]
+    return [{
+        "author": block.get('author', ''),
+        "date": block.get('date', ''),
+        "score": _review_score(block),
+        "text": block.get('text', ''),
+        "org_reply": block.get('org_reply', ''),
+    } for block in blocks]
+
+
+def apply_captured_reviews(reviews_data: dict, payloads, max_reviews: int | None = None) -> bool:
+    """Переносит в reviews_data отзывы из перехваченных ответов API; False — ответов нет"""
+    captured = reviews_from_payloads(payloads)
+    if not captured['items']:
+        return False
+    reviews_data['items'] = captured['items'][:max_reviews] if max_reviews else captured['items']
+    if not reviews_data['reviews_count']:
+        reviews_data['reviews_count'] = captured['reviews_count']
+    print(f"Отзывы из API: {len(captured['items'])}")
+    return True
+
+
+def build_news(raw: dict) -> list:
+    """Новости из результата NEWS_SPEC"""
+    return [{
+        'date': post.get('date', ''),
+        'text': post.get('text', ''),
+        'photos': post.get('photos') or [],
+    } for post in raw.get('posts') or []]
+
+
+def build_photos(raw: dict) -> list:
+    """Ссылки на фото из результата PHOTOS_SPEC, без повторов"""
+    return list(dict.fromkeys(raw.get('photos') or []))
+
+
+def empty_features() -> dict:
+    return {"bool": [], "valued": [], "prices": [], "categories": []}
+
+
+def build_features(raw: dict) -> dict:
+    """Особенности из результата FEATURES_SPEC в формате features_full"""
+    features_bool = []
+    for item in raw.get('bool_items') or []:
+        if item.get('text'):
+            features_bool.append({"text": item['text'], "defined": '_defined' in (item.get('icon_class') or '')})
+    for text in raw.get('bool_texts') or []:
+        if not any(fb['text'] == text for fb in features_bool):
+            features_bool.append({"text": text, "defined": False})
+
+    features_valued = []
+    for block in raw.get('valued') or []:
+        title = (block.get('title') or '').strip(':').strip()
+        value = block.get('value') or ''
+        if title or value:
+            features_valued.append({"title": title, "value": value})
+    features_prices = [item for item in features_valued if 'цена' in item['title'].lower() or '₽' in item['value']]
+
+    return {
+        "bool": features_bool,
+        "valued": features_valued,
+        "prices": features_prices,
+        "categories": (raw.get('categories_block') or {}).get('items') or [],
+    }
+
+
+def build_competitors(raw: dict, limit: int | None = None) -> list:
+    """Первые limit мест из «Похожие места рядом» (результат COMPETITORS_SPEC)"""
+    competitors = []
+    for link in (raw.get('section') or {}).get('links') or []:
+        url = link.get('url')
+        if url and not url.startswith('http'):
+            url = 'https://yandex.ru' + url
+        if link.get('title') and url:
+            competitors.append({
+                'title': link['title'],
+                'url': url,
+                'category': link.get('category', ''),
+                'rating': link.get('rating', ''),
+            })
+    return competitors[:limit or competitors_limit()]
+
+
+def fill_card(data: dict, tabs: dict) -> dict:
+    """Раскладывает результаты вкладок по полям карточки и собирает data['overview'] для отчёта"""
+    data['reviews'] = tabs['reviews']
+    data['news'] = tabs['news']
+    data['photos'] = tabs['photos']
+    data['features_full'] = tabs['features']
+    data['overview'] = {k: data.get(k, '') for k in OVERVIEW_KEYS}
+    data['overview']['reviews_count'] = data.get('reviews_count', '')
+    return data
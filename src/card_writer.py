@@ -0,0 +1,203 @@
+"""
+card_writer.py — Фоновая запись карточек в Supabase пачками (write-behind)
+
+В пакетном режиме и при обходе конкурентов карточки готовы каждые несколько секунд,
+и запрос на каждую — лишний round-trip. CardWriter складывает строки Cards в
+ограниченную очередь, а фоновый поток отправляет их одним upsert(on_conflict=org_id),
+а отзывы карточек — одной вставкой в Reviews: когда набралось batch_size карточек или
+прошло flush_interval секунд с первой карточки пачки. Если база не успевает, add() ждёт
+места в очереди — память не растёт.
+
+Время каждой пачки попадает в метрики (supabase, op=upsert_cards) и в stats().
+Буфер выгружается при close() и при завершении процесса (atexit). add() возвращает
+Future, который завершается после записи пачки (или с её ошибкой; для карточки без
+org_id — сразу с ValueError, такие строки upsert_cards не пишет): пакетный режим
+отмечает карточку выгруженной только по нему, поэтому пачку, потерянную при ошибке
+базы или аварийном завершении процесса, выгрузит resume.
+
+Размеры задаются переменными CARD_WRITER_BATCH, CARD_WRITER_INTERVAL (секунды)
+и CARD_WRITER_MAX_PENDING.
+"""
+from concurrent.futures import Future
+import atexit
+import os
+import queue
+import threading
+import time
+
+from src.save_to_supabase import card_row, get_client, insert_reviews, review_rows, upsert_cards
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_MAX_PENDING = 500
+
+# Сообщения фоновому потоку: (вид, данные)
+_CARD = 'card'
+_FLUSH = 'flush'
+_STOP = 'stop'
+
+
+def _env_number(name, default, cast=float):
+    try:
+        return cast(os.getenv(name, default))
+    except (TypeError, ValueError):
+        print(f"Некорректное значение {name}: {os.getenv(name)}")
+        return default
+
+
+class CardWriter:
+    """Буфер строк Cards с фоновой пакетной выгрузкой"""
+
+    def __init__(self, batch_size: int | None = None, flush_interval: float | None = None,
+                 max_pending: int | None = None, write=upsert_cards, write_reviews=insert_reviews):
+        self.batch_size = max(1, batch_size or _env_number('CARD_WRITER_BATCH', DEFAULT_BATCH_SIZE, int))
+        self.flush_interval = flush_interval or _env_number('CARD_WRITER_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+        max_pending = max_pending or _env_number('CARD_WRITER_MAX_PENDING', DEFAULT_MAX_PENDING, int)
+        self._write = write
+        self._write_reviews = write_reviews
+        self._queue = queue.Queue(maxsize=max(self.batch_size, max_pending))
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.batches = 0
+        self.rows = 0
+        self.failed_rows = 0
+        self.reviews = 0
+        self.latencies = []
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='card-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def add(self, card_data: dict, main_card_url: str | None = None) -> Future:
+        """
+        Ставит карточку в очередь на запись; ждёт, если очередь заполнена.
+        Возвращает Future: результат — True после записи пачки, исключение — если она не записалась.
+        Карточку без id организации upsert_cards не пишет, поэтому она в очередь не попадает,
+        а Future сразу завершается с ValueError.
+        """
+        if self._closed:
+            raise RuntimeError("CardWriter уже закрыт")
+        written = Future()
+        row = card_row(card_data, main_card_url=main_card_url)
+        if not row.get('org_id'):
+            self.failed_rows += 1
+            written.set_exception(ValueError(f"нет id организации в ссылке: {row.get('url')}"))
+            return written
+        self._start()
+        self._queue.put((_CARD, (row, review_rows(card_data), written)))
+        return written
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Отправляет всё накопленное и ждёт окончания записи"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def close(self, timeout: float | None = None):
+        """Выгружает буфер и останавливает фоновый поток"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is None:
+            return
+        atexit.unregister(self.close)
+        self._queue.put((_STOP, None))
+        self._thread.join(timeout)
+        if self.batches:
+            stats = self.stats()
+            print(f"Запись карточек: {stats['rows']} строк и {stats['reviews']} отзывов в {stats['batches']} пачках, "
+                  f"в среднем {stats['avg_batch_sec']} с на пачку, ошибок {stats['failed_rows']}")
+
+    def _run(self):
+        # Строки копятся по org_id: две версии одной карточки в одном upsert база не примет
+        buffer = {}
+        reviews = []
+        futures = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                kind, payload = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                kind, payload = None, None
+            if kind == _CARD:
+                row, review_items, written = payload
+                buffer[row['org_id']] = row
+                reviews.extend(review_items)
+                futures.append(written)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(buffer) < self.batch_size:
+                    continue
+            if buffer:
+                self._flush_rows(list(buffer.values()), reviews, futures)
+                buffer = {}
+                reviews = []
+                futures = []
+            deadline = None
+            if kind in (_FLUSH, _STOP) and payload is not None:
+                payload.set()
+            if kind == _STOP:
+                return
+
+    def _flush_rows(self, rows: list, reviews: list, futures: list):
+        started = time.perf_counter()
+        try:
+            self._write(rows)
+            # Отзывы после карточек: без строки Cards они никому не нужны
+            self._write_reviews(reviews)
+        except Exception as e:
+            self.failed_rows += len(rows)
+            print(f"Ошибка при записи пачки карточек ({len(rows)} шт.): {type(e).__name__}: {e}")
+            for written in futures:
+                written.set_exception(e)
+            return
+        for written in futures:
+            written.set_result(True)
+        elapsed = time.perf_counter() - started
+        self.batches += 1
+        self.rows += len(rows)
+        self.reviews += len(reviews)
+        self.latencies.append(elapsed)
+        print(f"Сохранено карточек: {len(rows)}, отзывов: {len(reviews)} за {elapsed:.2f} с")
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            'batches': self.batches,
+            'rows': self.rows,
+            'failed_rows': self.failed_rows,
+            'reviews': self.reviews,
+            'pending': self._queue.qsize(),
+            'avg_batch_sec': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            'max_batch_sec': round(latencies[-1], 3) if latencies else 0.0,
+        }
+
+
+_default_writer = None
+_default_writer_lock = threading.Lock()
+
+
+def get_card_writer() -> CardWriter | None:
+    """Общий писатель процесса; None, если Supabase не настроен"""
+    global _default_writer
+    if get_client() is None:
+        return None
+    with _default_writer_lock:
+        if _default_writer is None or _default_writer._closed:
+            _default_writer = CardWriter()
+        return _default_writer
+
+
+def close_card_writer():
+    """Выгружает и закрывает общий писатель, если он создавался"""
+    with _default_writer_lock:
+        writer = _default_writer
+    if writer is not None:
+        writer.close()
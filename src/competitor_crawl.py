@@ -0,0 +1,171 @@
+"""
+competitor_crawl.py — Обход графа конкурентов от стартовых карточек
+
+Из каждой спарсенной карточки берутся «Похожие места рядом», и они становятся
+следующим уровнем обхода — так за один проход строится карта рынка района.
+Обход идёт в ширину до глубины max_depth; внутри уровня первыми парсятся самые
+перспективные места: выше рейтинг, та же рубрика, что у стартовой карточки, и
+ближе к началу карусели (Яндекс ставит туда ближайшие места — расстояния
+в карусели нет). Организация парсится не больше одного раза (ключ — id
+организации), всего — не больше budget карточек.
+
+Карточки раздаёт batch.run_batch тем же пулом процессов, ограничителем частоты и
+пулом прокси, что и в пакетном режиме: следующие ссылки подаются через feed,
+когда у воркеров освобождается место, поэтому приоритет учитывает всё, что уже найдено.
+"""
+import heapq
+import itertools
+import json
+import os
+
+from src.batch import run_batch, dedup_urls
+from src.job_queue import JobQueue
+from src.yandex_urls import extract_org_id, normalize_card_url
+
+# Веса оценки кандидата: рейтинг, совпадение рубрики, позиция в карусели
+RATING_WEIGHT = 0.5
+CATEGORY_WEIGHT = 0.3
+POSITION_WEIGHT = 0.2
+
+
+def _rating(value) -> float:
+    try:
+        return float(str(value or '').replace(',', '.').strip() or 0)
+    except ValueError:
+        return 0.0
+
+
+def _categories(card_data: dict) -> set:
+    rubric = card_data.get('rubric') or (card_data.get('overview') or {}).get('rubric') or []
+    if isinstance(rubric, str):
+        rubric = [rubric]
+    return {str(item).strip().lower() for item in rubric if item}
+
+
+def candidate_score(competitor: dict, categories: set, position: int) -> float:
+    """Оценка места из карусели: чем больше, тем раньше оно будет спарсено"""
+    rating = min(_rating(competitor.get('rating')), 5.0) / 5.0
+    category = (competitor.get('category') or '').strip().lower()
+    match = 1.0 if category and any(category in c or c in category for c in categories) else 0.0
+    nearness = 1.0 / (1 + position)
+    return RATING_WEIGHT * rating + CATEGORY_WEIGHT * match + POSITION_WEIGHT * nearness
+
+
+class CompetitorCrawl:
+    """
+    Состояние обхода: приоритетная граница (depth, -score), множество найденных
+    организаций и граф {nodes, edges}. seeds — стартовые ссылки (глубина 0).
+    """
+
+    def __init__(self, seeds, max_depth: int = 2, budget: int = 50):
+        self.max_depth = max(0, max_depth)
+        self.budget = max(1, budget)
+        self.nodes = {}
+        self.edges = []
+        self.scheduled = 0
+        self._frontier = []
+        self._seq = itertools.count()
+        self._by_url = {}
+        for url in dedup_urls(seeds):
+            self._discover(url, depth=0, score=1.0, parent=None, info={})
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return extract_org_id(url) or url
+
+    def _discover(self, url: str, depth: int, score: float, parent, info: dict, categories: set | None = None):
+        key = self._key(url)
+        if parent is not None:
+            self.edges.append([parent, key])
+        if key in self.nodes:
+            return
+        self.nodes[key] = {
+            'url': url,
+            'title': info.get('title', ''),
+            'category': info.get('category', ''),
+            'rating': info.get('rating', ''),
+            'depth': depth,
+            'parent': parent,
+            'score': round(score, 3),
+            'status': 'discovered',
+            'categories': sorted(categories or []),
+        }
+        if depth <= self.max_depth:
+            heapq.heappush(self._frontier, (depth, -score, next(self._seq), key))
+
+    def feed(self, limit: int) -> list:
+        """Следующие ссылки для run_batch: лучшие из границы, пока не исчерпан бюджет"""
+        urls = []
+        while self._frontier and len(urls) < limit and self.scheduled < self.budget:
+            _, _, _, key = heapq.heappop(self._frontier)
+            node = self.nodes[key]
+            node['status'] = 'queued'
+            self._by_url[node['url']] = key
+            self.scheduled += 1
+            urls.append(node['url'])
+        return urls
+
+    def on_result(self, result: dict):
+        """Отмечает карточку в графе и кладёт её конкурентов в границу"""
+        key = self._by_url.get(result.get('url')) or self._key(result.get('url', ''))
+        node = self.nodes.get(key)
+        if node is None:
+            return
+        data = result.get('data') or {}
+        if result.get('error') or data.get('error'):
+            node['status'] = 'failed'
+            node['error'] = result.get('error') or data.get('error')
+            return
+        node['status'] = 'parsed'
+        node['title'] = data.get('title') or node['title']
+        node['rating'] = data.get('rating') or node['rating']
+        # Рубрика стартовой карточки задаёт «рынок» для всего поддерева
+        categories = set(node['categories']) or _categories(data)
+        node['categories'] = sorted(categories)
+        for position, competitor in enumerate(data.get('competitors') or []):
+            if not isinstance(competitor, dict) or not competitor.get('url'):
+                continue
+            score = candidate_score(competitor, categories, position)
+            self._discover(normalize_card_url(competitor['url']), node['depth'] + 1, score, key, competitor, categories)
+
+    def graph(self) -> dict:
+        nodes = {key: {k: v for k, v in node.items() if k != 'categories'} for key, node in self.nodes.items()}
+        return {'nodes': nodes, 'edges': self.edges}
+
+    def stats(self) -> dict:
+        statuses = {}
+        for node in self.nodes.values():
+            statuses[node['status']] = statuses.get(node['status'], 0) + 1
+        return {'nodes': len(self.nodes), 'edges': len(self.edges), 'scheduled': self.scheduled, **statuses}
+
+
+def crawl_competitors(seeds, max_depth: int = 2, budget: int = 50, workers: int = 2, on_result=None,
+                      queue: JobQueue | None = None, graph_path: str | None = None) -> dict:
+    """
+    Обходит граф конкурентов пулом процессов batch.run_batch. on_result(result)
+    вызывается для каждой карточки (после того как обход забрал из неё конкурентов).
+    Возвращает {"summary", "graph"}; graph_path — куда сохранить граф в JSON.
+    """
+    crawl = CompetitorCrawl(seeds, max_depth=max_depth, budget=budget)
+    if not crawl.nodes:
+        print("Нет стартовых ссылок для обхода.")
+        return {'summary': {}, 'graph': crawl.graph()}
+    print(f"Обход конкурентов: стартовых карточек {len(crawl.nodes)}, глубина {crawl.max_depth}, бюджет {crawl.budget}")
+
+    def handle(result):
+        crawl.on_result(result)
+        if on_result:
+            return on_result(result)
+
+    summary = run_batch([], workers=workers, on_result=handle, queue=queue or JobQueue(':memory:', max_attempts=2), feed=crawl.feed)
+    summary['crawl'] = crawl.stats()
+    graph = crawl.graph()
+    print(f"Карта рынка: организаций {summary['crawl']['nodes']}, связей {summary['crawl']['edges']}, "
+          f"спарсено {summary['crawl'].get('parsed', 0)}, ошибок {summary['crawl'].get('failed', 0)}")
+    if graph_path:
+        if os.path.dirname(graph_path):
+            os.makedirs(os.path.dirname(graph_path), exist_ok=True)
+        with open(graph_path, 'w', encoding='utf-8') as f:
+            json.dump(graph, f, ensure_ascii=False, indent=2)
+        print(f"Граф конкурентов сохранён: {graph_path}")
+    return {'summary': summary, 'graph': graph}
@@ -0,0 +1,174 @@
+"""
+dom_extract.py — Извлечение данных со страницы за один page.evaluate по декларативной спецификации
+
+Каждый query_selector / inner_text / get_attribute — отдельный round-trip в браузер.
+Здесь вся спецификация полей передаётся в страницу целиком, а обратно приходит
+готовая структура. Спецификация — словарь {имя_поля: описание}, где описание:
+
+    selectors  — список селекторов-фолбэков, первый давший непустой результат побеждает
+                 (поддерживается псевдокласс Playwright :has-text('...'))
+    attr       — 'text' (по умолчанию), имя атрибута или список вариантов по порядку
+    all        — собрать значения/объекты со всех элементов, а не с первого
+    match      — регулярное выражение, которому должно соответствовать значение
+    group      — номер группы match, которая станет значением
+    replace    — [pattern, repl]: глобальная замена после проверки match
+    min_length — минимальная длина значения после replace
+    fields     — вложенная спецификация, применяется к каждому найденному элементу
+    self       — значение берётся с самого элемента (внутри fields), selectors не нужны
+    default    — значение, если ничего не найдено
+"""
+
+ENGINE_JS = """
+(spec) => {
+    const splitSelectors = (selector) => {
+        const parts = [];
+        let depth = 0, quote = null, current = '';
+        for (const ch of selector) {
+            if (quote) {
+                if (ch === quote) quote = null;
+            } else if (ch === '"' || ch === "'") {
+                quote = ch;
+            } else if (ch === '(' || ch === '[') {
+                depth++;
+            } else if (ch === ')' || ch === ']') {
+                depth--;
+            } else if (ch === ',' && depth === 0) {
+                parts.push(current.trim());
+                current = '';
+                continue;
+            }
+            current += ch;
+        }
+        if (current.trim()) parts.push(current.trim());
+        return parts;
+    };
+
+    const queryAll = (root, selector) => {
+        const found = [];
+        for (const part of splitSelectors(selector)) {
+            const m = part.match(/^(.*?):has-text\\((['"])(.*)\\2\\)\\s*$/);
+            let els = [];
+            try {
+                if (m) {
+                    const needle = m[3].toLowerCase();
+                    els = Array.from(root.querySelectorAll(m[1] || '*'))
+                        .filter(el => (el.innerText || el.textContent || '').toLowerCase().includes(needle));
+                } else {
+                    els = Array.from(root.querySelectorAll(part));
+                }
+            } catch (e) {
+                els = [];
+            }
+            for (const el of els) if (!found.includes(el)) found.push(el);
+        }
+        found.sort((a, b) => a === b ? 0 : (a.compareDocumentPosition(b) & Node.DOCUMENT_POSITION_FOLLOWING ? -1 : 1));
+        return found;
+    };
+
+    const read = (el, attr) => {
+        if (attr === 'text') return (el.innerText || el.textContent || '').trim();
+        return (el.getAttribute(attr) || '').trim();
+    };
+
+    const refine = (value, field) => {
+        if (!value) return '';
+        if (field.match) {
+            const m = new RegExp(field.match).exec(value);
+            if (!m) return '';
+            if (field.group !== undefined && field.group !== null) value = m[field.group] || '';
+        }
+        if (field.replace) value = value.replace(new RegExp(field.replace[0], 'g'), field.replace[1]).trim();
+        if (field.min_length && value.length < field.min_length) return '';
+        return value;
+    };
+
+    const valueOf = (el, field) => {
+        const attrs = Array.isArray(field.attr) ? field.attr : [field.attr || 'text'];
+        for (const attr of attrs) {
+            const value = refine(read(el, attr), field);
+            if (value) return value;
+        }
+        return '';
+    };
+
+    const extractField = (root, field) => {
+        const fallback = field.default !== undefined ? field.default : (field.all ? [] : (field.fields ? null : ''));
+        if (field.self) return valueOf(root, field) || fallback;
+        for (const selector of field.selectors || []) {
+            const els = queryAll(root, selector);
+            if (!els.length) continue;
+            if (field.fields) {
+                if (field.all) return els.map(el => extractSpec(el, field.fields));
+                return extractSpec(els[0], field.fields);
+            }
+            if (field.all) {
+                const values = els.map(el => valueOf(el, field)).filter(v => v);
+                if (values.length) return values;
+                continue;
+            }
+            for (const el of els) {
+                const value = valueOf(el, field);
+                if (value) return value;
+            }
+        }
+        return fallback;
+    };
+
+    const extractSpec = (root, fields) => {
+        const result = {};
+        for (const [name, field] of Object.entries(fields)) result[name] = extractField(root, field);
+        return result;
+    };
+
+    return extractSpec(document, spec);
+}
+"""
+
+# Помечает первый видимый элемент из списка селекторов атрибутом-маркером
+MARK_VISIBLE_JS = """
+({selectors, marker}) => {
+    document.querySelectorAll(`[${marker}]`).forEach(el => el.removeAttribute(marker));
+    for (const selector of selectors) {
+        const m = selector.match(/^(.*?):has-text\\((['"])(.*)\\2\\)\\s*$/);
+        let els = [];
+        try {
+            els = m
+                ? Array.from(document.querySelectorAll(m[1] || '*')).filter(el => (el.innerText || '').toLowerCase().includes(m[3].toLowerCase()))
+                : Array.from(document.querySelectorAll(selector));
+        } catch (e) {
+            continue;
+        }
+        const el = els.find(el => el.getClientRects().length > 0);
+        if (el) {
+            el.setAttribute(marker, '1');
+            return selector;
+        }
+    }
+    return null;
+}
+"""
+
+
+def extract(page, spec: dict) -> dict:
+    """Применяет спецификацию к странице за один page.evaluate"""
+    return page.evaluate(ENGINE_JS, spec)
+
+
+async def aextract(page, spec: dict) -> dict:
+    """То же, что extract, для async API"""
+    return await page.evaluate(ENGINE_JS, spec)
+
+
+def mark_first_visible(page, selectors, marker: str = 'data-parser-target'):
+    """Находит первый видимый элемент по списку селекторов и помечает его marker. Возвращает селектор или None"""
+    try:
+        return page.evaluate(MARK_VISIBLE_JS, {'selectors': list(selectors), 'marker': marker})
+    except Exception:
+        return None
+
+
+async def amark_first_visible(page, selectors, marker: str = 'data-parser-target'):
+    try:
+        return await page.evaluate(MARK_VISIBLE_JS, {'selectors': list(selectors), 'marker': marker})
+    except Exception:
+        return None
@@ -0,0 +1,322 @@
+"""
+html_extract.py — Извлечение данных карточки из сохранённого HTML без браузера
+
+Снимок страницы (page.content()) разбирается lxml, а поля достаются теми же
+спецификациями card_specs, что и в браузере (dom_extract), — CSS-селекторы
+выполняет cssselect, псевдокласс Playwright :has-text('...') разбирается здесь.
+Результат совпадает по формату с parse_overview_data, parse_features и
+parse_competitors, поэтому после смены схемы или селекторов тысячи сохранённых
+снимков переразбираются пулом процессов без запуска браузеров:
+
+    python -m src.html_extract snapshots/*.html --workers 8 --out cards.jsonl
+    python -m src.html_extract --archive data/snapshots --out cards.jsonl
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from lxml import etree, html as lxml_html
+from lxml.cssselect import CSSSelector, SelectorError
+
+from src.card_specs import OVERVIEW_SPEC, PRODUCTS_SPEC, FEATURES_SPEC, COMPETITORS_SPEC, OVERVIEW_KEYS, build_overview, build_products, build_features, build_competitors
+from src.snapshot_archive import SnapshotArchive, read_compressed
+
+HAS_TEXT_RE = re.compile(r"^(.*?):has-text\((['\"])(.*)\2\)\s*$")
+
+# Содержимое этих тегов не видно в innerText
+INVISIBLE_TAGS = ('script', 'style', 'noscript', 'template')
+
+
+class HtmlDocument:
+    """Разобранный снимок страницы; порядок элементов в документе считается по требованию"""
+
+    def __init__(self, content: str | bytes):
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        try:
+            self.root = lxml_html.document_fromstring(content, parser=lxml_html.HTMLParser(encoding='utf-8'))
+        except (etree.ParserError, ValueError):
+            self.root = lxml_html.document_fromstring(b'<html><body></body></html>')
+        for el in list(self.root.iter(*INVISIBLE_TAGS)):
+            el.drop_tree()
+        self._order = None
+
+    def order(self, el) -> int:
+        if self._order is None:
+            self._order = {node: i for i, node in enumerate(self.root.iter())}
+        return self._order.get(el, 0)
+
+
+@lru_cache(maxsize=None)
+def _split_selectors(selector: str) -> tuple:
+    """Делит список селекторов по запятым верхнего уровня (как splitSelectors в dom_extract)"""
+    parts = []
+    depth, quote, current = 0, None, ''
+    for ch in selector:
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ('"', "'"):
+            quote = ch
+        elif ch in '([':
+            depth += 1
+        elif ch in ')]':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+            continue
+        current += ch
+    if current.strip():
+        parts.append(current.strip())
+    return tuple(parts)
+
+
+@lru_cache(maxsize=None)
+def _compile(selector: str):
+    try:
+        return CSSSelector(selector)
+    except SelectorError:
+        return None
+
+
+def inner_text(el) -> str:
+    """Приближение innerText: текст элемента с потомками, пробелы схлопнуты"""
+    return re.sub(r'\s+', ' ', el.text_content() or '').strip()
+
+
+def query_all(doc: HtmlDocument, root, selector: str) -> list:
+    """Элементы внутри root по селектору с фолбэками через запятую, в порядке документа"""
+    found = []
+    seen = set()
+    parts = _split_selectors(selector)
+    for part in parts:
+        m = HAS_TEXT_RE.match(part)
+        compiled = _compile((m.group(1) or '*') if m else part)
+        if compiled is None:
+            continue
+        els = [el for el in compiled(root) if el is not root]
+        if m:
+            needle = m.group(3).lower()
+            els = [el for el in els if needle in inner_text(el).lower()]
+        for el in els:
+            if el not in seen:
+                seen.add(el)
+                found.append(el)
+    if len(parts) > 1 and len(found) > 1:
+        found.sort(key=doc.order)
+    return found
+
+
+def query(doc: HtmlDocument, root, selector: str):
+    found = query_all(doc, root, selector)
+    return found[0] if found else None
+
+
+def _read(el, attr: str) -> str:
+    if attr == 'text':
+        return inner_text(el)
+    return (el.get(attr) or '').strip()
+
+
+def _refine(value: str, field: dict) -> str:
+    if not value:
+        return ''
+    if field.get('match'):
+        m = re.search(field['match'], value)
+        if not m:
+            return ''
+        if field.get('group') is not None:
+            value = m.group(field['group']) or ''
+    if field.get('replace'):
+        value = re.sub(field['replace'][0], field['replace'][1], value).strip()
+    if field.get('min_length') and len(value) < field['min_length']:
+        return ''
+    return value
+
+
+def _value_of(el, field: dict) -> str:
+    attrs = field.get('attr') or 'text'
+    for attr in attrs if isinstance(attrs, list) else [attrs]:
+        value = _refine(_read(el, attr), field)
+        if value:
+            return value
+    return ''
+
+
+def _extract_field(doc: HtmlDocument, root, field: dict):
+    if 'default' in field:
+        fallback = field['default']
+    else:
+        fallback = [] if field.get('all') else (None if field.get('fields') else '')
+    if field.get('self'):
+        return _value_of(root, field) or fallback
+    for selector in field.get('selectors') or []:
+        els = query_all(doc, root, selector)
+        if not els:
+            continue
+        if field.get('fields'):
+            if field.get('all'):
+                return [_extract_spec(doc, el, field['fields']) for el in els]
+            return _extract_spec(doc, els[0], field['fields'])
+        if field.get('all'):
+            values = [v for v in (_value_of(el, field) for el in els) if v]
+            if values:
+                return values
+            continue
+        for el in els:
+            value = _value_of(el, field)
+            if value:
+                return value
+    return fallback
+
+
+def _extract_spec(doc: HtmlDocument, root, fields: dict) -> dict:
+    return {name: _extract_field(doc, root, field) for name, field in fields.items()}
+
+
+def extract_html(doc: HtmlDocument, spec: dict) -> dict:
+    """Применяет спецификацию dom_extract к снимку — тот же результат, что extract(page, spec)"""
+    return _extract_spec(doc, doc.root, spec)
+
+
+def _document(content) -> HtmlDocument:
+    return content if isinstance(content, HtmlDocument) else HtmlDocument(content)
+
+
+def parse_overview_html(content) -> dict:
+    """Аналог parse_overview_data: поля обзора, товары и услуги"""
+    doc = _document(content)
+    data = build_overview(extract_html(doc, OVERVIEW_SPEC))
+    data.update(build_products(extract_html(doc, PRODUCTS_SPEC)))
+    return data
+
+
+def parse_features_html(content) -> dict:
+    """Аналог parse_features"""
+    return build_features(extract_html(_document(content), FEATURES_SPEC))
+
+
+def parse_competitors_html(content, limit: int | None = None) -> list:
+    """Аналог parse_competitors: первые limit мест из «Похожие места рядом»"""
+    return build_competitors(extract_html(_document(content), COMPETITORS_SPEC), limit)
+
+
+def parse_card_html(content, url: str = '') -> dict:
+    """Обзор, особенности и конкуренты из одного снимка в формате parse_yandex_card"""
+    doc = _document(content)
+    data = parse_overview_html(doc)
+    data['url'] = url
+    data['features_full'] = parse_features_html(doc)
+    data['competitors'] = parse_competitors_html(doc)
+    data['overview'] = {k: data.get(k, '') for k in OVERVIEW_KEYS}
+    return data
+
+
+def read_snapshot(path: str) -> bytes:
+    """Читает снимок с диска (.zst и .gz распаковываются)"""
+    return read_compressed(path)
+
+
+def _parse_file(path: str):
+    try:
+        return path, parse_card_html(read_snapshot(path)), None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+def _parse_archived_card(item: dict):
+    """Карточка из архива: обзор, особенности и конкуренты — каждый из снимка своей вкладки"""
+    try:
+        tabs = item['tabs']
+        overview = HtmlDocument(read_snapshot(tabs['overview'])) if 'overview' in tabs else HtmlDocument(b'')
+        data = parse_overview_html(overview)
+        data['url'] = item['url']
+        data['features_full'] = parse_features_html(HtmlDocument(read_snapshot(tabs['features'])) if 'features' in tabs else overview)
+        data['competitors'] = parse_competitors_html(HtmlDocument(read_snapshot(tabs['competitors'])) if 'competitors' in tabs else overview)
+        data['overview'] = {k: data.get(k, '') for k in OVERVIEW_KEYS}
+        data['snapshot_ts'] = item['ts']
+        return item['org_id'], data, None
+    except Exception as e:
+        return item['org_id'], None, f"{type(e).__name__}: {e}"
+
+
+def _map(func, items, workers: int | None, chunksize: int):
+    items = list(items)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(items) < 2:
+        for item in items:
+            yield func(item)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(func, items, chunksize=chunksize)
+
+
+def reparse_files(paths, workers: int | None = None, chunksize: int = 32):
+    """
+    Разбирает снимки пулом процессов, отдаёт (path, data, error) по мере готовности
+    в порядке paths. Браузер не нужен, поэтому воркеров можно ставить по числу ядер.
+    """
+    yield from _map(_parse_file, paths, workers, chunksize)
+
+
+def _archive_cards(archive: SnapshotArchive, org_id: str | None = None):
+    """Последние снимки вкладок каждой организации архива: {"org_id", "url", "ts", "tabs"}"""
+    for org in [org_id] if org_id else archive.org_ids():
+        snapshots = list(archive.iter_snapshots(org_id=org, latest=True))
+        if snapshots:
+            yield {
+                'org_id': org,
+                'url': snapshots[-1].url,
+                'ts': max(s.ts for s in snapshots),
+                'tabs': {s.tab: s.path for s in snapshots},
+            }
+
+
+def reparse_archive(archive: SnapshotArchive, workers: int | None = None, org_id: str | None = None, chunksize: int = 8):
+    """Переразбирает последние снимки организаций из архива, отдаёт (org_id, data, error)"""
+    yield from _map(_parse_archived_card, _archive_cards(archive, org_id), workers, chunksize)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Переразбор сохранённых HTML-снимков карточек без браузера')
+    parser.add_argument('paths', nargs='*', help='файлы снимков (.html, .html.gz или .html.zst)')
+    parser.add_argument('--archive', metavar='DIR', help='архив снимков (snapshot_archive) вместо отдельных файлов')
+    parser.add_argument('--org', help='только эта организация из архива')
+    parser.add_argument('--workers', type=int, default=None, help='процессов (по умолчанию — по числу ядер)')
+    parser.add_argument('--out', metavar='FILE', help='записать результаты в JSONL (по умолчанию — stdout)')
+    args = parser.parse_args(argv)
+    if not args.paths and not args.archive:
+        parser.error('укажите файлы снимков или --archive')
+
+    if args.archive:
+        results, key = reparse_archive(SnapshotArchive(args.archive), args.workers, args.org), 'org_id'
+    else:
+        results, key = reparse_files(args.paths, args.workers), 'path'
+
+    started = time.perf_counter()
+    done = failed = 0
+    out = open(args.out, 'w', encoding='utf-8') if args.out else sys.stdout
+    try:
+        for name, data, error in results:
+            if error:
+                failed += 1
+                print(f"Не удалось разобрать {name}: {error}", file=sys.stderr)
+                continue
+            done += 1
+            out.write(json.dumps({key: name, 'data': data}, ensure_ascii=False) + '\n')
+    finally:
+        if args.out:
+            out.close()
+    elapsed = time.perf_counter() - started
+    print(f"Разобрано карточек: {done}, ошибок: {failed}, {done / elapsed if elapsed else 0:.0f} стр./с", file=sys.stderr)
+    return 1 if failed and not done else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+job_queue.py — Персистентная очередь задач пакетного парсинга на SQLite
+
+Каждая ссылка пакета — строка таблицы jobs со статусом pending → in_flight → done
+(или failed после исчерпания попыток). Задача берётся в работу с арендой (lease):
+если процесс упал, не вернув результат, аренда истекает и задача снова доступна.
+Результат карточки записывается в той же транзакции, что и статус done, поэтому
+после падения (OOM, штормом капч) готовые карточки не парсятся повторно, а команда
+resume продолжает пакет с места остановки.
+"""
+from datetime import datetime, timezone
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_QUEUE_PATH = os.path.join('data', 'jobs.sqlite3')
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    url TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    lease_until REAL,
+    worker TEXT,
+    last_error TEXT,
+    result TEXT,
+    exported INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, not_before, position);
+"""
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class JobQueue:
+    """
+    Очередь задач в файле SQLite (':memory:' — без сохранения на диск).
+    max_attempts — сколько раз карточка пробуется до статуса failed,
+    retry_delay — пауза перед повтором, секунды (растёт с номером попытки).
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, max_attempts: int = 3, lease_sec: int = 900, retry_delay: float = 30.0):
+        self.path = path
+        self.max_attempts = max(1, max_attempts)
+        self.lease_sec = lease_sec
+        self.retry_delay = retry_delay
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # isolation_level=None: транзакции открываем явно через BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+    def _transaction(self):
+        return _Transaction(self.conn)
+
+    def add(self, urls, reset: bool = True) -> int:
+        """
+        Ставит ссылки в очередь. reset=True начинает их заново (новый прогон пакета),
+        reset=False оставляет уже известные задачи в их текущем состоянии.
+        Возвращает количество поставленных (или перезапущенных) задач.
+        """
+        added = 0
+        with self._transaction() as conn:
+            position = conn.execute("SELECT COALESCE(MAX(position), 0) FROM jobs").fetchone()[0]
+            for url in urls:
+                position += 1
+                if reset:
+                    cursor = conn.execute(
+                        "INSERT INTO jobs (url, position, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(url) DO UPDATE SET status='pending', attempts=0, not_before=0, "
+                        "lease_until=NULL, worker=NULL, last_error=NULL, result=NULL, exported=0, "
+                        "position=excluded.position, updated_at=excluded.updated_at",
+                        (url, position, _now_iso()))
+                else:
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO jobs (url, position, updated_at) VALUES (?, ?, ?)",
+                        (url, position, _now_iso()))
+                added += cursor.rowcount
+        return added
+
+    def lease(self, worker: str = '') -> str | None:
+        """Берёт в работу следующую доступную задачу (включая задачи с истёкшей арендой)"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT url FROM jobs WHERE (status='pending' AND not_before <= ?) "
+                "OR (status='in_flight' AND lease_until < ?) ORDER BY position LIMIT 1",
+                (now, now)).fetchone()
+            if not row:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status='in_flight', attempts=attempts+1, lease_until=?, worker=?, updated_at=? WHERE url=?",
+                (now + self.lease_sec, worker, _now_iso(), row['url']))
+            return row['url']
+
+    def complete(self, url: str, result) -> None:
+        """Атомарно сохраняет результат карточки и помечает задачу выполненной"""
+        payload = json.dumps(result, ensure_ascii=False, default=str)
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status='done', result=?, last_error=NULL, lease_until=NULL, exported=0, updated_at=? WHERE url=?",
+                (payload, _now_iso(), url))
+
+    def fail(self, url: str, error: str, retry: bool = True) -> bool:
+        """
+        Отмечает неудачную попытку. Если попытки не исчерпаны (и retry=True), задача
+        возвращается в pending с отсрочкой. Возвращает True, если задача будет повторена.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT attempts FROM jobs WHERE url=?", (url,)).fetchone()
+            attempts = row['attempts'] if row else self.max_attempts
+            if retry and attempts < self.max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status='pending', not_before=?, lease_until=NULL, last_error=?, updated_at=? WHERE url=?",
+                    (time.time() + self.retry_delay * attempts, str(error), _now_iso(), url))
+                return True
+            conn.execute(
+                "UPDATE jobs SET status='failed', lease_until=NULL, last_error=?, updated_at=? WHERE url=?",
+                (str(error), _now_iso(), url))
+            return False
+
+    def release(self, url: str) -> None:
+        """Возвращает задачу в pending без учёта попытки (например, при остановке воркеров)"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status='pending', attempts=MAX(attempts-1, 0), lease_until=NULL, updated_at=? "
+                "WHERE url=? AND status='in_flight'",
+                (_now_iso(), url))
+
+    def requeue_in_flight(self) -> int:
+        """Возвращает в pending задачи, оставшиеся in_flight после падения процесса"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status='pending', lease_until=NULL, updated_at=? WHERE status='in_flight'",
+                (_now_iso(),))
+            return cursor.rowcount
+
+    def mark_exported(self, url: str) -> None:
+        """Отмечает, что результат карточки сохранён в хранилище и отчёт построен"""
+        self.conn.execute("UPDATE jobs SET exported=1, updated_at=? WHERE url=?", (_now_iso(), url))
+
+    def unexported(self):
+        """Готовые карточки, результат которых ещё не выгружен (процесс упал между записью и выгрузкой)"""
+        for row in self.conn.execute("SELECT url, result FROM jobs WHERE status='done' AND exported=0 ORDER BY position"):
+            yield row['url'], json.loads(row['result']) if row['result'] else None
+
+    def result(self, url: str):
+        row = self.conn.execute("SELECT result FROM jobs WHERE url=?", (url,)).fetchone()
+        return json.loads(row['result']) if row and row['result'] else None
+
+    def remaining(self) -> int:
+        """Сколько задач ещё не завершено (pending + in_flight)"""
+        return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'in_flight')").fetchone()[0]
+
+    def next_available_in(self) -> float | None:
+        """Через сколько секунд станет доступна ближайшая отложенная задача (None — таких нет)"""
+        row = self.conn.execute("SELECT MIN(not_before) FROM jobs WHERE status='pending'").fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def counts(self) -> dict:
+        counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+        for row in self.conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+            counts[row['status']] = row['n']
+        return counts
+
+    def failures(self) -> list:
+        return [(row['url'], row['last_error']) for row in
+                self.conn.execute("SELECT url, last_error FROM jobs WHERE status='failed' ORDER BY position")]
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE … COMMIT/ROLLBACK: запись блокирует базу сразу, без гонки за аренду"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
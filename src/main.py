@@ -4,7 +4,19 @@ main.py — Точка входа для SEO-анализатора Яндекс
 from src.parser import parse_yandex_card
 from src.analyzer import analyze_card
 from src.report import generate_html_report
-from src.save_to_supabase import save_card_to_supabase, check_competitor_exists
+from src.save_to_supabase import save_card_to_supabase, existing_urls, fetch_known_reviews
+from src.review_delta import ReviewWatermark, merge_reviews
+from src.batch import read_urls, run_batch, export_pending
+from src.job_queue import JobQueue, DEFAULT_QUEUE_PATH
+from src.proxy_pool import get_default_proxy_pool
+from src.rate_limiter import classify_result
+from src.metrics import get_registry, start_http_server
+from src.result_cache import ResultCache
+from src.competitor_crawl import crawl_competitors
+from src.card_writer import get_card_writer, close_card_writer
+import argparse
+import os
+import time
 
 # Автоматическая загрузка переменных окружения из .env
 try:
@@ -13,11 +25,146 @@ try:
 except ImportError:
     print('Внимание: для автоматической загрузки .env установите пакет python-dotenv')
 
+def handle_batch_result(result):
+    """Сохраняет карточку из пакетного режима и строит по ней отчёт (без парсинга конкурентов)"""
+    card_data = result.get('data')
+    if result.get('error') or not card_data:
+        return
+    card_data['competitors'] = [c.get('url') for c in card_data.get('competitors', []) if isinstance(c, dict) and c.get('url')]
+    # Строки копятся и уходят в базу пачками из фонового потока; карточка считается
+    # выгруженной, когда завершится возвращённый Future
+    writer = get_card_writer()
+    written = None
+    if writer:
+        written = writer.add(card_data)
+    else:
+        save_card_to_supabase(card_data)
+    analysis = analyze_card(card_data)
+    report_path = generate_html_report(card_data, analysis, {'status': 'Пакетный режим: конкуренты не парсились.'})
+    print(f"Отчёт сохранён: {report_path}")
+    return written
+
+def run_batch_mode(source, workers, queue_path=DEFAULT_QUEUE_PATH, retries=3):
+    urls = read_urls(source)
+    if not urls:
+        print("Список ссылок пуст.")
+        return
+    queue = JobQueue(queue_path, max_attempts=retries)
+    try:
+        run_batch(urls, workers=workers, on_result=handle_batch_result, queue=queue)
+        _print_queue_state(queue)
+    finally:
+        close_card_writer()
+        queue.close()
+
+def resume_batch_mode(workers, queue_path=DEFAULT_QUEUE_PATH, retries=3):
+    """Продолжает прерванный пакет: готовые карточки не парсятся заново"""
+    queue = JobQueue(queue_path, max_attempts=retries)
+    try:
+        requeued = queue.requeue_in_flight()
+        if requeued:
+            print(f"Возвращено в очередь незавершённых задач: {requeued}")
+        exported = export_pending(queue, on_result=handle_batch_result)
+        if exported:
+            print(f"Выгружено готовых, но не сохранённых карточек: {exported}")
+        run_batch([], workers=workers, on_result=handle_batch_result, queue=queue)
+        _print_queue_state(queue)
+    finally:
+        close_card_writer()
+        queue.close()
+
+def crawl_mode(source, workers, depth, budget, graph_path, fanout=None, retries=3):
+    """Обход графа конкурентов от стартовых карточек: каждая организация парсится один раз"""
+    seeds = read_urls(source)
+    if not seeds:
+        print("Список стартовых ссылок пуст.")
+        return
+    if fanout:
+        # Воркеры запускаются через spawn и читают лимит карусели из окружения
+        os.environ['PARSER_COMPETITORS_LIMIT'] = str(fanout)
+    try:
+        crawl_competitors(seeds, max_depth=depth, budget=budget, workers=workers, on_result=handle_batch_result,
+                          queue=JobQueue(':memory:', max_attempts=retries), graph_path=graph_path)
+    finally:
+        close_card_writer()
+
+def _print_queue_state(queue):
+    counts = queue.counts()
+    print(f"Очередь: готово {counts['done']}, ошибок {counts['failed']}, ожидает {counts['pending'] + counts['in_flight']}")
+    for url, error in queue.failures():
+        print(f"  ✗ {url}: {error}")
+
+def _parse_with_proxy(pool, proxy, url, **kwargs):
+    """parse_yandex_card через proxy с отчётом пулу об исходе и времени карточки, как в пакетном режиме"""
+    started = time.perf_counter()
+    try:
+        card_data = parse_yandex_card(url, proxy=proxy, **kwargs)
+    except Exception as e:
+        if proxy:
+            pool.report(proxy, classify_result({'error': str(e)}))
+        raise
+    if proxy:
+        pool.report(proxy, classify_result({'data': card_data}), time.perf_counter() - started)
+    return card_data
+
+def _from_cache(cache, url):
+    """Карточка из локального кэша, если все её разделы свежие"""
+    card_data = cache.get(url)
+    if card_data:
+        age_min = (time.time() - card_data.pop('cached_at')) / 60
+        print(f"Карточка взята из кэша (возраст {age_min:.0f} мин): {url}")
+    return card_data
+
 def main():
+    args = argparse.ArgumentParser(description="SEO-анализатор карточек Яндекс.Карт")
+    args.add_argument('command', nargs='?', choices=['resume', 'crawl'], help="resume — продолжить прерванный пакет из очереди; crawl — обойти граф конкурентов от ссылок --batch")
+    args.add_argument('--batch', metavar='FILE', help="файл со ссылками, по одной на строку ('-' — читать из stdin)")
+    args.add_argument('--workers', type=int, default=2, help="количество процессов-парсеров в пакетном режиме (по умолчанию 2)")
+    args.add_argument('--queue', default=DEFAULT_QUEUE_PATH, help=f"файл очереди пакетного режима (по умолчанию {DEFAULT_QUEUE_PATH})")
+    args.add_argument('--retries', type=int, default=3, help="сколько раз пробовать карточку до отметки об ошибке (по умолчанию 3)")
+    args.add_argument('--depth', type=int, default=2, help="crawl: глубина обхода конкурентов (по умолчанию 2)")
+    args.add_argument('--budget', type=int, default=50, help="crawl: сколько всего карточек спарсить (по умолчанию 50)")
+    args.add_argument('--fanout', type=int, default=None, help="crawl: сколько похожих мест брать с карточки (по умолчанию 5)")
+    args.add_argument('--graph', default=os.path.join('data', 'competitor_graph.json'), help="crawl: куда сохранить граф конкурентов")
+    args.add_argument('--refresh', action='store_true', help="парсить заново, даже если в локальном кэше есть свежий результат")
+    args.add_argument('--record-har', metavar='FILE', help="записать трафик карточки в HAR для офлайн-воспроизведения (python -m src.benchmark --har FILE)")
+    options = args.parse_args()
+    # /metrics для Prometheus, если задан METRICS_PORT
+    start_http_server()
+    if options.command == 'resume':
+        resume_batch_mode(options.workers, options.queue, options.retries)
+        return
+    if options.command == 'crawl':
+        if not options.batch:
+            args.error("для crawl укажите стартовые ссылки: --batch FILE")
+        crawl_mode(options.batch, options.workers, options.depth, options.budget, options.graph, options.fanout, options.retries)
+        return
+    if options.batch:
+        run_batch_mode(options.batch, options.workers, options.queue, options.retries)
+        return
+
     print("Введите ссылку на карточку Яндекс.Карт:")
     url = input().strip()
-    print("Парсинг страницы...")
-    card_data = parse_yandex_card(url)
+    cache = ResultCache()
+    proxies = get_default_proxy_pool()
+    proxy = proxies.choose()
+    card_data = None if options.refresh or options.record_har else _from_cache(cache, url)
+    from_cache = card_data is not None
+    if not from_cache:
+        # Отзывы, сохранённые при прошлом парсинге: прокручиваем только до них
+        known_reviews = fetch_known_reviews(url)
+        watermark = ReviewWatermark.from_reviews(known_reviews) if known_reviews else None
+        if watermark:
+            print(f"Инкрементальный сбор отзывов: известно {len(watermark.keys)} последних отзывов")
+        print("Парсинг страницы...")
+        card_data = _parse_with_proxy(proxies, proxy, url, watermark=watermark, record_har=options.record_har)
+        if options.record_har:
+            print(f"Трафик карточки записан: {options.record_har}")
+        if watermark and card_data.get('reviews', {}).get('incremental'):
+            print(f"Новых отзывов: {len(card_data['reviews']['items'])}")
+            # Отчёт и кэш получают полный список, в Reviews уйдут только новые (new_count)
+            card_data['reviews'] = merge_reviews(known_reviews, card_data['reviews'])
+        cache.put(card_data, url)
     print('DEBUG overview:', card_data.get('overview'))
 
     # --- Проверка на капчу ---
@@ -53,16 +200,23 @@ def main():
     competitors = card_data.get('competitors', [])
     competitor_status = ''
     if competitors:
-        # Берём первого конкурента, которого нет в базе
+        # Берём первого конкурента, который есть в кэше или которого нет в базе
+        existing = existing_urls([comp.get('url') for comp in competitors])
         for comp in competitors:
             comp_url = comp.get('url')
-            if comp_url and not check_competitor_exists(comp_url):
+            if not comp_url:
+                continue
+            competitor_data = None if options.refresh else _from_cache(cache, comp_url)
+            if competitor_data or comp_url not in existing:
                 competitor_url = comp_url
                 break
-        if competitor_url:
+        if competitor_data:
+            competitor_data['competitors'] = []
+        elif competitor_url:
             print(f"Парсим конкурента: {competitor_url}")
             try:
-                competitor_data = parse_yandex_card(competitor_url)
+                competitor_data = _parse_with_proxy(proxies, proxy, competitor_url)
+                cache.put(competitor_data, competitor_url)
                 competitor_data['competitors'] = []
                 save_card_to_supabase(competitor_data)
             except Exception as e:
@@ -80,7 +234,9 @@ def main():
     if competitor_url:
         competitors_urls.append(competitor_url)
     card_data['competitors'] = competitors_urls
-    save_card_to_supabase(card_data)
+    if not from_cache:
+        # Карточка из кэша уже сохранялась в базу при парсинге
+        save_card_to_supabase(card_data)
 
     print("Результат парсинга:")
     import pprint
@@ -90,6 +246,9 @@ def main():
     print("Генерация отчёта...")
     report_path = generate_html_report(card_data, analysis, competitor_data if competitor_data else {'status': competitor_status})
     print(f"Готово! Отчёт сохранён: {report_path}")
+    print("Время по этапам:")
+    for stage, item in get_registry().summary().items():
+        print(f"  {stage}: {item['total_sec']} с ({item['count']} раз)")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
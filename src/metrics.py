@@ -0,0 +1,234 @@
+"""
+metrics.py — Замеры времени этапов парсинга и счётчики
+
+Лёгкий API без внешних зависимостей:
+- with span('goto'): ... — замер этапа; длительность попадает в гистограмму
+  parser_stage_seconds{stage="goto"}, а при METRICS_JSONL=<файл> ещё и строкой JSON;
+- count('cards', outcome='ok') — счётчик parser_<имя>_total;
+- render_prometheus() / start_http_server(port) — текстовый формат Prometheus,
+  /metrics поднимается на порту METRICS_PORT.
+
+В пакетном режиме каждый воркер копит свои замеры и возвращает snapshot() вместе с
+результатом карточки, а основной процесс сливает их merge() в общий реестр.
+"""
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+import time
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_METRIC = 'parser_stage_seconds'
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+class _Histogram:
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def to_dict(self) -> dict:
+        return {'counts': list(self.counts), 'count': self.count, 'sum': self.sum}
+
+    def merge(self, data: dict):
+        for i, value in enumerate(data.get('counts', [])[:len(self.counts)]):
+            self.counts[i] += value
+        self.count += data.get('count', 0)
+        self.sum += data.get('sum', 0.0)
+
+
+class MetricsRegistry:
+    """Счётчики и гистограммы длительностей этапов процесса; потокобезопасен"""
+
+    def __init__(self, jsonl_path: str | None = None):
+        self.jsonl_path = jsonl_path
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = _Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """Замер этапа: длительность пишется и при исключении (status="error")"""
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            yield
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            self.observe(STAGE_METRIC, duration, stage=stage, status=status, **labels)
+            self._write_event({'type': 'span', 'stage': stage, 'labels': labels, 'status': status, 'duration': round(duration, 4)})
+
+    def _write_event(self, event: dict):
+        if not self.jsonl_path:
+            return
+        event = dict(event, ts=round(time.time(), 3), pid=os.getpid())
+        line = json.dumps(event, ensure_ascii=False) + '\n'
+        try:
+            with self._lock:
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+        except OSError as e:
+            print(f"Не удалось записать метрики в {self.jsonl_path}: {e}")
+            self.jsonl_path = None
+
+    def snapshot(self) -> dict:
+        """Состояние реестра в JSON-совместимом виде (для передачи из воркера)"""
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), h.to_dict()] for (name, labels), h in self.histograms.items()],
+            }
+
+    def merge(self, snapshot: dict | None):
+        """Добавляет к реестру snapshot() другого процесса"""
+        if not snapshot:
+            return
+        with self._lock:
+            for name, labels, value in snapshot.get('counters', []):
+                key = (name, tuple(tuple(pair) for pair in labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, labels, data in snapshot.get('histograms', []):
+                key = (name, tuple(tuple(pair) for pair in labels))
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = _Histogram()
+                histogram.merge(data)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def render_prometheus(self) -> str:
+        """Текстовый формат экспозиции Prometheus"""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {round(histogram.sum, 6)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> dict:
+        """Среднее и суммарное время по этапам — для вывода в консоль"""
+        stages = {}
+        with self._lock:
+            for (name, labels), histogram in self.histograms.items():
+                if name != STAGE_METRIC:
+                    continue
+                labels = dict(labels)
+                extra = [v for k, v in labels.items() if k not in ('stage', 'status')]
+                stage = ':'.join([labels.get('stage', '')] + extra)
+                item = stages.setdefault(stage, {'count': 0, 'sum': 0.0})
+                item['count'] += histogram.count
+                item['sum'] += histogram.sum
+        return {stage: {'count': v['count'], 'total_sec': round(v['sum'], 2), 'avg_sec': round(v['sum'] / v['count'], 3) if v['count'] else 0.0}
+                for stage, v in sorted(stages.items(), key=lambda item: -item[1]['sum'])}
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+_registry = None
+
+
+def get_registry() -> MetricsRegistry:
+    """Реестр процесса; METRICS_JSONL задаёт файл для построчного журнала замеров"""
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry(os.getenv('METRICS_JSONL') or None)
+    return _registry
+
+
+def span(stage: str, **labels):
+    return get_registry().span(stage, **labels)
+
+
+def count(name: str, value: float = 1, **labels):
+    get_registry().inc(f"parser_{name}_total", value, **labels)
+
+
+def render_prometheus() -> str:
+    return get_registry().render_prometheus()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int | None = None, host: str = '0.0.0.0'):
+    """Поднимает /metrics в фоновом потоке (порт — аргумент или METRICS_PORT). Возвращает сервер или None"""
+    port = port or int(os.getenv('METRICS_PORT', '0') or 0)
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"Не удалось запустить сервер метрик на порту {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Метрики Prometheus: http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,168 @@
+"""
+network_capture.py — Перехват JSON-ответов API Яндекс.Карт при парсинге карточки
+
+Вкладки «Отзывы», «Фото» и «Новости» заполняются XHR-запросами, в ответах которых
+уже есть авторы, даты, оценки, ответы организации и ссылки на фото. NetworkCapture
+запоминает такие ответы через page.on('response'), а функции *_from_payloads
+собирают из них те же структуры, что и DOM-парсинг в parser.py.
+"""
+import re
+
+REVIEWS_URL_RE = re.compile(r'/maps/api/business/fetchReviews')
+PHOTOS_URL_RE = re.compile(r'/maps/api/(?:photos|business/fetchPhotos|business/getPhotos)')
+POSTS_URL_RE = re.compile(r'/maps/api/(?:business/)?(?:fetchPosts|getPosts|posts)')
+
+SECTION_PATTERNS = {
+    'reviews': REVIEWS_URL_RE,
+    'photos': PHOTOS_URL_RE,
+    'news': POSTS_URL_RE,
+}
+
+PHOTO_SIZE = 'XXL'
+
+
+class NetworkCapture:
+    """Собирает ответы API по разделам. Тело ответа читается лениво, при сборке данных"""
+
+    def __init__(self):
+        self._pending = {section: [] for section in SECTION_PATTERNS}
+        self.payloads = {section: [] for section in SECTION_PATTERNS}
+
+    def attach(self, page):
+        page.on('response', self._on_response)
+        return self
+
+    def detach(self, page):
+        try:
+            page.remove_listener('response', self._on_response)
+        except Exception:
+            pass
+
+    def _on_response(self, response):
+        try:
+            if response.request.resource_type not in ('xhr', 'fetch'):
+                return
+        except Exception:
+            pass
+        for section, pattern in SECTION_PATTERNS.items():
+            if pattern.search(response.url):
+                self._pending[section].append(response)
+                return
+
+    def reset(self, section: str):
+        """Забывает ответы раздела, собранные и ещё не прочитанные (например, до смены сортировки)"""
+        self._pending[section] = []
+        self.payloads[section] = []
+
+    def collect(self, section: str) -> list:
+        """Читает тела ответов раздела (sync API) и возвращает список JSON-payload'ов"""
+        pending, self._pending[section] = self._pending[section], []
+        for response in pending:
+            try:
+                if response.ok:
+                    self.payloads[section].append(response.json())
+            except Exception:
+                continue
+        return self.payloads[section]
+
+    async def acollect(self, section: str) -> list:
+        """То же, что collect, для async API"""
+        pending, self._pending[section] = self._pending[section], []
+        for response in pending:
+            try:
+                if response.ok:
+                    self.payloads[section].append(await response.json())
+            except Exception:
+                continue
+        return self.payloads[section]
+
+
+def _unwrap(payload, key):
+    """Достаёт список key из payload вида {"data": {key: [...]}} или {key: [...]}"""
+    if not isinstance(payload, dict):
+        return []
+    data = payload.get('data', payload)
+    if isinstance(data, dict):
+        items = data.get(key)
+        if isinstance(items, list):
+            return items
+    return []
+
+
+def _photo_url(photo):
+    if isinstance(photo, str):
+        return photo
+    if not isinstance(photo, dict):
+        return ''
+    template = photo.get('urlTemplate') or photo.get('url_template')
+    if template:
+        return template.replace('%s', PHOTO_SIZE)
+    return photo.get('url') or photo.get('src') or ''
+
+
+def reviews_from_payloads(payloads) -> dict:
+    """Собирает {"items", "rating", "reviews_count"} из ответов fetchReviews"""
+    items = []
+    seen = set()
+    reviews_count = ''
+    for payload in payloads:
+        data = payload.get('data', payload) if isinstance(payload, dict) else {}
+        params = data.get('params', {}) if isinstance(data, dict) else {}
+        if isinstance(params, dict):
+            total = params.get('totalCount') or params.get('count')
+            if total and not reviews_count:
+                reviews_count = str(total)
+        for review in _unwrap(payload, 'reviews'):
+            if not isinstance(review, dict):
+                continue
+            review_id = review.get('reviewId') or review.get('id')
+            if review_id and review_id in seen:
+                continue
+            if review_id:
+                seen.add(review_id)
+            author = review.get('author') or {}
+            if isinstance(author, dict):
+                author = author.get('name', '')
+            reply = review.get('businessComment') or {}
+            if isinstance(reply, dict):
+                reply = reply.get('text', '')
+            score = review.get('rating') or 0
+            try:
+                score = int(float(score))
+            except (TypeError, ValueError):
+                score = 0
+            items.append({
+                "author": (author or '').strip(),
+                "date": review.get('updatedTime') or review.get('time') or review.get('date') or '',
+                "score": score,
+                "text": (review.get('text') or '').strip(),
+                "org_reply": (reply or '').strip()
+            })
+    return {"items": items, "rating": "", "reviews_count": reviews_count}
+
+
+def photos_from_payloads(payloads) -> list:
+    """Собирает список ссылок на фото из ответов API галереи"""
+    photos = []
+    for payload in payloads:
+        for photo in _unwrap(payload, 'photos'):
+            url = _photo_url(photo)
+            if url and url not in photos:
+                photos.append(url)
+    return photos
+
+
+def news_from_payloads(payloads) -> list:
+    """Собирает список новостей {"date", "text", "photos"} из ответов API постов"""
+    news = []
+    for payload in payloads:
+        for post in _unwrap(payload, 'posts'):
+            if not isinstance(post, dict):
+                continue
+            photos = [u for u in (_photo_url(p) for p in post.get('photos') or []) if u]
+            news.append({
+                'date': post.get('publishedTime') or post.get('updatedTime') or post.get('date') or '',
+                'text': (post.get('text') or post.get('content') or '').strip(),
+                'photos': photos
+            })
+    return news
@@ -1,12 +1,29 @@
 """
 parser.py — Модуль для парсинга публичной страницы Яндекс.Карт с помощью Playwright
 """
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+from src.browser_pool import BrowserPool, get_default_pool
+from src.card_specs import (
+    OVERVIEW_SPEC, PRODUCTS_SPEC, REVIEWS_HEADER_SPEC, REVIEW_ITEMS_SPEC, NEWS_SPEC, PHOTOS_SPEC, PHOTOS_COUNT_SPEC,
+    FEATURES_SPEC, COMPETITORS_SPEC, PHONE_BUTTON_SELECTORS, TAB_SELECTORS, TAB_READY_SELECTORS, PAGE_READY_SELECTOR,
+    CAPTCHA_FORM_SELECTOR, CAPTCHA_TITLE, CONTACTS_SELECTOR, PHONE_READY_SELECTOR, REVIEWS_RANKING_SELECTOR,
+    REVIEWS_NEWEST_OPTION, EXPAND_REPLIES_JS, REPLY_BUTTON_SELECTOR, REPLY_SELECTOR, build_overview, build_products,
+    build_reviews_header, build_review_items, apply_captured_reviews, build_news, build_photos, build_features,
+    build_competitors, empty_reviews, empty_features, fill_card,
+)
+from src.dom_extract import extract, mark_first_visible
+from src.network_capture import NetworkCapture, news_from_payloads, photos_from_payloads
+from src.request_blocking import RequestBlocker, blocking_enabled_by_default, merge_stats
+from src.yandex_urls import tab_url
+from src.proxy_pool import parse_proxy
+from src.metrics import span, count
+from src.scroll_controller import ReviewsScrollController
+from src.review_delta import ReviewWatermark, apply_watermark
+from src.snapshot_archive import SnapshotArchive, get_default_archive
+from src.readiness import HumanPacing, get_pacing, pacing_override, wait_for_ready, wait_for_dom_quiet, scroll_until_stable
+import contextlib
 import time
-import re
-import random
 import os
-from random import randint, uniform
 
 def parse_reviews_from_main_page(page):
     """Парсинг отзывов с главной страницы, если вкладка не найдена"""
@@ -34,15 +51,83 @@ def parse_reviews_from_main_page(page):
 
     return reviews
 
-def parse_yandex_card(url: str) -> dict:
+class _CardPages:
+    """Страницы одной карточки в арендованном контексте: перехват API, блокировка запросов, закрытие"""
+
+    def __init__(self, context, capture_network: bool, block_resources: bool, url: str = '', snapshots: SnapshotArchive | None = None):
+        self.context = context
+        self.capture_network = capture_network
+        self.block_resources = block_resources
+        self.url = url
+        self.snapshots = snapshots
+        self.snapshot_refs = {}
+        self.started = time.time()
+        self.pages = []
+        self.blockers = []
+
+    def new_page(self):
+        page = self.context.new_page()
+        self.pages.append(page)
+        capture = NetworkCapture().attach(page) if self.capture_network else None
+        if self.block_resources:
+            self.blockers.append(RequestBlocker().install(page))
+        return page, capture
+
+    def snapshot(self, page, tab: str):
+        """Сохраняет HTML вкладки после прокрутки в архив снимков (если он задан)"""
+        if not self.snapshots:
+            return
+        try:
+            with span('snapshot', tab=tab):
+                snapshot = self.snapshots.put(self.url, tab, page.content(), ts=self.started)
+            self.snapshot_refs[tab] = snapshot.sha256
+        except Exception as e:
+            print(f"Не удалось сохранить снимок вкладки {tab}: {e}")
+
+    def request_stats(self):
+        return merge_stats(self.blockers) if self.blockers else None
+
+    def close(self):
+        for page in self.pages:
+            try:
+                page.close()
+            except Exception:
+                pass
+        self.pages = []
+
+# Вкладки, которые в режиме parallel_tabs открываются отдельными страницами по «глубоким» ссылкам
+PARALLEL_TABS = ('reviews', 'news', 'photos', 'features')
+
+def parse_yandex_card(url: str, pool: BrowserPool | None = None, capture_network: bool = True, block_resources: bool | None = None, parallel_tabs: bool = False, max_reviews: int | None = None, watermark: ReviewWatermark | None = None, proxy: dict | str | None = None, record_har: str | None = None, replay_har: str | None = None, snapshots: SnapshotArchive | None = None) -> dict:
     """
     Парсит публичную страницу Яндекс.Карт и возвращает данные в виде словаря.
+    Браузер берётся из пула (по умолчанию — общий пул процесса), а не запускается заново.
+    При capture_network отзывы, новости и фото собираются из JSON-ответов API,
+    а DOM-парсинг используется только если ответы не пойманы.
+    block_resources отключает загрузку картинок, шрифтов, медиа, тайлов и аналитики
+    (по умолчанию — по переменной PARSER_BLOCK_RESOURCES).
+    parallel_tabs открывает отзывы, новости, фото и особенности соседними страницами
+    того же контекста, чтобы они грузились одновременно с обзором.
+    max_reviews ограничивает количество собираемых отзывов (неглубокий проход).
+    watermark (ReviewWatermark уже сохранённых отзывов) включает инкрементальный режим:
+    прокрутка останавливается на первом известном отзыве, в reviews попадают только новые.
+    proxy (строка или {"server", "username", "password"}) — прокси для контекста браузера.
+    record_har записывает весь трафик карточки в HAR-файл (.zip — ответы отдельными файлами).
+    replay_har отдаёт ответы из записанного HAR без выхода в сеть: без прокси и пауз,
+    запросы, которых нет в записи, обрываются.
+    snapshots — архив, куда сохраняется HTML каждой вкладки после прокрутки
+    (по умолчанию — из PARSER_SNAPSHOT_DIR, если задана).
     """
     print(f"Начинаем парсинг: {url}")
 
     if not url or not url.startswith(('http://', 'https://')):
         raise ValueError(f"Некорректная ссылка: {url}")
 
+    if record_har and replay_har:
+        raise ValueError("record_har и replay_har не используются вместе")
+    if replay_har and not os.path.exists(replay_har):
+        raise ValueError(f"HAR-файл не найден: {replay_har}")
+
     print("Используем парсинг через Playwright...")
 
     cookies = [
@@ -72,767 +157,313 @@ def parse_yandex_card(url: str) -> dict:
         {"name": "my", "value": "YwA=", "domain": ".yandex.ru", "path": "/"},
         {"name": "sae", "value": "0:8A53C863-815A-4C63-9430-588B5324FAAF:p:25.6.0.2381:m:d:RU:20220309", "domain": ".yandex.ru", "path": "/"},
     ]
-    with sync_playwright() as p:
-        try:
-            # Правильные переменные окружения для Replit
-            os.environ['PLAYWRIGHT_BROWSERS_PATH'] = '/home/runner/.cache/ms-playwright'
-            os.environ['PLAYWRIGHT_SKIP_BROWSER_DOWNLOAD'] = '0'
-
-            browser = None
-            browser_name = ""
-
-            # Попытка запуска Chromium
-            try:
-                browser = p.chromium.launch(
-                    headless=True,
-                    args=[
-                        '--no-sandbox',
-                        '--disable-setuid-sandbox', 
-                        '--disable-dev-shm-usage',
-                        '--disable-gpu',
-                        '--disable-web-security',
-                        '--disable-features=VizDisplayCompositor',
-                        '--disable-background-timer-throttling',
-                        '--disable-backgrounding-occluded-windows',
-                        '--disable-renderer-backgrounding',
-                        '--disable-extensions',
-                        '--disable-plugins',
-                        '--disable-sync',
-                        '--disable-translate',
-                        '--disable-notifications',
-                        '--disable-permissions-api',
-                        '--disable-default-apps',
-                        '--no-first-run',
-                        '--no-default-browser-check',
-                        '--disable-background-networking',
-                        '--single-process',
-                        '--disable-zygote'
-                    ],
-                    ignore_default_args=['--enable-automation'],
-                    chromium_sandbox=False
-                )
-                browser_name = "Chromium"
-                print("Используем Chromium")
-            except Exception as e:
-                print(f"Chromium недоступен: {e}")
-
-                # Если Chromium не работает, пробуем Firefox
-                try:
-                    browser = p.firefox.launch(
-                        headless=True,
-                        args=[
-                            '--no-sandbox',
-                            '--disable-dev-shm-usage',
-                            '--disable-gpu'
-                        ],
-                        firefox_user_prefs={
-                            'dom.webdriver.enabled': False,
-                            'useAutomationExtension': False
-                        }
-                    )
-                    browser_name = "Firefox"
-                    print("Используем Firefox")
-                except Exception as e2:
-                    print(f"Firefox недоступен: {e2}")
-
-                    # В крайнем случае пробуем WebKit
-                    try:
-                        browser = p.webkit.launch(
-                            headless=True,
-                            args=['--no-sandbox']
-                        )
-                        browser_name = "WebKit"
-                        print("Используем WebKit")
-                    except Exception as e3:
-                        raise Exception(f"Все браузеры недоступны: Chromium={e}, Firefox={e2}, WebKit={e3}")
-
-            if not browser:
-                raise Exception("Не удалось запустить ни один браузер")
-
-            # Создаем контекст с антидетектом
-            context = browser.new_context(
-                user_agent='Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                locale='ru-RU',
-                timezone_id='Europe/Moscow',
-                viewport={'width': 1920, 'height': 1080},
-                screen={'width': 1920, 'height': 1080},
-                device_scale_factor=1,
-                is_mobile=False,
-                has_touch=False,
-                color_scheme='light',
-                reduced_motion='no-preference',
-                forced_colors='none',
-                extra_http_headers={
-                    'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-                    'Sec-Fetch-Site': 'none',
-                    'Sec-Fetch-Mode': 'navigate',
-                    'Sec-Fetch-User': '?1',
-                    'Sec-Fetch-Dest': 'document'
-                }
-            )
-
-            # Добавляем JavaScript для скрытия автоматизации
-            context.add_init_script("""
-                Object.defineProperty(navigator, 'webdriver', {
-                    get: () => undefined,
-                });
-
-                delete navigator.__proto__.webdriver;
+    if pool is None:
+        pool = get_default_pool()
+    if block_resources is None:
+        block_resources = blocking_enabled_by_default()
+    if snapshots is None and not replay_har:
+        snapshots = get_default_archive()
 
-                Object.defineProperty(navigator, 'plugins', {
-                    get: () => [1, 2, 3, 4, 5],
-                });
-
-                Object.defineProperty(navigator, 'languages', {
-                    get: () => ['ru-RU', 'ru', 'en'],
-                });
-
-                window.chrome = {
-                    runtime: {}
-                };
-
-                Object.defineProperty(navigator, 'permissions', {
-                    get: () => ({
-                        query: () => Promise.resolve({ state: 'granted' }),
-                    }),
-                });
-            """)
-
-            page = context.new_page()
-
-            # Устанавливаем дополнительные заголовки
-            page.set_extra_http_headers({
-                'Cache-Control': 'no-cache',
-                'Pragma': 'no-cache'
-            })
-
-            # Переходим на страницу с увеличенным таймаутом
-            print("Переходим на страницу...")
-            page.goto(url, wait_until='domcontentloaded', timeout=60000)
-
-            # Ждем загрузки контента
-            time.sleep(random.uniform(3, 5))
-
-            # Проверяем на captcha сразу после загрузки
-            if page.query_selector("form[action*='captcha']") or "captcha" in page.url.lower() or "Подтвердите, что запросы отправляли вы" in page.title():
-                browser.close()
-                print("⚠️  Обнаружена captcha! Попробуйте:")
-                print("1. Открыть ссылку в браузере и пройти captcha")
-                print("2. Попробовать позже")
-                print("3. Использовать другую ссылку")
-                return {"error": "captcha_detected", "url": url}
-
-            # Переход на вкладку 'Обзор'
+    try:
+        lease_options = _har_context_options(record_har, replay_har)
+        if proxy and not replay_har:
+            lease_options['proxy'] = parse_proxy(proxy) if isinstance(proxy, str) else proxy
+        with span('card'), pool.lease(**lease_options) as context, _har_pacing(replay_har):
+            if replay_har:
+                print(f"Воспроизводим запись: {replay_har}")
+                context.route_from_har(replay_har, not_found='abort')
+            pages = _CardPages(context, capture_network, block_resources, url, snapshots)
             try:
-                page.wait_for_selector("body", timeout=10000)
-                overview_tab = page.query_selector("div.tabs-select-view__title._name_overview, div[role='tab']:has-text('Обзор'), button:has-text('Обзор')")
-                if overview_tab:
-                    overview_tab.click()
-                    print("Клик по вкладке 'Обзор'")
-                    page.wait_for_timeout(2000)
-            except Exception as e:
-                print(f"Вкладка 'Обзор' не найдена: {e}")
-
-            # Скроллим для подгрузки контента
-            page.mouse.wheel(0, 1000)
-            time.sleep(2)
-            page.mouse.wheel(0, 1000)
-            time.sleep(2)
-
-            data = parse_overview_data(page)
-            data['url'] = url
-
-            # Парсим остальные вкладки
-            data['reviews'] = parse_reviews(page)
-            data['news'] = parse_news(page)
-            data['photos_count'] = get_photos_count(page)
-            data['photos'] = parse_photos(page)
-            data['features_full'] = parse_features(page)
-            data['competitors'] = parse_competitors(page)
-
-            # Создаем overview для отчета
-            overview_keys = [
-                'title', 'address', 'phone', 'site', 'description',
-                'rubric', 'categories', 'hours', 'hours_full', 'rating', 'ratings_count', 'reviews_count', 'social_links'
-            ]
-            data['overview'] = {k: data.get(k, '') for k in overview_keys}
-            data['overview']['reviews_count'] = data.get('reviews_count', '')
-
-            browser.close()
-            print(f"Парсинг завершен ({browser_name}). Найдено: название='{data['title']}', адрес='{data['address']}'")
-            return data
-
-        except PlaywrightTimeoutError as e:
-            if browser:
-                browser.close()
-            raise Exception(f"Тайм-аут при загрузке страницы: {e}")
+                reviews_options = {'max_reviews': max_reviews, 'watermark': watermark}
+                data = _parse_card_page(pages, url, pool.browser_name, parallel_tabs, reviews_options)
+                if pages.snapshot_refs:
+                    data['snapshots'] = pages.snapshot_refs
+                stats = pages.request_stats()
+                if stats and not data.get('error'):
+                    data['parse_stats'] = {'requests': stats}
+                    print(f"Заблокировано запросов: {stats['blocked_total']} (~{stats['blocked_bytes_estimate'] // 1024} КБ)")
+                    count('blocked_requests', stats['blocked_total'])
+                count('cards', outcome='captcha' if data.get('error') == 'captcha_detected' else 'ok')
+                if data.get('error') == 'captcha_detected':
+                    # Куки и fingerprint контекста «засвечены» — не отдаём его следующей карточке
+                    pool.retire(context)
+                return data
+            finally:
+                pages.close()
+    except PlaywrightTimeoutError as e:
+        count('cards', outcome='timeout')
+        raise Exception(f"Тайм-аут при загрузке страницы: {e}")
+    except Exception as e:
+        count('cards', outcome='error')
+        raise Exception(f"Ошибка при парсинге: {e}")
+
+def _har_context_options(record_har: str | None, replay_har: str | None) -> dict:
+    """Параметры контекста для записи или воспроизведения HAR; такой контекст не переиспользуется"""
+    if not (record_har or replay_har):
+        return {}
+    # Запросы service worker'ов не проходят через route и не попадают в запись
+    options = {'service_workers': 'block'}
+    if record_har:
+        os.makedirs(os.path.dirname(os.path.abspath(record_har)), exist_ok=True)
+        options['record_har_path'] = record_har
+        options['record_har_content'] = 'attach' if record_har.endswith('.zip') else 'embed'
+    return options
+
+def _har_pacing(replay_har: str | None):
+    """При воспроизведении записи антибот-паузы не нужны"""
+    return pacing_override(HumanPacing(0, 0)) if replay_har else contextlib.nullcontext()
+
+def _is_captcha(page) -> bool:
+    return bool(page.query_selector(CAPTCHA_FORM_SELECTOR) or "captcha" in page.url.lower() or CAPTCHA_TITLE in page.title())
+
+def _start_tab_pages(pages: _CardPages, url: str) -> dict:
+    """Открывает вкладки карточки соседними страницами; навигация идёт параллельно с обзором"""
+    tab_pages = {}
+    for tab in PARALLEL_TABS:
+        target = tab_url(url, tab)
+        if not target:
+            return tab_pages
+        try:
+            tab_page, tab_capture = pages.new_page()
+            # wait_until='commit' возвращает управление сразу после ответа сервера,
+            # дальше страница догружается в браузере, пока мы разбираем обзор
+            tab_page.goto(target, wait_until='commit', timeout=60000)
+            tab_pages[tab] = (tab_page, tab_capture)
         except Exception as e:
-            if browser:
-                browser.close()
-            raise Exception(f"Ошибка при парсинге: {e}")
-
-def parse_overview_data(page):
-    """Парсит основные данные с вкладки Обзор"""
-    data = {}
-
-    # Название
+            print(f"Не удалось открыть вкладку {tab}: {e}")
+    return tab_pages
+
+def _parse_tab(tab: str, page, capture, reviews_options: dict | None = None):
+    with span('tab', tab=tab):
+        if tab == 'reviews':
+            return parse_reviews(page, capture, **(reviews_options or {}))
+        if tab == 'news':
+            return parse_news(page, capture)
+        if tab == 'photos':
+            return parse_photos(page, capture)
+        return parse_features(page)
+
+def _parse_card_page(pages: _CardPages, url: str, browser_name: str, parallel_tabs: bool = False, reviews_options: dict | None = None) -> dict:
+    """Парсит карточку в страницах арендованного контекста"""
+    page, capture = pages.new_page()
+    # Устанавливаем дополнительные заголовки
+    page.set_extra_http_headers({
+        'Cache-Control': 'no-cache',
+        'Pragma': 'no-cache'
+    })
+
+    # Переходим на страницу с увеличенным таймаутом
+    print("Переходим на страницу...")
+    with span('goto'):
+        page.goto(url, wait_until='domcontentloaded', timeout=60000)
+        # Ждем загрузки контента: заголовок карточки или форма капчи
+        wait_for_ready(page, selector=PAGE_READY_SELECTOR, timeout=15000)
+    pacing = get_pacing()
+    pacing.pause()
+
+    # Проверяем на captcha сразу после загрузки
+    if _is_captcha(page):
+        count('captcha')
+        print("⚠️  Обнаружена captcha! Попробуйте:")
+        print("1. Открыть ссылку в браузере и пройти captcha")
+        print("2. Попробовать позже")
+        print("3. Использовать другую ссылку")
+        return {"error": "captcha_detected", "url": url}
+
+    tab_pages = _start_tab_pages(pages, url) if parallel_tabs else {}
+
+    # Переход на вкладку 'Обзор'
     try:
-        title_el = page.query_selector("h1.card-title-view__title, h1")
-        data['title'] = title_el.inner_text().strip() if title_el else ''
-    except Exception:
-        data['title'] = ''
+        page.wait_for_selector("body", timeout=10000)
+        overview_tab = page.query_selector(TAB_SELECTORS['overview'])
+        if overview_tab:
+            overview_tab.click()
+            print("Клик по вкладке 'Обзор'")
+            wait_for_dom_quiet(page, quiet_ms=400, timeout=5000)
+    except Exception as e:
+        print(f"Вкладка 'Обзор' не найдена: {e}")
+
+    # Скроллим для подгрузки контента
+    for _ in range(2):
+        page.mouse.wheel(0, 1000)
+        wait_for_dom_quiet(page, quiet_ms=400, timeout=4000)
+    pacing.pause()
+
+    with span('tab', tab='overview'):
+        data = parse_overview_data(page)
+    pages.snapshot(page, 'overview')
+    data['url'] = url
+
+    # Парсим остальные вкладки: из соседних страниц, если они открыты, иначе по очереди на основной
+    data['photos_count'] = get_photos_count(page)
+    results = {}
+    for tab, (tab_page, tab_capture) in tab_pages.items():
+        wait_for_ready(tab_page, selector=PAGE_READY_SELECTOR, timeout=15000)
+        if _is_captcha(tab_page):
+            print(f"Captcha на вкладке {tab}, парсим её на основной странице")
+            continue
+        results[tab] = _parse_tab(tab, tab_page, tab_capture, reviews_options)
+        pages.snapshot(tab_page, tab)
+    for tab in PARALLEL_TABS:
+        if tab not in results:
+            results[tab] = _parse_tab(tab, page, capture, reviews_options)
+            pages.snapshot(page, tab)
+    with span('tab', tab='competitors'):
+        data['competitors'] = parse_competitors(page)
+    pages.snapshot(page, 'competitors')
+
+    # Раскладываем вкладки по полям и создаем overview для отчета
+    fill_card(data, results)
+
+    print(f"Парсинг завершен ({browser_name}). Найдено: название='{data['title']}', адрес='{data['address']}'")
+    return data
 
-    # Полный адрес
+def parse_overview_data(page):
+    """
+    Парсит основные данные с вкладки Обзор. Все поля обзора извлекаются одним
+    page.evaluate по OVERVIEW_SPEC, товары и услуги — ещё одним по PRODUCTS_SPEC.
+    """
+    # Клик по кнопке "Показать телефон" перед парсингом
     try:
-        addr_elem = page.query_selector("div.business-contacts-view__address")
-        if addr_elem:
-            data['address'] = addr_elem.inner_text().strip()
+        # Ждем появления блока контактов
+        wait_for_ready(page, selector=CONTACTS_SELECTOR, timeout=5000, quiet_ms=300)
+        selector = mark_first_visible(page, PHONE_BUTTON_SELECTORS, marker='data-parser-phone-btn')
+        if selector:
+            print(f"Кликаем по кнопке телефона: {selector}")
+            page.click("[data-parser-phone-btn]")
+            wait_for_ready(page, selector=PHONE_READY_SELECTOR, timeout=4000, quiet_ms=300)
         else:
-            # Альтернативный селектор
-            addr_elem = page.query_selector("[class*='business-contacts-view'] [class*='address']")
-            data['address'] = addr_elem.inner_text().strip() if addr_elem else ''
-    except Exception:
-        data['address'] = ''
-
-    # Клик по кнопке "Показать телефон" перед парсингом - улучшенная версия
-    try:
-        # Ждем появления кнопки телефона
-        page.wait_for_timeout(2000)
-
-        phone_btn_selectors = [
-            "button:has-text('Показать телефон')",
-            "div.business-contacts-view__phone button",
-            "span:has-text('Показать телефон')",
-            "button[class*='phone']",
-            "[aria-label*='телефон'] button",
-            "div.business-phones-view button"
-        ]
-
-        phone_clicked = False
-        for selector in phone_btn_selectors:
-            try:
-                show_phone_btn = page.query_selector(selector)
-                if show_phone_btn and show_phone_btn.is_visible():
-                    print(f"Кликаем по кнопке телефона: {selector}")
-                    show_phone_btn.click()
-                    page.wait_for_timeout(2000)
-                    phone_clicked = True
-                    break
-            except Exception:
-                continue
-
-        if not phone_clicked:
             print("Кнопка 'Показать телефон' не найдена")
     except Exception:
         pass
 
-    # Телефон - улучшенный парсинг
     try:
-        phone_selectors = [
-            "span.business-phones-view__text",
-            "div.business-contacts-view__phone-number span",
-            "div.business-contacts-view__phone span",
-            "span[class*='phone-text']",
-            "span[class*='phone']", 
-            "a[href^='tel:']",
-            "div[class*='phone'] span",
-            "[data-bem*='phone'] span",
-            "div.business-contacts-view span[title*='+7']",
-            "span[title^='+7']",
-            "div.business-phones-view span",
-            "span:has-text('+7')",
-            "div:has-text('Показать телефон')"
-        ]
-
-        data['phone'] = ''
-        for selector in phone_selectors:
-            phone_elems = page.query_selector_all(selector)
-            for phone_elem in phone_elems:
-                phone_text = phone_elem.inner_text().strip()
-                # Проверяем на наличие цифр и символов телефона
-                if re.search(r'[\d+\-\(\)\s]{7,}', phone_text):
-                    # Очищаем от лишних символов, оставляя только цифры, +, -, (, ), пробелы
-                    phone_cleaned = re.sub(r'[^\d+\-\(\)\s]', '', phone_text).strip()
-                    if len(phone_cleaned) >= 7:  # Минимальная длина телефона
-                        data['phone'] = phone_cleaned
-                        print(f"Найден телефон: {data['phone']}")
-                        break
-
-                # Также проверяем атрибут title
-                title_attr = phone_elem.get_attribute('title')
-                if title_attr and re.search(r'[\d+\-\(\)\s]{7,}', title_attr):
-                    phone_cleaned = re.sub(r'[^\d+\-\(\)\s]', '', title_attr).strip()
-                    if len(phone_cleaned) >= 7:
-                        data['phone'] = phone_cleaned
-                        print(f"Найден телефон в title: {data['phone']}")
-                        break
-
-            if data['phone']:
-                break
-    except Exception:
-        data['phone'] = ''
-
-    # Ближайшее метро
-    try:
-        metro_block = page.query_selector("div.masstransit-stops-view._type_metro")
-        if metro_block:
-            metro_name = metro_block.query_selector("div.masstransit-stops-view__stop-name")
-            metro_dist = metro_block.query_selector("div.masstransit-stops-view__stop-distance-text")
-            data['nearest_metro'] = {
-                'name': metro_name.inner_text().strip() if metro_name else '',
-                'distance': metro_dist.inner_text().strip() if metro_dist else ''
-            }
-        else:
-            data['nearest_metro'] = {'name': '', 'distance': ''}
-    except Exception:
-        data['nearest_metro'] = {'name': '', 'distance': ''}
-
-    # Ближайшая остановка
-    try:
-        stop_block = page.query_selector("div.masstransit-stops-view._type_masstransit")
-        if stop_block:
-            stop_name = stop_block.query_selector("div.masstransit-stops-view__stop-name")
-            stop_dist = stop_block.query_selector("div.masstransit-stops-view__stop-distance-text")
-            data['nearest_stop'] = {
-                'name': stop_name.inner_text().strip() if stop_name else '',
-                'distance': stop_dist.inner_text().strip() if stop_dist else ''
-            }
-        else:
-            data['nearest_stop'] = {'name': '', 'distance': ''}
-    except Exception:
-        data['nearest_stop'] = {'name': '', 'distance': ''}
-
-    # Сайт
-    try:
-        site_el = page.query_selector("a.business-urls-view__link")
-        data['site'] = site_el.get_attribute('href') if site_el else ''
-    except Exception:
-        data['site'] = ''
-
-    # Описание
-    try:
-        desc_el = page.query_selector("div.card-about-view__description-text, div[class*='description']")
-        data['description'] = desc_el.inner_text().strip() if desc_el else ''
-    except Exception:
-        data['description'] = ''
-
-    # Категории бизнеса (основные)
-    try:
-        # Сначала ищем основные категории бизнеса
-        business_category_selectors = [
-            "div.business-card-title-view__categories span",
-            "div.business-summary-view__categories span",
-            "span.business-card-title-view__category",
-            "div.card-title-view__categories span",
-            "[class*='business-card'] [class*='categories'] span",
-            "div[class*='category'] span"
-        ]
-
-        rubric = []
-        for selector in business_category_selectors:
-            cats = page.query_selector_all(selector)
-            if cats:
-                categories = [c.inner_text().strip() for c in cats if c.inner_text().strip()]
-                if categories:
-                    rubric = categories
-                    print(f"Найдены основные категории бизнеса: {categories}")
-                    break
-        data['rubric'] = rubric
-
-        # Если основные категории не найдены, пробуем категории товаров/услуг
-        data['categories'] = []
-
-    except Exception:
-        data['categories'] = []
-
-    # Рейтинг
-    try:
-        rating_selectors = [
-            "span.business-rating-badge-view__rating-text",
-            "div.business-header-rating-view__rating span",
-            "span[class*='rating-text']",
-            "span.business-summary-rating-badge-view__rating-text"
-        ]
-
-        data['rating'] = ''
-        for selector in rating_selectors:
-            rating_el = page.query_selector(selector)
-            if rating_el:
-                rating_text = rating_el.inner_text().replace(',', '.').strip()
-                if rating_text and rating_text != '':
-                    data['rating'] = rating_text
-                    break
-    except Exception:
-        data['rating'] = ''
-
-    # Количество оценок
-    try:
-        ratings_count_el = page.query_selector("div.business-header-rating-view__text._clickable, span:has-text('оценок'), span:has-text('оценка')")
-        if ratings_count_el:
-            text = ratings_count_el.inner_text()
-            match = re.search(r"(\d+)", text.replace('\xa0', ' '))
-            data['ratings_count'] = match.group(1) if match else ''
-        else:
-            data['ratings_count'] = ''
-    except Exception:
-        data['ratings_count'] = ''
-
-    # --- КОЛИЧЕСТВО ОТЗЫВОВ ---
-    try:
-        reviews_count = ''
-        # 1. С вкладки "Отзывы"
-        counter_el = page.query_selector("div.tabs-select-view__title._name_reviews div.tabs-select-view__counter")
-        if counter_el:
-            reviews_count = counter_el.inner_text().strip()
-        # 2. Из заголовка секции отзывов
-        if not reviews_count:
-            h2_el = page.query_selector("h2.card-section-header__title._wide")
-            if h2_el:
-                import re
-                match = re.search(r"(\d+)", h2_el.inner_text())
-                if match:
-                    reviews_count = match.group(1)
-        data['reviews_count'] = reviews_count
-    except Exception:
-        data['reviews_count'] = ''
-
-    # --- ЧАСЫ РАБОТЫ ---
-    try:
-        # Ищем таблицу с расписанием
-        intervals_table = page.query_selector("div.business-working-intervals-view")
-        hours_full = []
-        if intervals_table:
-            rows = intervals_table.query_selector_all("div.business-working-intervals-view__item")
-            for row in rows:
-                day_el = row.query_selector("div.business-working-intervals-view__day")
-                interval_el = row.query_selector("div.business-working-intervals-view__interval")
-                day = day_el.inner_text().strip() if day_el else ''
-                interval = interval_el.inner_text().strip() if interval_el else ''
-                if day and interval:
-                    hours_full.append(f"{day}: {interval}")
-        data['hours_full'] = hours_full
-        # Краткая форма: если все дни одинаковые, выводим "Пн-Вс: 10:00–00:00"
-        if hours_full and len(set([h.split(': ')[1] for h in hours_full])) == 1:
-            interval = hours_full[0].split(': ')[1]
-            data['hours'] = f"Пн-Вс: {interval}"
-        else:
-            data['hours'] = '; '.join(hours_full)
-    except Exception:
-        data['hours'] = ''
-        data['hours_full'] = []
-
-    # Социальные сети
-    try:
-        social_links = []
-        social_els = page.query_selector_all("a[href*='vk.com'], a[href*='instagram.com'], a[href*='facebook.com'], a[href*='twitter.com'], a[href*='ok.ru'], a[href*='t.me']")
-        for el in social_els:
-            href = el.get_attribute('href')
-            if href:
-                social_links.append(href)
-        data['social_links'] = social_links
-    except Exception:
-        data['social_links'] = []
+        with span('extract', spec='overview'):
+            data = build_overview(extract(page, OVERVIEW_SPEC))
+    except Exception as e:
+        print(f"Ошибка при извлечении обзора: {e}")
+        data = build_overview({})
+    if data['phone']:
+        print(f"Найден телефон: {data['phone']}")
+    if data['rubric']:
+        print(f"Найдены основные категории бизнеса: {data['rubric']}")
 
     # --- ПЕРЕХОД НА ВКЛАДКУ "Товары и услуги" ---
-    products_tab = page.query_selector("div[role='tab']:has-text('Товары и услуги'), button:has-text('Товары и услуги'), div.tabs-select-view__title._name_prices")
+    products_tab = page.query_selector(TAB_SELECTORS['products'])
     if products_tab:
         products_tab.click()
         print("Клик по вкладке 'Товары и услуги'")
-        page.wait_for_timeout(1500)
+        wait_for_ready(page, selector=TAB_READY_SELECTORS['products'], timeout=5000)
     # --- ПАРСИНГ ТОВАРОВ И УСЛУГ ПО КАТЕГОРИЯМ ---
     try:
-        products = []
-        product_categories = []  # Новый список для названий категорий
-        category_blocks = page.query_selector_all('div.business-full-items-grouped-view__category')
-        for cat_block in category_blocks:
-            # Название категории
-            cat_title_el = cat_block.query_selector('div.business-full-items-grouped-view__title')
-            category = cat_title_el.inner_text().strip() if cat_title_el else ''
-            if category:
-                product_categories.append(category)
-            # Все услуги/товары в категории
-            items = []
-            item_blocks = cat_block.query_selector_all('div.business-full-items-grouped-view__item')
-            for item in item_blocks:
-                # Пробуем сначала фото-товары
-                name_el = item.query_selector('div.related-item-photo-view__title')
-                desc_el = item.query_selector('div.related-item-photo-view__description')
-                price_el = item.query_selector('span.related-product-view__price')
-                duration_el = item.query_selector('span.related-product-view__volume')
-                photo_el = item.query_selector('img.image__img')
-
-                # Если не найдено, пробуем текстовые услуги (related-item-list-view)
-                if not name_el:
-                    name_el = item.query_selector('div.related-item-list-view__title')
-                if not price_el:
-                    price_el = item.query_selector('div.related-item-list-view__price')
-                if not desc_el:
-                    desc_el = item.query_selector('div.related-item-list-view__subtitle')
-                # Фото для таких услуг обычно нет
-
-                name = name_el.inner_text().strip() if name_el else ''
-                description = desc_el.inner_text().strip() if desc_el else ''
-                price = price_el.inner_text().strip() if price_el else ''
-                duration = duration_el.inner_text().strip() if duration_el else ''
-                photo = photo_el.get_attribute('src') if photo_el else ''
-
-                items.append({
-                    'name': name,
-                    'description': description,
-                    'price': price,
-                    'duration': duration,
-                    'photo': photo
-                })
-            products.append({
-                'category': category,
-                'items': items
-            })
-        data['products'] = products
-        data['product_categories'] = product_categories  # Сохраняем список категорий
+        with span('extract', spec='products'):
+            data.update(build_products(extract(page, PRODUCTS_SPEC)))
     except Exception:
         data['products'] = []
         data['product_categories'] = []
 
     return data
 
-def parse_reviews(page):
-    """Парсит отзывы с правильным подсчетом"""
+def _sort_reviews_by_newest(page, capture: NetworkCapture | None = None):
+    """
+    Переключает сортировку отзывов на «По новизне» — без неё водяной знак не работает.
+    Ответы API, пришедшие до переключения (сортировка по умолчанию), из capture удаляются:
+    дальше используются только ответы в новом порядке, начиная с первой страницы.
+    """
+    try:
+        ranking = page.query_selector(REVIEWS_RANKING_SELECTOR)
+        if not ranking:
+            print("Сортировка отзывов не найдена, водяной знак может сработать неточно")
+            return False
+        ranking.click()
+        option = page.wait_for_selector(REVIEWS_NEWEST_OPTION, timeout=3000)
+        # Вкладка уже дождалась загрузки, так что всё собранное к этому моменту — старый порядок
+        if capture:
+            capture.reset('reviews')
+        option.click()
+        wait_for_ready(page, selector=TAB_READY_SELECTORS['reviews'], timeout=8000)
+        return True
+    except Exception as e:
+        print(f"Не удалось отсортировать отзывы по новизне: {e}")
+        return False
+
+def parse_reviews(page, capture: NetworkCapture | None = None, max_reviews: int | None = None, watermark: ReviewWatermark | None = None):
+    """
+    Парсит отзывы с правильным подсчетом. Элементы берутся из перехваченного API, если есть.
+    Прокрутка останавливается, как только загружено reviews_count (или max_reviews) отзывов.
+    С watermark отзывы сортируются по новизне, прокрутка идёт до первого известного отзыва,
+    а возвращаются только новые (склеить с сохранёнными — review_delta.merge_reviews).
+    """
     try:
-        reviews_tab = page.query_selector("div.tabs-select-view__title._name_reviews, div[role='tab']:has-text('Отзывы'), button:has-text('Отзывы')")
+        reviews_tab = page.query_selector(TAB_SELECTORS['reviews'])
         if reviews_tab:
             reviews_tab.click()
             print("Клик по вкладке 'Отзывы'")
-            page.wait_for_timeout(2000)
+            wait_for_ready(page, selector=TAB_READY_SELECTORS['reviews'], timeout=8000)
         else:
             print("Вкладка 'Отзывы' не найдена!")
-        
-        reviews_data = {"items": [], "rating": "", "reviews_count": ""}
 
-        # Рейтинг и количество отзывов - ПРАВИЛЬНЫЙ подсчет
+        # Рейтинг и количество отзывов из заголовка секции
         try:
-            rating_el = page.query_selector("span.business-rating-badge-view__rating-text")
-            reviews_data['rating'] = rating_el.inner_text().replace(',', '.').strip() if rating_el else ''
-
-            # Правильный подсчет количества отзывов из заголовка секции
-            count_selectors = [
-                "h2.card-section-header__title._wide",
-                "div.business-reviews-card-view__header h2",
-                "h2:has-text('отзыв')",
-                "span.business-rating-badge-view__reviews-count",
-                "div.business-header-rating-view__text._clickable",
-                "div[class*='reviews-count']",
-                "span:has-text('отзыв')",
-                "[class*='rating-badge'] [class*='count']"
-            ]
-
-            reviews_data['reviews_count'] = ''
-            for selector in count_selectors:
-                count_el = page.query_selector(selector)
-                if count_el:
-                    text = count_el.inner_text().strip()
-                    # Извлекаем числа из текста типа "125 отзывов" или "1 отзыв"  
-                    import re
-                    match = re.search(r"(\d+(?:\s*\d+)*)", text.replace('\xa0', ' ').replace(' ', ''))
-                    if match:
-                        # Очищаем от пробелов и берем только цифры
-                        number_str = re.sub(r'\D', '', match.group(1))
-                        if number_str:
-                            reviews_data['reviews_count'] = number_str
-                            print(f"Найдено количество отзывов: {reviews_data['reviews_count']}")
-                            break
+            reviews_data = build_reviews_header(extract(page, REVIEWS_HEADER_SPEC))
+            if reviews_data['reviews_count']:
+                print(f"Найдено количество отзывов: {reviews_data['reviews_count']}")
         except Exception as e:
             print(f"Ошибка при подсчете отзывов: {e}")
-            pass
-
-        # Скролл для загрузки отзывов
-        max_loops = 100
-        patience = 30
-        last_count = 0
-        same_count = 0
-
-        for i in range(max_loops):
-            # Иногда двигаем мышь
-            if i % 7 == 0:
-                page.mouse.move(random.randint(200, 600), random.randint(400, 800))
-
-            # Иногда кликаем по вкладке 'Отзывы'
-            if i % 25 == 0 and reviews_tab:
-                reviews_tab.click()
-                time.sleep(0.5)
-
-            # Прокручиваем вниз
-            page.mouse.wheel(0, 1000)
-            time.sleep(random.uniform(1.5, 2.5))
+            reviews_data = empty_reviews()
 
-            # Проверяем количество загруженных отзывов
-            current_reviews = page.query_selector_all("div.business-review-view, div[class*='review-item']")
-            current_count = len(current_reviews)
+        # Без сортировки по новизне срез по водяному знаку неверен — собираем отзывы целиком
+        if watermark and not _sort_reviews_by_newest(page, capture):
+            watermark = None
 
-            if current_count == last_count:
-                same_count += 1
-                if same_count >= patience:
-                    print(f"Отзывы перестали загружаться после {i} итераций. Найдено {current_count} отзывов")
-                    break
-            else:
-                same_count = 0
-                last_count = current_count
-                print(f"Загружено отзывов: {current_count}")
-
-        # Парсим отзывы с ИМЕНАМИ авторов
+        # Скролл для загрузки отзывов до известного количества, max_reviews или известного отзыва
         try:
-            review_blocks = page.query_selector_all("div.business-review-view")
-            print(f"Найдено блоков отзывов: {len(review_blocks)}")
-
-            for block in review_blocks:
-                try:
-                    # Имя автора - УЛУЧШЕННЫЙ парсинг
-                    author = ""
-                    author_selectors = [
-                        "span.business-review-view__author-name",
-                        "div.business-review-view__author span",
-                        "div.business-review-view__author",
-                        "[class*='author-name']",
-                        "[data-bem*='author'] span"
-                    ]
-
-                    for selector in author_selectors:
-                        author_elem = block.query_selector(selector)
-                        if author_elem:
-                            author_text = author_elem.inner_text().strip()
-                            if author_text and not author_text.isspace():
-                                author = author_text
-                                break
-
-                    # Дата
-                    date_el = block.query_selector("div.business-review-view__date, span.business-review-view__date, span[class*='date']")
-                    date = date_el.inner_text().strip() if date_el else ""
-
-                    # Рейтинг (звёзды) - улучшенный парсинг
-                    rating = 0
-
-                    # Расширенные селекторы для звёзд
-                    star_selectors = [
-                        "span.business-rating-view__star._fill",
-                        "span[class*='star-fill']", 
-                        "span[class*='rating-star'][class*='fill']",
-                        "div.business-rating-view__stars span._fill",
-                        "span.business-review-view__rating-star._fill",
-                        "div[class*='stars'] span[class*='fill']",
-                        "span[class*='star'][class*='active']"
-                    ]
-
-                    for selector in star_selectors:
-                        rating_els = block.query_selector_all(selector)
-                        if rating_els and len(rating_els) > 0:
-                            rating = len(rating_els)
-                            break
-
-                    # Если не нашли звёзды, ищем атрибут с рейтингом
-                    if rating == 0:
-                        rating_meta = block.query_selector("meta[itemprop='ratingValue']")
-                        if rating_meta:
-                            try:
-                                rating = int(float(rating_meta.get_attribute('content')))
-                            except:
-                                pass
-
-                    # Если всё ещё не нашли, ищем текстовый рейтинг
-                    if rating == 0:
-                        rating_text_selectors = [
-                            "span[class*='rating-text']",
-                            "div[class*='score']",
-                            "div.business-review-view__rating",
-                            "span[class*='review-rating']"
-                        ]
-
-                        for selector in rating_text_selectors:
-                            rating_text_elem = block.query_selector(selector)
-                            if rating_text_elem:
-                                rating_text = rating_text_elem.inner_text().strip()
-                                # Ищем число в тексте (например "5 из 5", "4.5")
-                                import re
-                                match = re.search(r'(\d+(?:\.\d+)?)', rating_text)
-                                if match:
-                                    try:
-                                        rating = int(float(match.group(1)))
-                                        break
-                                    except:
-                                        continue
-
-                    # Текст отзыва
-                    text_el = block.query_selector("div.business-review-view__body, div[class*='review-text']")
-                    text = text_el.inner_text().strip() if text_el else ""
+            controller = ReviewsScrollController(target=reviews_data['reviews_count'], max_reviews=max_reviews, pacing=get_pacing(), watermark=watermark, capture=capture)
+            loaded = controller.run(page)
+            print(f"Прокрутка отзывов завершена ({controller.stop_reason}) после {controller.scrolls} прокруток. Найдено {loaded} отзывов")
+        except Exception as e:
+            print(f"Ошибка при прокрутке отзывов: {e}")
 
-                    # Ответ организации - как в рабочем коде
-                    reply = ""
-                    try:
-                        reply_btn = block.query_selector("div.business-review-view__comment-expand[aria-label='Посмотреть ответ организации']")
-                        if reply_btn and reply_btn.is_visible():
-                            reply_btn.click()
-                            page.wait_for_timeout(500)
-                            reply_el = block.query_selector("div.business-review-comment-content__bubble")
-                            if reply_el:
-                                reply = reply_el.inner_text().strip()
-                    except Exception:
-                        pass
+        # Отзывы из перехваченных ответов fetchReviews — без обхода DOM
+        if capture and apply_captured_reviews(reviews_data, capture.collect('reviews'), max_reviews):
+            return apply_watermark(reviews_data, watermark)
 
-                    reviews_data['items'].append({
-                        "author": author,
-                        "date": date,
-                        "score": rating,
-                        "text": text,
-                        "org_reply": reply
-                    })
-                except Exception:
-                    continue
-        except Exception:
-            pass
+        # Отзывы из DOM: сначала раскрываем ответы организации, затем всё одним evaluate
+        try:
+            if page.evaluate(EXPAND_REPLIES_JS, REPLY_BUTTON_SELECTOR):
+                wait_for_ready(page, selector=REPLY_SELECTOR, timeout=1500, quiet_ms=100)
+            with span('extract', spec='reviews'):
+                reviews_data['items'] = build_review_items(extract(page, REVIEW_ITEMS_SPEC), max_reviews)
+            print(f"Найдено блоков отзывов: {len(reviews_data['items'])}")
+        except Exception as e:
+            print(f"Ошибка при разборе отзывов: {e}")
 
-        return reviews_data
+        return apply_watermark(reviews_data, watermark)
     except Exception:
-        return {"items": [], "rating": "", "reviews_count": ""}
+        return empty_reviews()
 
-def parse_news(page):
-    """Парсит новости"""
+def parse_news(page, capture: NetworkCapture | None = None):
+    """Парсит новости. Берёт их из перехваченного API, если есть"""
     try:
         # Переход на вкладку "Новости"
-        news_tab = page.query_selector("div.tabs-select-view__title._name_posts, div[role='tab']:has-text('Новости'), button:has-text('Новости')")
+        news_tab = page.query_selector(TAB_SELECTORS['news'])
         if news_tab:
             news_tab.click()
             print("Клик по вкладке 'Новости'")
-            page.wait_for_timeout(1500)
-            # Скролл для новостей
-            for i in range(20):
-                page.mouse.wheel(0, 1000)
-                time.sleep(1.5)
+            wait_for_ready(page, selector=TAB_READY_SELECTORS['news'], timeout=5000)
+            # Скролл для новостей, пока подгружаются новые посты
+            scroll_until_stable(page, TAB_READY_SELECTORS['news'], max_scrolls=20, pacing=get_pacing())
         else:
             print("Вкладка 'Новости' не найдена")
             return []
 
-        # Парсинг новостей - как в рабочем коде
-        news = []
-        news_blocks = page.query_selector_all('div.business-posts-list-post-view')
-        for block in news_blocks:
-            try:
-                date_el = block.query_selector('div.business-posts-list-post-view__date')
-                date = date_el.inner_text().strip() if date_el else ''
-
-                text_el = block.query_selector('div.business-posts-list-post-view__text')
-                text = text_el.inner_text().strip() if text_el else ''
-
-                photo_els = block.query_selector_all('img.image__img')
-                photos = [el.get_attribute('src') for el in photo_els if el.get_attribute('src')]
-
-                news.append({
-                    'date': date,
-                    'text': text,
-                    'photos': photos
-                })
-            except Exception:
-                continue
+        if capture:
+            news = news_from_payloads(capture.collect('news'))
+            if news:
+                print(f"Новости из API: {len(news)}")
+                return news
 
+        news = build_news(extract(page, NEWS_SPEC))
         print(f"Спарсено новостей: {len(news)}")
         return news
     except Exception as e:
@@ -842,39 +473,29 @@ def parse_news(page):
 def get_photos_count(page):
     """Получает количество фотографий"""
     try:
-        photos_tab = page.query_selector("div.tabs-select-view__title._name_gallery")
-        if photos_tab:
-            try:
-                counter = photos_tab.query_selector("div.tabs-select-view__counter")
-                if counter:
-                    return counter.inner_text().strip()
-            except Exception:
-                pass
-        return "0"
+        return extract(page, PHOTOS_COUNT_SPEC)['photos_count']
     except Exception:
         return "0"
 
-def parse_photos(page):
-    """Парсинг фотографий"""
+def parse_photos(page, capture: NetworkCapture | None = None):
+    """Парсинг фотографий. Ссылки берутся из перехваченного API, если есть"""
     try:
-        photos_tab = page.query_selector("div.tabs-select-view__title._name_gallery, div[role='tab']:has-text('Фото'), button:has-text('Фото')")
+        photos_tab = page.query_selector(TAB_SELECTORS['photos'])
         if photos_tab:
             photos_tab.click()
             print("Клик по вкладке 'Фото'")
-            page.wait_for_timeout(1500)
+            wait_for_ready(page, selector=TAB_READY_SELECTORS['photos'], timeout=5000)
 
-            # Скролл для загрузки фото
-            for i in range(20):
-                page.mouse.wheel(0, 1000)
-                time.sleep(1.5)
+            # Скролл для загрузки фото, пока подгружаются новые
+            scroll_until_stable(page, TAB_READY_SELECTORS['photos'], max_scrolls=20, pacing=get_pacing())
 
-        photos = []
-        img_elems = page.query_selector_all("img.image__img, img[src*='avatars.mds.yandex.net']")
-        for img in img_elems:
-            src = img.get_attribute('src')
-            if src and src not in photos:
-                photos.append(src)
-        return photos
+        if capture:
+            photos = photos_from_payloads(capture.collect('photos'))
+            if photos:
+                print(f"Фото из API: {len(photos)}")
+                return photos
+
+        return build_photos(extract(page, PHOTOS_SPEC))
     except Exception:
         return []
 
@@ -882,147 +503,32 @@ def parse_features(page):
     """Парсинг особенностей"""
     try:
         # Переход на вкладку "Особенности"
-        features_tab = page.query_selector("div.tabs-select-view__title._name_features, div[role='tab']:has-text('Особенности'), button:has-text('Особенности')")
+        features_tab = page.query_selector(TAB_SELECTORS['features'])
         if features_tab:
             features_tab.click()
             print("Клик по вкладке 'Особенности'")
-            page.wait_for_timeout(1500)
+            wait_for_ready(page, selector=TAB_READY_SELECTORS['features'], timeout=5000)
         else:
             print("Вкладка 'Особенности' не найдена!")
 
-        # Парсинг особенностей - как в рабочем коде
-        features = []
-        feature_blocks = page.query_selector_all("[class*='features-view__item']")
-        for block in feature_blocks:
-            name_el = block.query_selector("[class*='features-view__item-title']")
-            value_el = block.query_selector("[class*='features-view__item-value']")
-            name = name_el.inner_text().strip() if name_el else ''
-            value = value_el.inner_text().strip() if value_el else ''
-            if name or value:
-                features.append({"name": name, "value": value})
-
-        # Парсинг булевых особенностей (галочки с типом)
-        features_bool = []
-        bool_items = page.query_selector_all("div.business-features-view__bool-item")
-        for item in bool_items:
-            text_el = item.query_selector("div.business-features-view__bool-text")
-            icon_el = item.query_selector("div.business-features-view__bool-icon")
-            text = text_el.inner_text().strip() if text_el else ''
-            is_defined = False
-            if icon_el and '_defined' in (icon_el.get_attribute('class') or ''):
-                is_defined = True
-            if text:
-                features_bool.append({"text": text, "defined": is_defined})
-
-        # Дополнительно: отдельные business-features-view__bool-text без обёртки
-        all_bool_texts = page.query_selector_all("div.business-features-view__bool-text")
-        for text_el in all_bool_texts:
-            text = text_el.inner_text().strip()
-            if text and not any(fb['text'] == text for fb in features_bool):
-                features_bool.append({"text": text, "defined": False})
-
-        # Парсинг ценностных особенностей (категории услуг)
-        features_valued = []
-        valued_blocks = page.query_selector_all("div.business-features-view__valued")
-        for block in valued_blocks:
-            title_el = block.query_selector("span.business-features-view__valued-title")
-            value_el = block.query_selector("span.business-features-view__valued-value")
-            title = title_el.inner_text().strip(':').strip() if title_el else ''
-            value = value_el.inner_text().strip() if value_el else ''
-            if title or value:
-                features_valued.append({"title": title, "value": value})
-
-        # Выделение цен из features_valued
-        features_prices = []
-        for item in features_valued:
-            if 'цена' in item['title'].lower() or '₽' in item['value']:
-                features_prices.append(item)
-
-        # Парсинг категорий из блока orgpage-categories-info-view
-        categories_full = []
-        cat_block = page.query_selector("div.orgpage-categories-info-view")
-        if cat_block:
-            cat_spans = cat_block.query_selector_all("span.button__text")
-            categories_full = [span.inner_text().strip() for span in cat_spans if span.inner_text()]
-
-        # Собираем все особенности в features_full
-        features_full = {
-            "bool": features_bool,
-            "valued": features_valued,
-            "prices": features_prices,
-            "categories": categories_full
-        }
-
-        print(f"Найдено особенностей: bool={len(features_bool)}, valued={len(features_valued)}, prices={len(features_prices)}, categories={len(categories_full)}")
+        with span('extract', spec='features'):
+            features_full = build_features(extract(page, FEATURES_SPEC))
+        print(f"Найдено особенностей: bool={len(features_full['bool'])}, valued={len(features_full['valued'])}, prices={len(features_full['prices'])}, categories={len(features_full['categories'])}")
         return features_full
     except Exception as e:
         print(f"Ошибка при парсинге особенностей: {e}")
-        return {
-            "bool": [],
-            "valued": [],
-            "prices": [],
-            "categories": []
-        }
+        return empty_features()
 
 def parse_competitors(page):
     """Парсинг конкурентов из секции 'Похожие места рядом'"""
     try:
-        competitors = []
-
-        # Ищем секцию с похожими местами - добавляю актуальный селектор
-        similar_selectors = [
-            "div.card-similar-carousel",
-            "div.card-similar-carousel-wide",
-            "div[class*='carousel']",
-            "div[role='presentation'][class*='carousel']"
-        ]
-
-        similar_section = None
-        for selector in similar_selectors:
-            similar_section = page.query_selector(selector)
-            if similar_section:
-                break
-
-        if not similar_section:
+        raw = extract(page, COMPETITORS_SPEC)
+        if raw['section'] is None:
             print("Секция конкурентов не найдена!")
             return []
-
-        # Ищем ссылки на конкурентов
-        competitor_links = similar_section.query_selector_all("a.link-wrapper")
-        for link in competitor_links:
-            try:
-                url = link.get_attribute('href')
-                if url and not url.startswith('http'):
-                    url = 'https://yandex.ru' + url
-
-                # Название конкурента
-                title_el = link.query_selector("div.orgpage-similar-item__title")
-                title = title_el.inner_text().strip() if title_el else ''
-
-                # Категория
-                category_el = link.query_selector("div.orgpage-similar-item__rubrics")
-                category = category_el.inner_text().strip() if category_el else ''
-
-                # Рейтинг
-                rating_el = link.query_selector("span.business-rating-badge-view__rating-text, div.business-rating-badge-view__rating-text")
-                rating = rating_el.inner_text().strip() if rating_el else ''
-
-                if title and url:
-                    competitors.append({
-                        'title': title,
-                        'url': url,
-                        'category': category,
-                        'rating': rating
-                    })
-                    print(f"Найден конкурент: {title} - {rating}")
-            except Exception as e:
-                print(f"Ошибка при парсинге конкурента: {e}")
-                continue
-
+        competitors = build_competitors(raw)
         print(f"Всего найдено конкурентов: {len(competitors)}")
-        return competitors[:5]  # Ограничиваем 5 конкурентами
+        return competitors
     except Exception as e:
         print(f"Ошибка при поиске конкурентов: {e}")
         return []
-
-# This code parses Yandex Maps public pages to extract information like title, address, phone, etc.
\ No newline at end of file
@@ -0,0 +1,256 @@
+"""
+rate_limiter.py — Адаптивное ограничение частоты запросов и автомат-предохранитель по капчам
+
+На каждый выход в сеть (прокси или прямое соединение) заводится свой EgressLimiter:
+- ведро токенов ограничивает частоту открытия карточек (карточек в минуту);
+- скорость подбирается по AIMD: после удачной карточки растёт на шаг, после капчи
+  или тайм-аута делится пополам, так что держится у реального лимита сайта;
+- предохранитель (circuit breaker): несколько капч подряд отключают выход на время
+  остывания, после чего пропускается одна пробная карточка. Повторный провал
+  удваивает время остывания.
+
+Ограничитель живёт в основном процессе пакетного режима, который раздаёт задачи
+воркерам, поэтому лимит общий для всех процессов. Параметры по умолчанию задаются
+переменными окружения RATE_LIMIT_PER_MIN, RATE_LIMIT_MIN, RATE_LIMIT_MAX,
+RATE_LIMIT_BURST, CIRCUIT_CAPTCHA_THRESHOLD и CIRCUIT_COOLDOWN_SEC.
+"""
+from urllib.parse import urlsplit
+import asyncio
+import os
+import threading
+import time
+
+DIRECT = 'direct'
+
+OK = 'ok'
+CAPTCHA = 'captcha'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def egress_key(proxy) -> str:
+    """
+    Имя выхода в сеть для ограничителя: [user@]host:port прокси без пароля или 'direct'.
+    proxy — строка или параметры Playwright {"server", "username"}. Логин входит в ключ:
+    у шлюзовых прокси сессия (а с ней и IP) задаётся именем пользователя при том же сервере.
+    """
+    username = None
+    if isinstance(proxy, dict):
+        username = proxy.get('username')
+        proxy = proxy.get('server')
+    if not proxy:
+        return DIRECT
+    parts = urlsplit(proxy if '://' in proxy else f"http://{proxy}")
+    host = f"{parts.hostname}:{parts.port}" if parts.port else (parts.hostname or DIRECT)
+    username = username or parts.username
+    return f"{username}@{host}" if username else host
+
+
+def classify_result(result) -> str:
+    """Исход карточки для ограничителя: ok, captcha, timeout или error"""
+    error = result.get('error') if isinstance(result, dict) else result
+    if not error:
+        data = result.get('data') if isinstance(result, dict) else None
+        if isinstance(data, dict) and data.get('error') == 'captcha_detected':
+            return CAPTCHA
+        return OK
+    error = str(error).lower()
+    if 'captcha' in error or 'капч' in error:
+        return CAPTCHA
+    if 'тайм-аут' in error or 'timeout' in error:
+        return TIMEOUT
+    return ERROR
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в минуту, не больше burst в запасе"""
+
+    def __init__(self, rate_per_min: float, burst: float = 1.0):
+        self.rate_per_min = rate_per_min
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate_per_min / 60.0)
+        self.updated = now
+
+    def delay(self, now: float | None = None) -> float:
+        """Через сколько секунд будет доступен токен"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) * 60.0 / self.rate_per_min
+
+    def take(self, now: float | None = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class EgressLimiter:
+    """Ведро токенов, AIMD и предохранитель одного выхода в сеть"""
+
+    def __init__(self, name: str = DIRECT, rate_per_min: float | None = None, min_rate: float | None = None,
+                 max_rate: float | None = None, burst: float | None = None, increase: float = 0.5,
+                 decrease: float = 0.5, captcha_threshold: int | None = None, cooldown_sec: float | None = None,
+                 max_cooldown_sec: float = 3600.0):
+        self.name = name
+        self.min_rate = min_rate if min_rate is not None else _env_float('RATE_LIMIT_MIN', 1.0)
+        self.max_rate = max_rate if max_rate is not None else _env_float('RATE_LIMIT_MAX', 30.0)
+        rate = rate_per_min if rate_per_min is not None else _env_float('RATE_LIMIT_PER_MIN', 6.0)
+        self.bucket = TokenBucket(min(max(rate, self.min_rate), self.max_rate),
+                                  burst if burst is not None else _env_float('RATE_LIMIT_BURST', 2.0))
+        self.increase = increase
+        self.decrease = decrease
+        self.captcha_threshold = int(captcha_threshold if captcha_threshold is not None else _env_float('CIRCUIT_CAPTCHA_THRESHOLD', 3))
+        self.base_cooldown = cooldown_sec if cooldown_sec is not None else _env_float('CIRCUIT_COOLDOWN_SEC', 300.0)
+        self.max_cooldown = max(self.base_cooldown, max_cooldown_sec)
+        self.cooldown = self.base_cooldown
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        self.consecutive_captchas = 0
+        self.outcomes = {OK: 0, CAPTCHA: 0, TIMEOUT: 0, ERROR: 0}
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate_per_min
+
+    def delay(self, now: float | None = None) -> float:
+        """Сколько секунд ждать до следующей карточки через этот выход"""
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN:
+            if now < self.open_until:
+                return self.open_until - now
+            self.state = HALF_OPEN
+            self.probe_in_flight = False
+        if self.state == HALF_OPEN and self.probe_in_flight:
+            # Ждём результата пробной карточки
+            return 1.0
+        return self.bucket.delay(now)
+
+    def take(self, now: float | None = None) -> bool:
+        """Забирает токен, если выход доступен прямо сейчас"""
+        now = time.monotonic() if now is None else now
+        if self.delay(now) > 0:
+            return False
+        if not self.bucket.take(now):
+            return False
+        if self.state == HALF_OPEN:
+            self.probe_in_flight = True
+        return True
+
+    def report(self, outcome: str, now: float | None = None):
+        """Учитывает исход карточки: меняет скорость и состояние предохранителя"""
+        now = time.monotonic() if now is None else now
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        if outcome == OK:
+            self.consecutive_captchas = 0
+            self._set_rate(self.rate + self.increase)
+            if self.state == HALF_OPEN:
+                print(f"Выход {self.name}: пробная карточка прошла, предохранитель закрыт")
+                self.state = CLOSED
+                self.cooldown = self.base_cooldown
+            return
+        if outcome in (CAPTCHA, TIMEOUT):
+            self._set_rate(self.rate * self.decrease)
+        if outcome == CAPTCHA:
+            self.consecutive_captchas += 1
+            if self.state == HALF_OPEN:
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self._trip(now)
+            elif self.consecutive_captchas >= self.captcha_threshold:
+                self._trip(now)
+        elif self.state == HALF_OPEN:
+            # Пробная карточка упала не из-за капчи — пробуем снова
+            self.probe_in_flight = False
+
+    def _set_rate(self, rate: float):
+        self.bucket.rate_per_min = min(max(rate, self.min_rate), self.max_rate)
+
+    def _trip(self, now: float):
+        self.state = OPEN
+        self.open_until = now + self.cooldown
+        self.probe_in_flight = False
+        self.consecutive_captchas = 0
+        print(f"Выход {self.name}: предохранитель сработал из-за капчи — пауза {self.cooldown:.0f} с, "
+              f"скорость снижена до {self.rate:.1f} карт./мин")
+
+    def stats(self) -> dict:
+        return {
+            'state': self.state,
+            'rate_per_min': round(self.rate, 2),
+            'cooldown_sec': self.cooldown,
+            'outcomes': dict(self.outcomes),
+        }
+
+
+class RateLimiter:
+    """Набор ограничителей по выходам в сеть; потокобезопасен"""
+
+    def __init__(self, **egress_options):
+        self.egress_options = egress_options
+        self._egresses = {}
+        self._lock = threading.Lock()
+
+    def egress(self, key: str | None = None) -> EgressLimiter:
+        key = key or DIRECT
+        with self._lock:
+            if key not in self._egresses:
+                self._egresses[key] = EgressLimiter(key, **self.egress_options)
+            return self._egresses[key]
+
+    def delay(self, key: str | None = None) -> float:
+        limiter = self.egress(key)
+        with self._lock:
+            return limiter.delay()
+
+    def try_acquire(self, key: str | None = None) -> bool:
+        limiter = self.egress(key)
+        with self._lock:
+            return limiter.take()
+
+    def acquire(self, key: str | None = None):
+        """Блокирует, пока выход не разрешит следующую карточку"""
+        limiter = self.egress(key)
+        while True:
+            with self._lock:
+                if limiter.take():
+                    return
+                delay = limiter.delay()
+            time.sleep(max(0.05, delay))
+
+    async def aacquire(self, key: str | None = None):
+        """То же, что acquire, для async-кода"""
+        limiter = self.egress(key)
+        while True:
+            with self._lock:
+                if limiter.take():
+                    return
+                delay = limiter.delay()
+            await asyncio.sleep(max(0.05, delay))
+
+    def report(self, key: str | None, outcome: str):
+        limiter = self.egress(key)
+        with self._lock:
+            limiter.report(outcome)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {key: limiter.stats() for key, limiter in self._egresses.items()}
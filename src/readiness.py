@@ -0,0 +1,189 @@
+"""
+readiness.py — Ожидание готовности страницы по событиям вместо фиксированных пауз
+
+Вместо time.sleep ждём появления селектора, network-idle или затишья DOM
+(MutationObserver не видит изменений quiet_ms миллисекунд). Человекоподобные
+случайные паузы вынесены в отдельную антибот-политику HumanPacing и настраиваются
+переменными окружения PARSER_JITTER_MIN / PARSER_JITTER_MAX (секунды).
+"""
+from contextlib import contextmanager
+import asyncio
+import os
+import random
+import time
+
+# Промис резолвится, когда DOM не меняется quietMs мс (true) или по общему тайм-ауту (false)
+DOM_QUIET_JS = """
+({quietMs, timeoutMs}) => new Promise(resolve => {
+    let quietTimer = null;
+    let hardTimer = null;
+    const observer = new MutationObserver(() => {
+        clearTimeout(quietTimer);
+        quietTimer = setTimeout(() => done(true), quietMs);
+    });
+    const done = (result) => {
+        observer.disconnect();
+        clearTimeout(quietTimer);
+        clearTimeout(hardTimer);
+        resolve(result);
+    };
+    observer.observe(document.documentElement || document, {childList: true, subtree: true, characterData: true});
+    quietTimer = setTimeout(() => done(true), quietMs);
+    hardTimer = setTimeout(() => done(false), timeoutMs);
+})
+"""
+
+COUNT_JS = "(selector) => document.querySelectorAll(selector).length"
+
+
+class HumanPacing:
+    """Антибот-политика: случайная пауза между действиями, не связанная с готовностью страницы"""
+
+    def __init__(self, min_delay: float = 0.2, max_delay: float = 0.8):
+        self.min_delay = max(0.0, min_delay)
+        self.max_delay = max(self.min_delay, max_delay)
+
+    def delay(self) -> float:
+        return random.uniform(self.min_delay, self.max_delay)
+
+    def pause(self):
+        delay = self.delay()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def apause(self):
+        delay = self.delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_pacing_override = None
+
+
+@contextmanager
+def pacing_override(pacing: HumanPacing):
+    """Временно подменяет политику get_pacing() (например, без пауз при воспроизведении HAR)"""
+    global _pacing_override
+    previous = _pacing_override
+    _pacing_override = pacing
+    try:
+        yield pacing
+    finally:
+        _pacing_override = previous
+
+
+def get_pacing() -> HumanPacing:
+    """Политика пауз из переменных окружения (или подменённая pacing_override)"""
+    if _pacing_override is not None:
+        return _pacing_override
+    return HumanPacing(
+        min_delay=float(os.getenv('PARSER_JITTER_MIN', '0.2')),
+        max_delay=float(os.getenv('PARSER_JITTER_MAX', '0.8')),
+    )
+
+
+def wait_for_dom_quiet(page, quiet_ms: int = 500, timeout: int = 10000) -> bool:
+    """Ждёт, пока DOM перестанет меняться. Возвращает False, если затишья не дождались"""
+    try:
+        return bool(page.evaluate(DOM_QUIET_JS, {'quietMs': quiet_ms, 'timeoutMs': timeout}))
+    except Exception:
+        return False
+
+
+def wait_for_ready(page, selector: str | None = None, timeout: int = 10000, quiet_ms: int = 500, network_idle: bool = False) -> bool:
+    """
+    Ждёт готовности контента: появления selector (если задан), затем network-idle
+    (если network_idle) и затишья DOM. Возвращает True, если селектор найден.
+    """
+    found = True
+    if selector:
+        try:
+            page.wait_for_selector(selector, timeout=timeout, state='attached')
+        except Exception:
+            found = False
+    if network_idle:
+        try:
+            page.wait_for_load_state('networkidle', timeout=timeout)
+        except Exception:
+            pass
+    wait_for_dom_quiet(page, quiet_ms=quiet_ms, timeout=timeout)
+    return found
+
+
+def count_elements(page, selector: str) -> int:
+    try:
+        return page.evaluate(COUNT_JS, selector)
+    except Exception:
+        return 0
+
+
+def scroll_until_stable(page, item_selector: str, max_scrolls: int = 20, quiet_ms: int = 600, timeout: int = 4000, patience: int = 2, pacing: HumanPacing | None = None) -> int:
+    """
+    Скроллит, пока количество элементов item_selector растёт. Останавливается после
+    patience прокруток подряд без новых элементов. Возвращает итоговое количество.
+    """
+    count = count_elements(page, item_selector)
+    stale = 0
+    for i in range(max_scrolls):
+        page.mouse.wheel(0, 1000)
+        wait_for_dom_quiet(page, quiet_ms=quiet_ms, timeout=timeout)
+        if pacing:
+            pacing.pause()
+        new_count = count_elements(page, item_selector)
+        if new_count <= count:
+            stale += 1
+            if stale >= patience:
+                break
+        else:
+            stale = 0
+            count = new_count
+    return count
+
+
+async def async_wait_for_dom_quiet(page, quiet_ms: int = 500, timeout: int = 10000) -> bool:
+    try:
+        return bool(await page.evaluate(DOM_QUIET_JS, {'quietMs': quiet_ms, 'timeoutMs': timeout}))
+    except Exception:
+        return False
+
+
+async def async_wait_for_ready(page, selector: str | None = None, timeout: int = 10000, quiet_ms: int = 500, network_idle: bool = False) -> bool:
+    found = True
+    if selector:
+        try:
+            await page.wait_for_selector(selector, timeout=timeout, state='attached')
+        except Exception:
+            found = False
+    if network_idle:
+        try:
+            await page.wait_for_load_state('networkidle', timeout=timeout)
+        except Exception:
+            pass
+    await async_wait_for_dom_quiet(page, quiet_ms=quiet_ms, timeout=timeout)
+    return found
+
+
+async def async_count_elements(page, selector: str) -> int:
+    try:
+        return await page.evaluate(COUNT_JS, selector)
+    except Exception:
+        return 0
+
+
+async def async_scroll_until_stable(page, item_selector: str, max_scrolls: int = 20, quiet_ms: int = 600, timeout: int = 4000, patience: int = 2, pacing: HumanPacing | None = None) -> int:
+    count = await async_count_elements(page, item_selector)
+    stale = 0
+    for i in range(max_scrolls):
+        await page.mouse.wheel(0, 1000)
+        await async_wait_for_dom_quiet(page, quiet_ms=quiet_ms, timeout=timeout)
+        if pacing:
+            await pacing.apause()
+        new_count = await async_count_elements(page, item_selector)
+        if new_count <= count:
+            stale += 1
+            if stale >= patience:
+                break
+        else:
+            stale = 0
+            count = new_count
+    return count
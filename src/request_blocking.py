@@ -0,0 +1,123 @@
+"""
+request_blocking.py — Блокировка картинок, шрифтов, медиа, тайлов карты и аналитики при парсинге
+
+Для парсинга нужен только DOM и атрибуты src картинок, поэтому сами файлы
+картинок, шрифты, видео, тайлы карты и маяки Метрики можно не скачивать.
+RequestBlocker вешается на страницу через page.route и считает, сколько запросов
+каждого типа отклонено. Размер отклонённого ответа неизвестен (ответа не было),
+поэтому сэкономленные байты оцениваются по средним размерам ресурсов.
+
+Включается параметром block_resources или переменной окружения PARSER_BLOCK_RESOURCES=1;
+в пакетном режиме включено по умолчанию.
+"""
+import os
+import re
+
+BLOCKED_RESOURCE_TYPES = ('image', 'media', 'font')
+
+# Категория -> регулярные выражения по URL
+BLOCKED_URL_PATTERNS = {
+    'tile': [
+        r'core-renderer-tiles\.maps\.yandex\.net',
+        r'core-[a-z-]*tiles[a-z-]*\.maps\.yandex\.net',
+        r'core-jams-rdr[a-z-]*\.maps\.yandex\.net',
+        r'//vec\d*\.maps\.yandex\.net',
+        r'/tiles\?',
+    ],
+    'tracking': [
+        r'mc\.yandex\.(?:ru|com|by|kz)',
+        r'an\.yandex\.ru',
+        r'yandex\.ru/clck/',
+        r'yandex\.ru/ads/',
+        r'log\.strm\.yandex\.ru',
+        r'google-analytics\.com',
+        r'googletagmanager\.com',
+        r'top-fwz1\.mail\.ru',
+    ],
+}
+
+# Средние размеры ресурсов, байт — для оценки сэкономленного трафика
+AVERAGE_BYTES = {
+    'image': 40_000,
+    'media': 400_000,
+    'font': 50_000,
+    'tile': 25_000,
+    'tracking': 1_500,
+}
+
+
+def blocking_enabled_by_default() -> bool:
+    return os.getenv('PARSER_BLOCK_RESOURCES', '0') == '1'
+
+
+class RequestBlocker:
+    """Политика блокировки запросов и счётчики за один прогон"""
+
+    def __init__(self, resource_types=BLOCKED_RESOURCE_TYPES, url_patterns=None):
+        self.resource_types = set(resource_types)
+        patterns = BLOCKED_URL_PATTERNS if url_patterns is None else url_patterns
+        self._url_patterns = [(category, re.compile(p)) for category, items in patterns.items() for p in items]
+        self.blocked = {}
+        self.allowed = 0
+
+    def category(self, url: str, resource_type: str):
+        """Возвращает категорию блокировки запроса или None, если запрос пропускается"""
+        for category, pattern in self._url_patterns:
+            if pattern.search(url):
+                return category
+        if resource_type in self.resource_types:
+            return resource_type
+        return None
+
+    def _count(self, category):
+        if category:
+            self.blocked[category] = self.blocked.get(category, 0) + 1
+        else:
+            self.allowed += 1
+
+    def _handle(self, route):
+        request = route.request
+        category = self.category(request.url, request.resource_type)
+        self._count(category)
+        if category:
+            route.abort()
+        else:
+            # fallback, а не continue_: запрос ещё увидят обработчики контекста (воспроизведение HAR)
+            route.fallback()
+
+    async def _ahandle(self, route):
+        request = route.request
+        category = self.category(request.url, request.resource_type)
+        self._count(category)
+        if category:
+            await route.abort()
+        else:
+            await route.fallback()
+
+    def install(self, page):
+        page.route('**/*', self._handle)
+        return self
+
+    async def ainstall(self, page):
+        await page.route('**/*', self._ahandle)
+        return self
+
+    def stats(self) -> dict:
+        return {
+            'blocked': dict(self.blocked),
+            'blocked_total': sum(self.blocked.values()),
+            'blocked_bytes_estimate': sum(AVERAGE_BYTES.get(c, 0) * n for c, n in self.blocked.items()),
+            'allowed': self.allowed,
+        }
+
+
+def merge_stats(blockers) -> dict:
+    """Суммирует счётчики нескольких блокировщиков (например, всех страниц одной карточки)"""
+    merged = {'blocked': {}, 'blocked_total': 0, 'blocked_bytes_estimate': 0, 'allowed': 0}
+    for blocker in blockers:
+        stats = blocker.stats()
+        for category, count in stats['blocked'].items():
+            merged['blocked'][category] = merged['blocked'].get(category, 0) + count
+        for key in ('blocked_total', 'blocked_bytes_estimate', 'allowed'):
+            merged[key] += stats[key]
+    return merged
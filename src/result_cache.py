@@ -0,0 +1,152 @@
+"""
+result_cache.py — Локальный кэш результатов парсинга по id организации
+
+Карточка хранится по разделам (обзор, отзывы, новости, фото, особенности,
+конкуренты), у каждого раздела свой срок жизни: отзывы устаревают быстрее, чем
+адрес и часы работы. Ключ — id организации из /maps/org/<slug>/<id>/, поэтому
+ссылки с разными ll/z и хвостами указывают на одну запись. Если все разделы
+свежие, карточка отдаётся из кэша без браузера; иначе она парсится заново целиком.
+
+Сроки по умолчанию переопределяются переменными RESULT_CACHE_TTL_<РАЗДЕЛ>
+(секунды), например RESULT_CACHE_TTL_REVIEWS=3600.
+"""
+import json
+import os
+import sqlite3
+import time
+
+from src.yandex_urls import extract_org_id
+
+DEFAULT_CACHE_PATH = os.path.join('data', 'result_cache.sqlite3')
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+DEFAULT_TTLS = {
+    'overview': DAY,
+    'reviews': 6 * HOUR,
+    'news': 6 * HOUR,
+    'photos': DAY,
+    'features': 3 * DAY,
+    'competitors': DAY,
+}
+
+# Ключи card_data по разделам; всё остальное относится к обзору
+SECTION_KEYS = {
+    'reviews': ('reviews',),
+    'news': ('news',),
+    'photos': ('photos', 'photos_count'),
+    'features': ('features_full',),
+    'competitors': ('competitors',),
+}
+
+# Служебные поля одного прогона — в кэш не попадают
+VOLATILE_KEYS = ('parse_stats', 'snapshots')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sections (
+    org_id TEXT NOT NULL,
+    section TEXT NOT NULL,
+    url TEXT,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (org_id, section)
+);
+"""
+
+
+def _ttls_from_env(ttls: dict) -> dict:
+    result = dict(ttls)
+    for section in result:
+        value = os.getenv(f"RESULT_CACHE_TTL_{section.upper()}")
+        if value:
+            try:
+                result[section] = float(value)
+            except ValueError:
+                print(f"Некорректное значение RESULT_CACHE_TTL_{section.upper()}: {value}")
+    return result
+
+
+def split_sections(card_data: dict) -> dict:
+    """Делит результат parse_yandex_card на разделы кэша"""
+    sections = {'overview': {}}
+    section_of = {key: section for section, keys in SECTION_KEYS.items() for key in keys}
+    for key, value in card_data.items():
+        if key in VOLATILE_KEYS:
+            continue
+        section = section_of.get(key, 'overview')
+        sections.setdefault(section, {})[key] = value
+    return sections
+
+
+class ResultCache:
+    """Кэш карточек в SQLite; ttls — {раздел: секунды}, по умолчанию DEFAULT_TTLS и RESULT_CACHE_TTL_*"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttls: dict | None = None):
+        self.path = path
+        self.ttls = _ttls_from_env(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        if path != ':memory:':
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+    def _rows(self, org_id: str) -> dict:
+        rows = self.conn.execute("SELECT section, data, fetched_at FROM sections WHERE org_id=?", (org_id,)).fetchall()
+        return {section: (data, fetched_at) for section, data, fetched_at in rows}
+
+    def stale_sections(self, url: str, now: float | None = None) -> list:
+        """Разделы, которых нет в кэше или у которых истёк срок"""
+        org_id = extract_org_id(url)
+        if not org_id:
+            return list(self.ttls)
+        now = time.time() if now is None else now
+        rows = self._rows(org_id)
+        return [section for section, ttl in self.ttls.items()
+                if section not in rows or now - rows[section][1] > ttl]
+
+    def get(self, url: str, now: float | None = None) -> dict | None:
+        """Карточка из кэша, если все её разделы свежие, иначе None"""
+        org_id = extract_org_id(url)
+        if not org_id:
+            return None
+        now = time.time() if now is None else now
+        rows = self._rows(org_id)
+        card = {}
+        for section, ttl in self.ttls.items():
+            if section not in rows or now - rows[section][1] > ttl:
+                return None
+            card.update(json.loads(rows[section][0]))
+        card['cached_at'] = min(fetched_at for _, fetched_at in rows.values())
+        return card
+
+    def put(self, card_data: dict, url: str | None = None, now: float | None = None) -> bool:
+        """Сохраняет карточку по разделам. Карточки с ошибкой (капча) не кэшируются"""
+        url = url or card_data.get('url')
+        org_id = extract_org_id(url or '')
+        if not org_id or card_data.get('error'):
+            return False
+        now = time.time() if now is None else now
+        sections = {section: {} for section in self.ttls}
+        sections.update(split_sections(card_data))
+        with self.conn:
+            for section, data in sections.items():
+                self.conn.execute(
+                    "INSERT INTO sections (org_id, section, url, data, fetched_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(org_id, section) DO UPDATE SET url=excluded.url, data=excluded.data, fetched_at=excluded.fetched_at",
+                    (org_id, section, url, json.dumps(data, ensure_ascii=False), now))
+        return True
+
+    def invalidate(self, url: str):
+        org_id = extract_org_id(url)
+        if org_id:
+            with self.conn:
+                self.conn.execute("DELETE FROM sections WHERE org_id=?", (org_id,))
@@ -0,0 +1,157 @@
+"""
+review_delta.py — Инкрементальный сбор отзывов по «водяному знаку» уже известных отзывов
+
+Отзывы одной карточки при еженедельном перепарсинге почти не меняются, поэтому
+список не нужно прокручивать до конца: ReviewWatermark хранит ключи уже сохранённых
+отзывов (из таблицы Supabase Reviews или локального файла), а прокрутка останавливается,
+как только среди загруженных встретился известный отзыв. parse_reviews в этом режиме
+возвращает только новые отзывы, а merge_reviews склеивает их с сохранёнными.
+
+Ключ отзыва строится из автора и начала текста: даты в API (ISO) и в DOM («12 марта»)
+не совпадают, а текст в DOM может быть обрезан кнопкой «Ещё».
+"""
+import hashlib
+import re
+
+from src.network_capture import reviews_from_payloads
+
+KEY_TEXT_LENGTH = 80
+
+# Отзывы выше по списку считаются новыми, ключи берём у самых свежих сохранённых
+WATERMARK_DEPTH = 50
+
+# Автор и начало текста блоков отзывов, начиная с индекса since
+REVIEW_HEADS_JS = """
+({selector, since, authorSelectors, textSelector}) => {
+    const blocks = Array.from(document.querySelectorAll(selector)).slice(since);
+    return blocks.map(block => {
+        let author = '';
+        for (const sel of authorSelectors) {
+            const el = block.querySelector(sel);
+            const text = el ? (el.innerText || '').trim() : '';
+            if (text) { author = text; break; }
+        }
+        const body = block.querySelector(textSelector);
+        return {author, text: body ? (body.innerText || '').trim() : ''};
+    });
+}
+"""
+
+AUTHOR_SELECTORS = [
+    "span.business-review-view__author-name",
+    "div.business-review-view__author span",
+    "div.business-review-view__author",
+    "[class*='author-name']",
+    "[data-bem*='author'] span",
+]
+TEXT_SELECTOR = "div.business-review-view__body, div[class*='review-text']"
+BLOCK_SELECTOR = "div.business-review-view"
+
+
+def _normalize(value) -> str:
+    return re.sub(r'\s+', ' ', str(value or '')).strip().lower()
+
+
+def review_key(review: dict) -> str:
+    """Стабильный ключ отзыва: sha1 от автора и первых KEY_TEXT_LENGTH символов текста"""
+    author = _normalize(review.get('author'))
+    text = _normalize(review.get('text'))[:KEY_TEXT_LENGTH]
+    return hashlib.sha1(f"{author}|{text}".encode('utf-8')).hexdigest()
+
+
+def _items(reviews) -> list:
+    """Список отзывов из dict {"items": [...]} или из самого списка"""
+    if isinstance(reviews, dict):
+        reviews = reviews.get('items') or []
+    return [r for r in (reviews or []) if isinstance(r, dict)]
+
+
+class ReviewWatermark:
+    """Ключи уже известных отзывов карточки"""
+
+    def __init__(self, keys=None):
+        self.keys = set(keys or [])
+
+    @classmethod
+    def from_reviews(cls, reviews, depth: int = WATERMARK_DEPTH):
+        """Водяной знак по сохранённым отзывам (первые depth — самые свежие)"""
+        items = _items(reviews)
+        if depth:
+            items = items[:depth]
+        return cls(review_key(r) for r in items if r.get('author') or r.get('text'))
+
+    def __bool__(self):
+        return bool(self.keys)
+
+    def known(self, review: dict) -> bool:
+        return review_key(review) in self.keys
+
+    def split(self, items):
+        """Делит отзывы (от новых к старым) на новые до первого известного; возвращает (new, reached)"""
+        new = []
+        for review in items:
+            if self.known(review):
+                return new, True
+            new.append(review)
+        return new, False
+
+    def page_reached(self, page, since: int = 0, capture=None) -> bool:
+        """Встретился ли известный отзыв среди загруженных (ответов API или блоков DOM после since)"""
+        if capture:
+            items = reviews_from_payloads(capture.collect('reviews'))['items']
+            if items:
+                return any(self.known(r) for r in items)
+        heads = page.evaluate(REVIEW_HEADS_JS, self._js_args(since))
+        return any(self.known(r) for r in heads)
+
+    async def apage_reached(self, page, since: int = 0, capture=None) -> bool:
+        """То же, что page_reached, для async API"""
+        if capture:
+            items = reviews_from_payloads(await capture.acollect('reviews'))['items']
+            if items:
+                return any(self.known(r) for r in items)
+        heads = await page.evaluate(REVIEW_HEADS_JS, self._js_args(since))
+        return any(self.known(r) for r in heads)
+
+    @staticmethod
+    def _js_args(since):
+        return {'selector': BLOCK_SELECTOR, 'since': since, 'authorSelectors': AUTHOR_SELECTORS, 'textSelector': TEXT_SELECTOR}
+
+
+def apply_watermark(reviews_data: dict, watermark: ReviewWatermark | None) -> dict:
+    """Оставляет в reviews_data только новые отзывы и отмечает, дошли ли до известных"""
+    if not watermark:
+        return reviews_data
+    new, reached = watermark.split(reviews_data.get('items') or [])
+    reviews_data['items'] = new
+    reviews_data['incremental'] = True
+    reviews_data['watermark_reached'] = reached
+    return reviews_data
+
+
+def merge_reviews(previous, delta: dict) -> dict:
+    """
+    Склеивает новые отзывы (delta — результат parse_reviews с водяным знаком) с сохранёнными.
+    Новые идут первыми, дубликаты по review_key отбрасываются; рейтинг и количество
+    берутся из delta, если там они есть. new_count — сколько первых items пришло из delta:
+    в базу отправляются только они, а отчёт и кэш получают полный список.
+    """
+    previous_data = previous if isinstance(previous, dict) else {}
+    delta = delta or {}
+    items = []
+    seen = set()
+    new_count = 0
+    for is_new, reviews in ((True, _items(delta)), (False, _items(previous))):
+        for review in reviews:
+            key = review_key(review)
+            if key in seen:
+                continue
+            seen.add(key)
+            items.append(review)
+            new_count += is_new
+    return {
+        "items": items,
+        "new_count": new_count,
+        "rating": delta.get('rating') or previous_data.get('rating', ''),
+        "reviews_count": delta.get('reviews_count') or previous_data.get('reviews_count', ''),
+    }
@@ -1,110 +1,288 @@
 from supabase import create_client, Client
+from supabase.lib.client_options import ClientOptions
+from src.metrics import span
+from src.review_delta import review_key
+from src.yandex_urls import extract_org_id
 import os
+import threading
+import time
 
-# Удаляю захардкоженные ключи SUPABASE_URL и SUPABASE_KEY, убираю глобальный supabase
+# Клиент создаётся один раз на процесс: его HTTP-сессия держит соединения (keep-alive),
+# и запросы не платят за новый TLS-хендшейк. Ключи берутся из SUPABASE_URL и SUPABASE_KEY,
+# тайм-аут запроса — SUPABASE_TIMEOUT (секунды), повторы при сетевых ошибках — SUPABASE_RETRIES.
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+# Коды ответа, после которых запрос имеет смысл повторить
+RETRY_STATUS_CODES = {'408', '429', '500', '502', '503', '504'}
+
+def _env_number(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+def get_client() -> Client | None:
+    """Общий потокобезопасный клиент Supabase процесса; None, если ключи не заданы"""
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+    with _client_lock:
+        # После fork соединения родителя не используем — создаём свой клиент
+        if _client is None or _client_pid != os.getpid():
+            url = os.getenv('SUPABASE_URL')
+            key = os.getenv('SUPABASE_KEY')
+            if not url or not key:
+                return None
+            timeout = _env_number('SUPABASE_TIMEOUT', 30)
+            options = ClientOptions(postgrest_client_timeout=timeout, storage_client_timeout=int(timeout))
+            _client = create_client(url, key, options=options)
+            _client_pid = os.getpid()
+    return _client
+
+def reset_client():
+    """Сбрасывает клиент (например, после смены ключей в окружении)"""
+    global _client, _client_pid
+    with _client_lock:
+        _client = None
+        _client_pid = None
+
+def _is_transient(error) -> bool:
+    """Сетевая ошибка, тайм-аут или ответ 5xx/429 — можно повторить"""
+    try:
+        import httpx
+        if isinstance(error, (httpx.TransportError, httpx.TimeoutException)):
+            return True
+    except ImportError:
+        pass
+    code = str(getattr(error, 'code', '') or '')
+    return code in RETRY_STATUS_CODES
+
+def execute(query, op: str):
+    """Выполняет запрос с замером и повторами (экспоненциальная пауза) при временных ошибках"""
+    retries = int(_env_number('SUPABASE_RETRIES', 3))
+    for attempt in range(retries + 1):
+        try:
+            with span('supabase', op=op):
+                return query.execute()
+        except Exception as e:
+            if attempt >= retries or not _is_transient(e):
+                raise
+            delay = min(0.5 * 2 ** attempt, 10)
+            print(f"Supabase ({op}): {type(e).__name__}, повтор через {delay:.1f} с")
+            time.sleep(delay)
+
+# Сколько ссылок отправлять в одном фильтре in_: список попадает в строку запроса PostgREST
+EXISTS_CHUNK_SIZE = 100
+
+# Ссылки, которые уже точно есть в Cards; карточки не удаляются, поэтому кэш только растёт
+_known_urls = set()
+_known_urls_lock = threading.Lock()
+
+def _remember_urls(urls):
+    with _known_urls_lock:
+        _known_urls.update(u for u in urls if u)
+
+def existing_urls(urls) -> set:
+    """
+    Возвращает те ссылки из urls, которые уже сохранены в Cards. Уже известные берутся
+    из кэша процесса, остальные проверяются одним запросом in_ на каждые EXISTS_CHUNK_SIZE ссылок.
+    """
+    urls = list(dict.fromkeys(u for u in urls if u))
+    with _known_urls_lock:
+        found = {u for u in urls if u in _known_urls}
+    unknown = [u for u in urls if u not in found]
+    if not unknown:
+        return found
+    try:
+        supabase = get_client()
+        if supabase is None:
+            print("Предупреждение: переменные окружения SUPABASE_URL или SUPABASE_KEY не установлены")
+            return found
+        for i in range(0, len(unknown), EXISTS_CHUNK_SIZE):
+            chunk = unknown[i:i + EXISTS_CHUNK_SIZE]
+            result = execute(supabase.table("Cards").select("url").in_("url", chunk), 'existing_urls')
+            known = {row.get("url") for row in result.data or []}
+            _remember_urls(known)
+            found.update(known)
+    except Exception as e:
+        print(f"Ошибка при проверке конкурентов: {e}")
+    return found
 
 def check_competitor_exists(competitor_url):
     """Проверяет, существует ли конкурент в базе данных"""
+    return competitor_url in existing_urls([competitor_url])
+
+def fetch_known_reviews(card_url, limit=None):
+    """
+    Возвращает сохранённые отзывы карточки из таблицы Reviews ({"items": [...]},
+    от новых к старым) или None. limit ограничивает число последних отзывов;
+    без него список читается целиком страницами по REVIEWS_PAGE_SIZE.
+    """
+    org_id = extract_org_id(card_url or '')
+    if not org_id:
+        return None
     try:
-        from supabase import create_client, Client
-        import os
-        url = os.getenv('SUPABASE_URL')
-        key = os.getenv('SUPABASE_KEY')
-        if not url or not key:
-            print("Предупреждение: переменные окружения SUPABASE_URL или SUPABASE_KEY не установлены")
-            return False
-        supabase: Client = create_client(url, key)
-        result = supabase.table("Cards").select("id").eq("url", competitor_url).execute()
-        return len(result.data) > 0
+        supabase = get_client()
+        if supabase is None:
+            return None
+        items = []
+        while limit is None or len(items) < limit:
+            size = REVIEWS_PAGE_SIZE if limit is None else min(REVIEWS_PAGE_SIZE, limit - len(items))
+            query = (supabase.table("Reviews").select(",".join(REVIEW_FIELDS))
+                     .eq("org_id", org_id).order("id", desc=True).range(len(items), len(items) + size - 1))
+            page = execute(query, 'fetch_reviews').data or []
+            items.extend(page)
+            if len(page) < size:
+                break
+        return {"items": items} if items else None
     except Exception as e:
-        print(f"Ошибка при проверке конкурента: {e}")
-        return False
+        print(f"Ошибка при загрузке сохранённых отзывов: {e}")
+        return None
 
 def get_next_available_competitor(competitors):
-    """Возвращает первого конкурента, которого нет в базе данных"""
+    """Возвращает первого конкурента, которого нет в базе данных (одна проверка на весь список)"""
+    existing = existing_urls([c.get('url', '') for c in competitors])
     for competitor in competitors:
-        if not check_competitor_exists(competitor.get('url', '')):
+        if competitor.get('url') and competitor['url'] not in existing:
             return competitor
     return None
 
+# Поля отзыва, которые пишутся в Reviews (кроме org_id и review_key)
+REVIEW_FIELDS = ("author", "date", "score", "text", "org_reply")
+
+# Сколько отзывов отправлять одним запросом
+REVIEWS_CHUNK_SIZE = 500
+
+# Сколько отзывов читать одним запросом (PostgREST по умолчанию отдаёт не больше 1000 строк)
+REVIEWS_PAGE_SIZE = 1000
+
+def review_summary(reviews) -> dict:
+    """Поле reviews строки Cards: рейтинг и количество без самих отзывов (они в таблице Reviews)"""
+    if not isinstance(reviews, dict):
+        return {}
+    return {key: value for key, value in reviews.items() if key not in ("items", "new_count")}
+
+def review_rows(card_data) -> list:
+    """
+    Строки таблицы Reviews из результата парсинга. Ключ — review_delta.review_key, тот же,
+    что у водяного знака. Порядок — от старых к новым: так у свежих отзывов id больше.
+    После merge_reviews берутся только новые отзывы (первые new_count) — остальные уже в базе.
+    """
+    org_id = extract_org_id(card_data.get("url") or '')
+    reviews = card_data.get("reviews") or {}
+    items = reviews.get("items") if isinstance(reviews, dict) else reviews
+    if isinstance(reviews, dict) and reviews.get("new_count") is not None:
+        items = (items or [])[:reviews["new_count"]]
+    if not org_id or not items:
+        return []
+    rows = {}
+    for review in items:
+        if not isinstance(review, dict) or not (review.get("author") or review.get("text")):
+            continue
+        row = {"org_id": org_id, "review_key": review_key(review)}
+        row.update({field: review.get(field) for field in REVIEW_FIELDS})
+        try:
+            row["score"] = int(float(row["score"] or 0))
+        except (TypeError, ValueError):
+            row["score"] = 0
+        rows.setdefault(row["review_key"], row)
+    return list(reversed(rows.values()))
+
+def insert_reviews(rows) -> int:
+    """
+    Добавляет отзывы, которых ещё нет (upsert с ignore_duplicates по org_id + review_key,
+    см. sql/002_reviews.sql), по REVIEWS_CHUNK_SIZE строк за запрос. Возвращает число отправленных.
+    """
+    if not rows:
+        return 0
+    supabase = get_client()
+    if supabase is None:
+        raise RuntimeError("Переменные окружения SUPABASE_URL или SUPABASE_KEY не установлены")
+    for i in range(0, len(rows), REVIEWS_CHUNK_SIZE):
+        chunk = rows[i:i + REVIEWS_CHUNK_SIZE]
+        execute(supabase.table("Reviews").upsert(chunk, on_conflict="org_id,review_key", ignore_duplicates=True),
+                'insert_reviews')
+    return len(rows)
+
+def card_row(card_data, main_card_url=None) -> dict:
+    """Строка таблицы Cards из результата parse_yandex_card; org_id — ключ для upsert"""
+    overview = card_data.get("overview") or {}
+    url = card_data.get("url")
+    return {
+        "url": url,
+        "org_id": extract_org_id(url or ''),
+        "title": overview.get("title"),
+        "address": overview.get("address"),
+        "phone": overview.get("phone"),
+        "site": overview.get("site"),
+        "rating": float(overview.get("rating") or 0),
+        "ratings_count": int(overview.get("ratings_count") or 0),
+        "reviews_count": int(overview.get("reviews_count") or 0),
+        "rubric": card_data.get("rubric"),
+        "categories": card_data.get("product_categories"),
+        "categories_full": card_data.get("categories_full"),
+        "features_bool": card_data.get("features_bool"),
+        "features_valued": card_data.get("features_valued"),
+        "features_prices": card_data.get("features_prices"),
+        "features_full": card_data.get("features_full"),
+        "overview": card_data.get("overview"),
+        "products": card_data.get("products"),
+        "news": card_data.get("news"),
+        "photos": card_data.get("photos"),
+        "reviews": review_summary(card_data.get("reviews")),
+        "hours": overview.get("hours"),
+        "hours_full": overview.get("hours_full"),
+        "competitors": card_data.get("competitors", []),
+        "main_card_url": main_card_url,
+    }
+
+def upsert_cards(rows, op='upsert_cards'):
+    """
+    Записывает строки Cards одним запросом upsert по org_id (уникальный индекс из
+    sql/001_cards_org_id.sql): повторный парсинг обновляет строку, а не добавляет новую.
+    Внутри одного запроса org_id должны быть разными. Строки без org_id пропускаются:
+    NULL не конфликтует в уникальном индексе, и каждая запись добавляла бы дубликат.
+    Возвращает сохранённые строки.
+    """
+    skipped = [row.get("url") for row in rows if not row.get("org_id")]
+    if skipped:
+        print(f"Пропускаем карточки без id организации в ссылке: {', '.join(str(u) for u in skipped)}")
+        rows = [row for row in rows if row.get("org_id")]
+    if not rows:
+        return []
+    supabase = get_client()
+    if supabase is None:
+        raise RuntimeError("Переменные окружения SUPABASE_URL или SUPABASE_KEY не установлены")
+    result = execute(supabase.table("Cards").upsert(rows, on_conflict="org_id"), op)
+    _remember_urls([row.get("url") for row in rows])
+    return result.data or []
+
 def save_card_to_supabase(card_data):
     try:
-        from supabase import create_client, Client
-        import os
-        url = os.getenv('SUPABASE_URL')
-        key = os.getenv('SUPABASE_KEY')
-        if not url or not key:
+        if get_client() is None:
             print("Предупреждение: Переменные окружения SUPABASE_URL или SUPABASE_KEY не установлены")
             print("Данные не будут сохранены в базу данных")
             return None
-        supabase: Client = create_client(url, key)
-        data = {
-            "url": card_data.get("url"),
-            "title": card_data.get("overview", {}).get("title"),
-            "address": card_data.get("overview", {}).get("address"),
-            "phone": card_data.get("overview", {}).get("phone"),
-            "site": card_data.get("overview", {}).get("site"),
-            "rating": float(card_data.get("overview", {}).get("rating") or 0),
-            "ratings_count": int(card_data.get("overview", {}).get("ratings_count") or 0),
-            "reviews_count": int(card_data.get("overview", {}).get("reviews_count") or 0),
-            "rubric": card_data.get("rubric"),
-            "categories": card_data.get("product_categories"),
-            "categories_full": card_data.get("categories_full"),
-            "features_bool": card_data.get("features_bool"),
-            "features_valued": card_data.get("features_valued"),
-            "features_prices": card_data.get("features_prices"),
-            "features_full": card_data.get("features_full"),
-            "overview": card_data.get("overview"),
-            "products": card_data.get("products"),
-            "news": card_data.get("news"),
-            "photos": card_data.get("photos"),
-            "reviews": card_data.get("reviews"),
-            "hours": card_data.get("overview", {}).get("hours"),
-            "hours_full": card_data.get("overview", {}).get("hours_full"),
-            "competitors": card_data.get("competitors", []),
-            "main_card_url": None,
-        }
-        result = supabase.table("Cards").insert(data).execute()
-        print(f"Карточка сохранена с ID: {result.data[0]['id']}")
-        return result.data[0]['id']
+        saved = upsert_cards([card_row(card_data)], 'save_card')
+        if not saved:
+            return None
+        sent = insert_reviews(review_rows(card_data))
+        print(f"Карточка сохранена с ID: {saved[0]['id']}" + (f", отзывов отправлено: {sent}" if sent else ""))
+        return saved[0]['id']
     except Exception as e:
         print(f"Ошибка при сохранении в Supabase: {type(e).__name__}: {str(e)}")
         return None
 
 def save_competitor_to_supabase(competitor_data, main_card_id, main_card_url):
     """Сохраняет данные конкурента с привязкой к основной карточке"""
-    from supabase import create_client, Client
-    import os
-    url = os.getenv('SUPABASE_URL')
-    key = os.getenv('SUPABASE_KEY')
-    if not url or not key:
+    if get_client() is None:
         print("Предупреждение: переменные окружения SUPABASE_URL или SUPABASE_KEY не установлены")
         return None
-    supabase: Client = create_client(url, key)
-    data = {
-        "url": competitor_data.get("url"),
-        "title": competitor_data.get("overview", {}).get("title"),
-        "address": competitor_data.get("overview", {}).get("address"),
-        "phone": competitor_data.get("overview", {}).get("phone"),
-        "site": competitor_data.get("overview", {}).get("site"),
-        "rating": float(competitor_data.get("overview", {}).get("rating") or 0),
-        "ratings_count": int(competitor_data.get("overview", {}).get("ratings_count") or 0),
-        "reviews_count": int(competitor_data.get("overview", {}).get("reviews_count") or 0),
-        "categories": competitor_data.get("product_categories"),
-        "categories_full": competitor_data.get("categories_full"),
-        "features_bool": competitor_data.get("features_bool"),
-        "features_valued": competitor_data.get("features_valued"),
-        "features_prices": competitor_data.get("features_prices"),
-        "features_full": competitor_data.get("features_full"),
-        "overview": competitor_data.get("overview"),
-        "products": competitor_data.get("products"),
-        "news": competitor_data.get("news"),
-        "photos": competitor_data.get("photos"),
-        "reviews": competitor_data.get("reviews"),
-        "hours": competitor_data.get("overview", {}).get("hours"),
-        "hours_full": competitor_data.get("overview", {}).get("hours_full"),
-        "competitors": [],
-        "main_card_url": main_card_url,  # Привязка к основной карточке
-    }
-    result = supabase.table("Cards").insert(data).execute()
-    return result.data[0]['id'] if result.data else None
\ No newline at end of file
+    row = card_row(competitor_data, main_card_url=main_card_url)  # Привязка к основной карточке
+    row["competitors"] = []
+    saved = upsert_cards([row], 'save_competitor')
+    insert_reviews(review_rows(competitor_data))
+    return saved[0]['id'] if saved else None
@@ -0,0 +1,222 @@
+"""
+scroll_controller.py — Адаптивная прокрутка списка отзывов с ранней остановкой
+
+Внутри страницы MutationObserver поддерживает счётчик блоков отзывов, а Python
+после каждой прокрутки одним вызовом ждёт, пока счётчик вырастет (или истечёт
+тайм-аут), вместо того чтобы спать и пересчитывать все блоки. Прокрутка
+заканчивается, когда загружено целевое количество (reviews_count с карточки или
+max_reviews), либо после нескольких ожиданий подряд без новых отзывов; тайм-аут
+ожидания при этом растёт экспоненциально. С водяным знаком (review_delta.ReviewWatermark)
+прокрутка заканчивается и на первом уже известном отзыве.
+"""
+import random
+
+from src.metrics import span, count as count_metric
+
+REVIEW_BLOCK_SELECTOR = "div.business-review-view, div[class*='review-item']"
+
+COUNTER_KEY = '__parserReviewCounter'
+
+# Ставит наблюдатель за количеством блоков; повторный вызов возвращает текущее значение
+INSTALL_COUNTER_JS = """
+({selector, key}) => {
+    if (window[key]) return window[key].count;
+    const state = {count: document.querySelectorAll(selector).length, waiters: [], scheduled: false};
+    const recount = () => {
+        state.scheduled = false;
+        const count = document.querySelectorAll(selector).length;
+        if (count !== state.count) {
+            state.count = count;
+            const waiters = state.waiters;
+            state.waiters = [];
+            waiters.forEach(w => w());
+        }
+    };
+    state.observer = new MutationObserver(() => {
+        if (!state.scheduled) {
+            state.scheduled = true;
+            setTimeout(recount, 50);
+        }
+    });
+    state.observer.observe(document.body, {childList: true, subtree: true});
+    window[key] = state;
+    return state.count;
+}
+"""
+
+# Резолвится количеством блоков, как только оно превысит since, или по тайм-ауту
+WAIT_FOR_GROWTH_JS = """
+({key, since, timeoutMs}) => new Promise(resolve => {
+    const state = window[key];
+    if (!state) return resolve(-1);
+    if (state.count > since) return resolve(state.count);
+    let timer = null;
+    const waiter = () => {
+        if (state.count > since) {
+            clearTimeout(timer);
+            resolve(state.count);
+        } else {
+            state.waiters.push(waiter);
+        }
+    };
+    state.waiters.push(waiter);
+    timer = setTimeout(() => {
+        state.waiters = state.waiters.filter(w => w !== waiter);
+        resolve(state.count);
+    }, timeoutMs);
+})
+"""
+
+REMOVE_COUNTER_JS = """
+(key) => {
+    if (window[key]) {
+        window[key].observer.disconnect();
+        delete window[key];
+    }
+}
+"""
+
+
+class ReviewsScrollController:
+    """
+    Прокручивает список отзывов до target (или max_reviews) блоков.
+    После каждой прокрутки ждёт новых блоков base_wait_ms; при отсутствии роста
+    удваивает ожидание (до max_wait_ms) и сдаётся после max_stalls неудач подряд.
+    watermark останавливает прокрутку, как только загружен известный отзыв.
+    """
+
+    def __init__(self, target=None, max_reviews=None, base_wait_ms=1000, max_wait_ms=8000, max_stalls=3, max_scrolls=300, pacing=None, selector=REVIEW_BLOCK_SELECTOR, watermark=None, capture=None):
+        self.target = _to_int(target)
+        self.max_reviews = _to_int(max_reviews)
+        self.base_wait_ms = base_wait_ms
+        self.max_wait_ms = max(base_wait_ms, max_wait_ms)
+        self.max_stalls = max(1, max_stalls)
+        self.max_scrolls = max_scrolls
+        self.pacing = pacing
+        self.selector = selector
+        self.watermark = watermark
+        self.capture = capture
+        self.scrolls = 0
+        self.stop_reason = ''
+
+    @property
+    def limit(self):
+        limits = [n for n in (self.target, self.max_reviews) if n]
+        return min(limits) if limits else None
+
+    def _reached(self, count):
+        limit = self.limit
+        if limit and count >= limit:
+            self.stop_reason = 'limit'
+            return True
+        return False
+
+    def _watermark_reached(self, reached):
+        if reached:
+            self.stop_reason = 'watermark'
+        return reached
+
+    def _next_wait(self, wait_ms, grew):
+        return self.base_wait_ms if grew else min(wait_ms * 2, self.max_wait_ms)
+
+    def run(self, page) -> int:
+        with span('reviews_scroll'):
+            loaded = self._run(page)
+        self._record()
+        return loaded
+
+    async def arun(self, page) -> int:
+        with span('reviews_scroll'):
+            loaded = await self._arun(page)
+        self._record()
+        return loaded
+
+    def _record(self):
+        count_metric('review_scrolls', self.scrolls)
+        count_metric('review_scroll_stops', reason=self.stop_reason or 'unknown')
+
+    def _run(self, page) -> int:
+        count = page.evaluate(INSTALL_COUNTER_JS, {'selector': self.selector, 'key': COUNTER_KEY})
+        wait_ms = self.base_wait_ms
+        stalls = 0
+        try:
+            page.mouse.move(random.randint(200, 600), random.randint(400, 800))
+            if self.watermark and self._watermark_reached(self.watermark.page_reached(page, 0, self.capture)):
+                return count
+            while self.scrolls < self.max_scrolls and not self._reached(count):
+                page.mouse.wheel(0, 1500)
+                self.scrolls += 1
+                new_count = page.evaluate(WAIT_FOR_GROWTH_JS, {'key': COUNTER_KEY, 'since': count, 'timeoutMs': wait_ms})
+                grew = new_count > count
+                wait_ms = self._next_wait(wait_ms, grew)
+                if grew:
+                    stalls = 0
+                    print(f"Загружено отзывов: {new_count}")
+                    if self.watermark and self._watermark_reached(self.watermark.page_reached(page, count, self.capture)):
+                        count = new_count
+                        break
+                    count = new_count
+                else:
+                    stalls += 1
+                    if stalls >= self.max_stalls:
+                        self.stop_reason = 'stalled'
+                        break
+                    # Возвращаем курсор на панель со списком — колесо крутит элемент под курсором
+                    page.mouse.move(random.randint(200, 600), random.randint(400, 800))
+                if self.pacing:
+                    self.pacing.pause()
+            else:
+                if not self.stop_reason:
+                    self.stop_reason = 'max_scrolls'
+        finally:
+            try:
+                page.evaluate(REMOVE_COUNTER_JS, COUNTER_KEY)
+            except Exception:
+                pass
+        return count
+
+    async def _arun(self, page) -> int:
+        count = await page.evaluate(INSTALL_COUNTER_JS, {'selector': self.selector, 'key': COUNTER_KEY})
+        wait_ms = self.base_wait_ms
+        stalls = 0
+        try:
+            await page.mouse.move(random.randint(200, 600), random.randint(400, 800))
+            if self.watermark and self._watermark_reached(await self.watermark.apage_reached(page, 0, self.capture)):
+                return count
+            while self.scrolls < self.max_scrolls and not self._reached(count):
+                await page.mouse.wheel(0, 1500)
+                self.scrolls += 1
+                new_count = await page.evaluate(WAIT_FOR_GROWTH_JS, {'key': COUNTER_KEY, 'since': count, 'timeoutMs': wait_ms})
+                grew = new_count > count
+                wait_ms = self._next_wait(wait_ms, grew)
+                if grew:
+                    stalls = 0
+                    if self.watermark and self._watermark_reached(await self.watermark.apage_reached(page, count, self.capture)):
+                        count = new_count
+                        break
+                    count = new_count
+                else:
+                    stalls += 1
+                    if stalls >= self.max_stalls:
+                        self.stop_reason = 'stalled'
+                        break
+                    await page.mouse.move(random.randint(200, 600), random.randint(400, 800))
+                if self.pacing:
+                    await self.pacing.apause()
+            else:
+                if not self.stop_reason:
+                    self.stop_reason = 'max_scrolls'
+        finally:
+            try:
+                await page.evaluate(REMOVE_COUNTER_JS, COUNTER_KEY)
+            except Exception:
+                pass
+        return count
+
+
+def _to_int(value):
+    try:
+        value = int(str(value).replace(' ', '').replace('\xa0', ''))
+        return value if value > 0 else None
+    except (TypeError, ValueError):
+        return None
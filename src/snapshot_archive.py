@@ -0,0 +1,194 @@
+"""
+snapshot_archive.py — Архив сжатых HTML-снимков вкладок карточки для повторного разбора
+
+После прокрутки каждой вкладки парсер может сохранить page.content() сюда, и тогда
+улучшенные экстракторы (html_extract) прогоняются по истории без повторного обхода.
+
+Снимки адресуются по содержимому: файл objects/<sha[:2]>/<sha256>.html.zst, так что
+одинаковые страницы хранятся один раз. Сжатие — zstd (пакет zstandard), без него — gzip.
+Какой снимок к какой карточке относится, записано в index/<org_id>.jsonl — по строке
+{"org_id", "url", "tab", "ts", "sha256", "size", "stored_size"} на вкладку. Индекс
+только дописывается, поэтому им могут пользоваться несколько процессов пакетного режима.
+
+    archive = SnapshotArchive('data/snapshots')
+    for snapshot in archive.iter_snapshots(tab='overview', latest=True):
+        html = snapshot.read()
+"""
+from dataclasses import dataclass, asdict
+import gzip
+import hashlib
+import json
+import os
+import time
+
+from src.yandex_urls import extract_org_id
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_ARCHIVE_DIR = 'data/snapshots'
+
+ZSTD_LEVEL = 10
+
+UNKNOWN_ORG = 'unknown'
+
+
+def _compress(data: bytes) -> tuple:
+    """Сжимает снимок: (байты, расширение)"""
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), '.zst'
+    return gzip.compress(data, compresslevel=6), '.gz'
+
+
+def read_compressed(path: str) -> bytes:
+    """Читает снимок с диска: .zst, .gz или несжатый"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"Для чтения {path} установите пакет zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if path.endswith('.gz'):
+        return gzip.decompress(data)
+    return data
+
+
+@dataclass
+class Snapshot:
+    """Запись индекса: вкладка карточки в момент парсинга"""
+    org_id: str
+    url: str
+    tab: str
+    ts: float
+    sha256: str
+    size: int
+    stored_size: int
+    path: str = ''
+
+    def read(self) -> bytes:
+        return read_compressed(self.path)
+
+    def text(self) -> str:
+        return self.read().decode('utf-8', errors='replace')
+
+
+class SnapshotArchive:
+    """Каталог со снимками: objects/ по хешу содержимого и index/ по id организации"""
+
+    def __init__(self, root: str = DEFAULT_ARCHIVE_DIR):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_dir = os.path.join(root, 'index')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def _object_path(self, sha: str, ext: str) -> str:
+        return os.path.join(self.objects_dir, sha[:2], sha + '.html' + ext)
+
+    def object_path(self, sha: str) -> str | None:
+        """Путь к сохранённому снимку с этим хешом (в любом из форматов сжатия)"""
+        for ext in ('.zst', '.gz'):
+            path = self._object_path(sha, ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def put(self, url: str, tab: str, html: str | bytes, ts: float | None = None) -> Snapshot:
+        """Сохраняет снимок вкладки; одинаковое содержимое повторно не пишется"""
+        data = html.encode('utf-8') if isinstance(html, str) else html
+        sha = hashlib.sha256(data).hexdigest()
+        path = self.object_path(sha)
+        if path is None:
+            compressed, ext = _compress(data)
+            path = self._object_path(sha, ext)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Через временный файл: читатель не увидит недописанный снимок
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, path)
+        snapshot = Snapshot(
+            org_id=extract_org_id(url) or UNKNOWN_ORG,
+            url=url,
+            tab=tab,
+            ts=round(ts if ts is not None else time.time(), 3),
+            sha256=sha,
+            size=len(data),
+            stored_size=os.path.getsize(path),
+            path=path,
+        )
+        record = asdict(snapshot)
+        record.pop('path')
+        with open(os.path.join(self.index_dir, f"{snapshot.org_id}.jsonl"), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return snapshot
+
+    def org_ids(self) -> list:
+        return sorted(name[:-len('.jsonl')] for name in os.listdir(self.index_dir) if name.endswith('.jsonl'))
+
+    def _iter_index(self, org_id: str):
+        path = os.path.join(self.index_dir, f"{org_id}.jsonl")
+        try:
+            f = open(path, encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Строка, недописанная при падении процесса
+                    continue
+                record['path'] = self.object_path(record['sha256']) or ''
+                yield Snapshot(**record)
+
+    def iter_snapshots(self, org_id: str | None = None, tab: str | None = None, since: float | None = None,
+                       until: float | None = None, latest: bool = False):
+        """
+        Перебирает снимки по одной организации за раз (весь архив в память не читается).
+        latest оставляет по каждой вкладке организации только самый свежий снимок.
+        Снимки, чьи файлы пропали, пропускаются.
+        """
+        for org in [org_id] if org_id else self.org_ids():
+            selected = []
+            for snapshot in self._iter_index(org):
+                if tab and snapshot.tab != tab:
+                    continue
+                if since is not None and snapshot.ts < since:
+                    continue
+                if until is not None and snapshot.ts > until:
+                    continue
+                if not snapshot.path:
+                    continue
+                if latest:
+                    selected.append(snapshot)
+                else:
+                    yield snapshot
+            if latest:
+                newest = {}
+                for snapshot in selected:
+                    if snapshot.tab not in newest or snapshot.ts >= newest[snapshot.tab].ts:
+                        newest[snapshot.tab] = snapshot
+                yield from sorted(newest.values(), key=lambda s: s.ts)
+
+    def stats(self) -> dict:
+        """Число снимков в индексе, уникальных файлов и объём до и после сжатия"""
+        entries = 0
+        objects = {}
+        for snapshot in self.iter_snapshots():
+            entries += 1
+            objects[snapshot.sha256] = (snapshot.size, snapshot.stored_size)
+        return {
+            'entries': entries,
+            'objects': len(objects),
+            'raw_bytes': sum(size for size, _ in objects.values()),
+            'stored_bytes': sum(stored for _, stored in objects.values()),
+        }
+
+
+def get_default_archive() -> SnapshotArchive | None:
+    """Архив из PARSER_SNAPSHOT_DIR; если переменная не задана — снимки не сохраняются"""
+    root = os.getenv('PARSER_SNAPSHOT_DIR')
+    return SnapshotArchive(root) if root else None
@@ -0,0 +1,88 @@
+"""
+user_agents.py — Профили User-Agent из локального списка без обращения к сети
+
+Список профилей лежит в src/data/user_agents.json (поле version меняется при каждом
+обновлении) и читается один раз на процесс. Профиль — согласованный набор: строка
+User-Agent, заголовки Client Hints (sec-ch-ua*), navigator.platform, размеры окна
+и экрана. Профиль выбирается случайно с учётом веса и движка запущенного браузера
+(Chrome-профиль в Firefox выдал бы себя) и закрепляется за контекстом браузера.
+"""
+from functools import lru_cache
+import json
+import os
+import random
+
+USER_AGENTS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'user_agents.json')
+
+# Если файл не прочитался — один заведомо рабочий профиль
+FALLBACK_PROFILE = {
+    'id': 'chrome130-win-fallback',
+    'engine': 'chromium',
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36',
+    'platform': 'Win32',
+    'client_hints': {
+        'sec-ch-ua': '"Chromium";v="130", "Google Chrome";v="130", "Not?A_Brand";v="99"',
+        'sec-ch-ua-mobile': '?0',
+        'sec-ch-ua-platform': '"Windows"',
+    },
+    'viewport': {'width': 1920, 'height': 945},
+    'screen': {'width': 1920, 'height': 1080},
+    'device_scale_factor': 1,
+    'weight': 1,
+}
+
+
+class UserAgentProvider:
+    """Выбор профилей из загруженного списка; профили по движкам и веса считаются заранее"""
+
+    def __init__(self, profiles, version: str = ''):
+        self.version = version
+        self.profiles = [p for p in profiles if p.get('user_agent')] or [FALLBACK_PROFILE]
+        self._by_engine = {}
+        for profile in self.profiles:
+            self._by_engine.setdefault(profile.get('engine', 'chromium'), []).append(profile)
+        self._weights = {engine: [p.get('weight', 1) for p in items] for engine, items in self._by_engine.items()}
+
+    def random_profile(self, engine: str | None = None) -> dict:
+        """Случайный профиль (с учётом weight) для движка chromium/firefox/webkit"""
+        engine = (engine or 'chromium').lower()
+        items = self._by_engine.get(engine)
+        if not items:
+            items, weights = self.profiles, [p.get('weight', 1) for p in self.profiles]
+        else:
+            weights = self._weights[engine]
+        return random.choices(items, weights=weights)[0]
+
+    def random_user_agent(self, engine: str | None = None) -> str:
+        return self.random_profile(engine)['user_agent']
+
+
+@lru_cache(maxsize=1)
+def get_user_agent_provider() -> UserAgentProvider:
+    """Провайдер процесса: файл профилей читается один раз"""
+    try:
+        with open(USER_AGENTS_PATH, encoding='utf-8') as f:
+            data = json.load(f)
+        return UserAgentProvider(data.get('profiles', []), str(data.get('version', '')))
+    except Exception as e:
+        print(f"Не удалось загрузить профили User-Agent: {e}")
+        return UserAgentProvider([FALLBACK_PROFILE], 'fallback')
+
+
+def profile_context_options(profile: dict, base_headers: dict | None = None) -> dict:
+    """Параметры browser.new_context для профиля: UA, окно, экран и Client Hints"""
+    headers = dict(base_headers or {})
+    headers.update(profile.get('client_hints') or {})
+    return {
+        'user_agent': profile['user_agent'],
+        'viewport': dict(profile.get('viewport') or FALLBACK_PROFILE['viewport']),
+        'screen': dict(profile.get('screen') or profile.get('viewport') or FALLBACK_PROFILE['screen']),
+        'device_scale_factor': profile.get('device_scale_factor', 1),
+        'extra_http_headers': headers,
+    }
+
+
+def profile_init_script(profile: dict) -> str:
+    """Подменяет navigator.platform под профиль (заголовок и JS должны совпадать)"""
+    platform = json.dumps(profile.get('platform') or 'Win32')
+    return f"Object.defineProperty(navigator, 'platform', {{ get: () => {platform} }});"
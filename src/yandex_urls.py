@@ -0,0 +1,57 @@
+"""
+yandex_urls.py — Разбор и нормализация ссылок на карточки организаций Яндекс.Карт
+"""
+from urllib.parse import urlsplit, parse_qs
+import re
+
+# /maps/org/<slug>/<id>/, /maps/org/<id>/, /maps/213/moscow/org/<slug>/<id>/
+ORG_PATH_RE = re.compile(r'/maps/(?:[^?#]*?/)?org/(?:([^/?#]+)/)?(\d{5,})')
+
+# Вкладки карточки и их «глубокие» пути
+TAB_PATHS = {
+    'reviews': 'reviews',
+    'photos': 'gallery',
+    'news': 'posts',
+    'features': 'features',
+    'products': 'prices',
+}
+
+
+def extract_org_id(url: str) -> str | None:
+    """Возвращает id организации из ссылки на карточку (путь /org/... или параметр oid)"""
+    if not url:
+        return None
+    parts = urlsplit(url.strip())
+    match = ORG_PATH_RE.search(parts.path)
+    if match:
+        return match.group(2)
+    oid = parse_qs(parts.query).get('oid')
+    if oid and oid[0].isdigit():
+        return oid[0]
+    return None
+
+
+def normalize_card_url(url: str) -> str:
+    """
+    Приводит ссылку на карточку к виду https://<host>/maps/org/<slug>/<id>/ без параметров
+    ll, z и т.п. Если id организации не найден, возвращает ссылку без query и fragment.
+    """
+    url = (url or '').strip()
+    parts = urlsplit(url)
+    host = (parts.netloc or 'yandex.ru').lower()
+    match = ORG_PATH_RE.search(parts.path)
+    if match:
+        slug, org_id = match.group(1), match.group(2)
+        path = f"/maps/org/{slug}/{org_id}/" if slug else f"/maps/org/{org_id}/"
+        return f"https://{host}{path}"
+    org_id = extract_org_id(url)
+    if org_id:
+        return f"https://{host}/maps/org/{org_id}/"
+    return f"{parts.scheme or 'https'}://{host}{parts.path}"
+
+
+def tab_url(url: str, tab: str) -> str | None:
+    """Ссылка на вкладку карточки (reviews, photos, news, features, products) или None"""
+    if tab not in TAB_PATHS or not extract_org_id(url):
+        return None
+    return normalize_card_url(url) + TAB_PATHS[tab] + '/'